@@ -0,0 +1,59 @@
+""" Own the Inky panel in a process of its own, showing the latest frame the display writes to
+ the shared frame buffer (set driverProcess = true in config.ini)
+
+    python display-driver.py                    detect the panel and wait for frames
+    python display-driver.py --panel impression-5.7
+
+The renderer only writes frames into shared memory, so it never waits on the ~40 second
+refresh, and a renderer that crashes cannot leave the SPI bus wedged. The driver runs at a
+lower priority than the renderer; a refresh stuck past --deadline exits with status 1, for the
+service manager to restart the driver (e.g. Restart=always in a systemd unit).
+"""
+import argparse                         # for the command line options
+import asyncio                          # for polling the buffer while a refresh runs
+import logging                          # for the driver log output
+import os                               # for lowering the driver's priority
+import sys                              # for the exit status
+import types                            # for the minimal output object the modules expect
+
+import modules.framebuffer as framebuffer   # for the shared frame buffer
+import modules.display as display           # for the panel
+import modules.panels as panels             # for the panel profiles
+import modules.watchdog as watchdog         # for the stuck refresh
+
+parser = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--panel', default='auto', choices=['auto', *panels.PROFILES],
+                    help="the panel, or auto to detect it")
+parser.add_argument('--name', default=framebuffer.FRAME_BUFFER_NAME,
+                    help="the name of the shared frame buffer")
+parser.add_argument('--poll-seconds', type=float, default=1.0,
+                    help="how often to check for a new frame")
+parser.add_argument('--deadline', type=float, default=600,
+                    help="seconds a refresh may take before the driver counts it as stuck")
+parser.add_argument('--nice', type=int, default=10,
+                    help="how much to lower the driver's priority below the renderer's")
+args = parser.parse_args()
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s: %(message)s')
+out = types.SimpleNamespace(logger=logging.getLogger('display-driver'))
+
+if args.nice:
+    os.nice(args.nice)
+
+sink = display.InkySink(panels.get_profile(args.panel), preview=False)
+buffer = framebuffer.FrameBuffer.create(sink.resolution, args.name)
+out.logger.info("Driving a %dx%d panel from the frame buffer %s",
+                *buffer.resolution, args.name)
+
+exit_code = 0
+try:
+    asyncio.run(framebuffer.drive_panel(buffer, sink, out, args.poll_seconds, args.deadline))
+except watchdog.StageTimeout as error:
+    out.logger.critical("%s", error)
+    exit_code = 1
+except (asyncio.CancelledError, KeyboardInterrupt):
+    out.logger.info("Stopped")
+finally:
+    buffer.close()
+sys.exit(exit_code)
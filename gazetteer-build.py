@@ -0,0 +1,37 @@
+""" Build the gazetteer file the offline geocoder reads, from the bundled list of cities
+
+    python gazetteer-build.py                         rebuild gazetteer/cities.bin
+    python gazetteer-build.py --geonames cities15000.txt
+                                                      build it from a GeoNames dump instead
+"""
+import argparse                         # for the command line options
+import time                             # for timing the build and the lookups
+
+import modules.geocoder as geocoder     # for reading the sources and writing the file
+
+parser = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--geonames', help="a GeoNames cities dump to build from")
+parser.add_argument('--min-population', type=int, default=0,
+                    help="leave out GeoNames places smaller than this")
+parser.add_argument('--output', default=geocoder.GAZETTEER_FILE, help="the file to write")
+args = parser.parse_args()
+
+start = time.perf_counter()
+if args.geonames:
+    entries = geocoder.read_geonames(args.geonames, args.min_population)
+else:
+    entries = geocoder.read_source()
+places, keys = geocoder.build(entries, args.output)
+print(f"Wrote {places} places and {keys} names to {args.output} "
+      f"in {time.perf_counter() - start:.2f} s")
+
+gazetteer = geocoder.Gazetteer(args.output)
+start = time.perf_counter()
+place = gazetteer.lookup("Boston, MA")
+lookup_seconds = time.perf_counter() - start
+start = time.perf_counter()
+gazetteer.nearest(42.35, -71.06, 25)
+nearest_seconds = time.perf_counter() - start
+print(f"Boston, MA -> {place} in {lookup_seconds * 1e6:.0f} us; "
+      f"nearest place in {nearest_seconds * 1e6:.0f} us")
@@ -0,0 +1,174 @@
+""" Renders the compact 48-hour temperature sparkline and precipitation bar chart
+ that sits in each city panel, and the next-hour precipitation strip that replaces it
+ while a nowcast is active """
+
+import hashlib              # for keying the chart cache on the input series
+import numpy as np          # for computing the polyline and bar coordinates
+from PIL import Image,ImageDraw
+                            # for rendering via PIL `pip3 install pillow`
+import modules.metrics as metrics
+                            # for counting cache hits
+
+CHART_CACHE_SIZE = 8        # two cities, a few renders' worth of history
+NOWCAST_FULL_SCALE = 8.0    # mm/h that fills the strip's height: heavy rain
+NOWCAST_TICK_MINUTES = 15   # minutes between the strip's baseline ticks
+
+_chart_cache = {}
+
+def clear_cache():
+    """ Drop every cached chart, e.g. when the layout changes """
+    _chart_cache.clear()
+
+def chart_key(temps, pops, size, line_color, bar_color):
+    """ Hash the chart inputs, so an unchanged forecast reuses the cached image
+
+    Args:
+        temps (ndarray): The hourly temperatures.
+        pops (ndarray): The hourly probabilities of precipitation (0-1).
+        size (tuple): The (width, height) of the chart.
+        line_color (str): The colour of the temperature line.
+        bar_color (str): The colour of the precipitation bars.
+
+    Returns:
+        str: A hex digest identifying the chart.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(temps.tobytes())
+    digest.update(pops.tobytes())
+    digest.update(f"{size}|{line_color}|{bar_color}".encode())
+    return digest.hexdigest()
+
+def sparkline_coords(values, width, height, padding=2):
+    """ Scale a series onto the chart box, returning a flat [x0, y0, x1, y1, ...] list
+
+    A flat series is drawn through the vertical middle of the box.
+    """
+    x_coords = np.linspace(padding, width - 1 - padding, len(values))
+    low, high = values.min(), values.max()
+    span = high - low
+    if span:
+        scaled = (values - low) / span
+    else:
+        scaled = np.full(len(values), 0.5)
+    y_coords = (height - 1 - padding) - scaled * (height - 1 - 2 * padding)
+    return np.column_stack((x_coords, y_coords)).ravel().tolist()
+
+def bar_polygon(values, width, height):
+    """ Build one stepped outline covering every bar, so the bars are a single polygon fill
+
+    Args:
+        values (ndarray): The bar heights as fractions of the chart height (0-1).
+        width (int): The chart width.
+        height (int): The chart height.
+
+    Returns:
+        list: A flat [x0, y0, x1, y1, ...] list of polygon vertices.
+    """
+    edges = np.linspace(0, width - 1, len(values) + 1)
+    tops = (height - 1) - np.clip(values, 0, 1) * (height - 1)
+    # Each bar contributes its top-left and top-right corner; the baseline closes the shape
+    x_coords = np.repeat(edges, 2)[1:-1]
+    y_coords = np.repeat(tops, 2)
+    x_coords = np.concatenate(([0], x_coords, [width - 1]))
+    y_coords = np.concatenate(([height - 1], y_coords, [height - 1]))
+    return np.column_stack((x_coords, y_coords)).ravel().tolist()
+
+def hourly_series(hourly):
+    """ Gather the series the hourly chart is drawn from
+
+    Parameters:
+    hourly (list): The HourlyWeather objects, normally 48 of them.
+
+    Returns:
+    tuple: The temperatures and the probabilities of precipitation (0-1), as arrays. An hour
+           without a temperature is drawn between its neighbours, and both arrays are empty
+           if no hour has one.
+    """
+    temps = np.fromiter((np.nan if hour.temp is None else hour.temp for hour in hourly),
+                        dtype=float, count=len(hourly))
+    pops = np.fromiter((hour.pop_raw for hour in hourly), dtype=float, count=len(hourly))
+    known = ~np.isnan(temps)
+    if not known.any():
+        return temps[:0], pops[:0]
+    if not known.all():
+        hours = np.arange(len(temps))
+        temps = np.interp(hours, hours[known], temps[known])
+    return temps, pops
+
+def render_chart(temps, pops, size, line_color='red', bar_color='lightskyblue'):
+    """
+    Render the hourly temperature sparkline over the precipitation bars.
+
+    Parameters:
+    temps (ndarray): The hourly temperatures; must not be empty.
+    pops (ndarray): The hourly probabilities of precipitation (0-1).
+    size (tuple): The (width, height) of the chart in pixels.
+    line_color (str, optional): The colour of the temperature line.
+    bar_color (str, optional): The colour of the precipitation bars.
+
+    Returns:
+    Image: The chart image.
+    """
+    key = chart_key(temps, pops, size, line_color, bar_color)
+    chart = _chart_cache.get(key)
+    if chart is not None:
+        metrics.increment('cache_hits', cache='chart')
+        return chart
+    metrics.increment('cache_misses', cache='chart')
+
+    width, height = size
+    chart = Image.new('RGB', size, "white")
+    draw = ImageDraw.Draw(chart)
+
+    if pops.any():
+        draw.polygon(bar_polygon(pops, width, height), fill=bar_color)
+    draw.line([(0, height - 1), (width - 1, height - 1)], fill='black')
+    draw.line(sparkline_coords(temps, width, height), fill=line_color, width=2, joint='curve')
+
+    if len(_chart_cache) >= CHART_CACHE_SIZE:
+        _chart_cache.clear()
+    _chart_cache[key] = chart
+    return chart
+
+def render_precipitation_strip(precipitation, size, bar_color='blue'):
+    """
+    Render the next hour's precipitation, a bar a minute, with a baseline tick every
+    NOWCAST_TICK_MINUTES.
+
+    Intensity is drawn on a square-root scale up to NOWCAST_FULL_SCALE, so drizzle is still
+    visible next to a downpour.
+
+    Parameters:
+    precipitation (ndarray): A nowcast's float32 series of mm/h; must not be empty.
+    size (tuple): The (width, height) of the strip in pixels.
+    bar_color (str, optional): The colour of the precipitation bars.
+
+    Returns:
+    Image: The strip image.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(precipitation.tobytes())
+    digest.update(f"nowcast|{size}|{bar_color}".encode())
+    key = digest.hexdigest()
+    strip = _chart_cache.get(key)
+    if strip is not None:
+        metrics.increment('cache_hits', cache='chart')
+        return strip
+    metrics.increment('cache_misses', cache='chart')
+
+    width, height = size
+    strip = Image.new('RGB', size, "white")
+    draw = ImageDraw.Draw(strip)
+
+    if precipitation.any():
+        heights = np.sqrt(np.clip(precipitation, 0, None) / NOWCAST_FULL_SCALE)
+        draw.polygon(bar_polygon(heights, width, height), fill=bar_color)
+    draw.line([(0, height - 1), (width - 1, height - 1)], fill='black')
+    for minute in range(0, len(precipitation) + 1, NOWCAST_TICK_MINUTES):
+        x_position = round(minute / len(precipitation) * (width - 1))
+        draw.line([(x_position, height - 4), (x_position, height - 1)], fill='black')
+
+    if len(_chart_cache) >= CHART_CACHE_SIZE:
+        _chart_cache.clear()
+    _chart_cache[key] = strip
+    return strip
@@ -0,0 +1,92 @@
+""" Temperature colour themes, precomputed into lookup tables of resolved RGB colours
+ so the renderer never walks the bands or resolves colour names while drawing """
+
+from PIL import ImageColor  # for resolving colour names once, up front
+
+ICON_NONE = 'thermometer'
+ICON_COLD = 'thermometer_low'
+ICON_MODERATE = 'thermometer_half'
+ICON_HOT = 'thermometer_high'
+ICON_NOPE = 'thermometer_full'
+
+# Each band is (highest temperature in the band, fill colour, outline colour, icon name);
+# the last band catches everything above the previous one
+THEMES = {
+    'fahrenheit': {
+        'range': (-80, 140),
+        'bands': [
+            (39, 'powderblue', 'darkturquoise', ICON_COLD),
+            (49, 'lightblue', 'darkturquoise', ICON_COLD),
+            (59, 'lightskyblue', 'darkturquoise', ICON_MODERATE),
+            (69, 'cornflowerblue', 'darkturquoise', ICON_MODERATE),
+            (79, 'goldenrod', 'black', ICON_MODERATE),
+            (89, 'hotpink', 'maroon', ICON_HOT),
+            (99, 'lightcoral', 'maroon', ICON_HOT),
+            (109, 'firebrick', 'maroon', ICON_NOPE),
+            (None, 'floralwhite', 'firebrick', ICON_NOPE),
+        ],
+    },
+    'celsius': {
+        'range': (-60, 60),
+        'bands': [
+            (3, 'powderblue', 'darkturquoise', ICON_COLD),
+            (9, 'lightblue', 'darkturquoise', ICON_COLD),
+            (15, 'lightskyblue', 'darkturquoise', ICON_MODERATE),
+            (20, 'cornflowerblue', 'darkturquoise', ICON_MODERATE),
+            (26, 'goldenrod', 'black', ICON_MODERATE),
+            (32, 'hotpink', 'maroon', ICON_HOT),
+            (37, 'lightcoral', 'maroon', ICON_HOT),
+            (43, 'firebrick', 'maroon', ICON_NOPE),
+            (None, 'floralwhite', 'firebrick', ICON_NOPE),
+        ],
+    },
+}
+
+_tables = {}
+
+class TempColor:
+    """ Custom object to store the resolved colours and icon for one temperature band """
+    def __init__(self, fill, outline, icon):
+        self.fill = ImageColor.getrgb(fill)
+        self.outline = ImageColor.getrgb(outline)
+        self.icon = icon
+
+# The entry for a missing temperature, in every theme: a plain black thermometer
+NO_TEMP = TempColor('black', 'black', ICON_NONE)
+
+class TempColorTable:
+    """ Lookup table from integer temperature to TempColor, clamped to the theme's range """
+    def __init__(self, theme):
+        self.low, self.high = theme['range']
+        bands = [TempColor(fill, outline, icon) for ceiling, fill, outline, icon in theme['bands']]
+        ceilings = [ceiling for ceiling, fill, outline, icon in theme['bands']]
+
+        self.entries = []
+        band = 0
+        for temp in range(self.low, self.high + 1):
+            while ceilings[band] is not None and temp > ceilings[band]:
+                band += 1
+            self.entries.append(bands[band])
+
+    def lookup(self, temp):
+        """ Return the TempColor for an integer temperature, clamping out-of-range values;
+        a missing temperature (None) gets NO_TEMP """
+        if temp is None:
+            return NO_TEMP
+        index = min(max(temp, self.low), self.high) - self.low
+        return self.entries[index]
+
+def get_table(theme_name='fahrenheit'):
+    """ Return the lookup table for a theme, building it on first use
+
+    Args:
+        theme_name (str, optional): A key of THEMES. Defaults to 'fahrenheit'.
+
+    Raises:
+        KeyError: If the theme is not defined.
+    """
+    table = _tables.get(theme_name)
+    if table is None:
+        table = TempColorTable(THEMES[theme_name])
+        _tables[theme_name] = table
+    return table
@@ -0,0 +1,112 @@
+""" Output sinks for finished frames: the Inky e-ink panel, the shared frame buffer of a
+ separate display driver process, or a headless sink that keeps frames in memory (and
+ optionally on disk) for tests and tooling """
+
+import modules.panels as panels
+                            # for the resolution frames are drawn at
+import modules.framebuffer as framebuffer
+                            # for handing frames to the display driver process
+
+class InkySink:
+    """ Sends frames to the Inky display
+
+    Args:
+        profile (PanelProfile, optional): The panel. Defaults to detecting it on first use.
+    """
+    def __init__(self, profile=None, saturation=1, preview=True):
+        self.profile = profile
+        self.saturation = saturation
+        self.preview = preview
+        self.inky = None
+
+    def _connect(self):
+        if self.inky is None:
+            # Imported here so that headless rendering works on machines without a panel
+            from inky.auto import auto  # `pip3 install inky[rpi,example-depends]`
+            self.inky = auto(ask_user=True, verbose=True)
+            if self.profile is None:
+                self.profile = panels.profile_for_resolution(self.inky.resolution)
+        return self.inky
+
+    @property
+    def resolution(self):
+        """ The size frames must be drawn at, detecting the panel if no profile was given """
+        if self.profile is None:
+            self._connect()
+        return tuple(self.profile.resolution)
+
+    def show(self, image):
+        """ Save a copy of the frame, then push it to the panel (blocks for the refresh) """
+        inky = self._connect()
+        if image.size != tuple(inky.resolution):
+            raise ValueError(f"Frame is {image.size[0]}x{image.size[1]} but the panel is "
+                             f"{inky.resolution[0]}x{inky.resolution[1]}; check the panel setting")
+
+        image.save("pil-text.png", "PNG")
+
+        inky.set_image(image, saturation=self.saturation)
+        if self.preview:
+            image.show()
+        inky.show()
+
+    def show_indices(self, frame):
+        """ Push a frame that is already in the panel's ink indices (a height x width array,
+        see framebuffer.ink_indices) to the panel, without converting an image """
+        inky = self._connect()
+        if frame.shape != (inky.height, inky.width):
+            raise ValueError(f"Frame is {frame.shape[1]}x{frame.shape[0]} but the panel is "
+                             f"{inky.width}x{inky.height}")
+        inky.buf = frame
+        inky.show()
+
+class SharedFrameSink:
+    """ Hands frames to display-driver.py, the process that owns the panel, through the
+    shared frame buffer; showing a frame takes milliseconds, and the driver refreshes the
+    panel with the latest one in its own time
+
+    The panel is the one the driver detected, so it is known once the driver has run, and
+    the buffer is mapped again when a driver restarts for another panel.
+    """
+    def __init__(self, name=framebuffer.FRAME_BUFFER_NAME):
+        self.name = name
+        self.buffer = None
+        self.profile = None
+
+    def _attach(self):
+        if self.buffer is not None and self.buffer.retired():
+            self.buffer.close()
+            self.buffer = None
+        if self.buffer is None:
+            self.buffer = framebuffer.FrameBuffer.attach(self.name)
+            self.profile = panels.profile_for_resolution(self.buffer.resolution)
+        return self.buffer
+
+    @property
+    def resolution(self):
+        """ The size frames must be drawn at: the resolution of the driver's panel """
+        return tuple(self._attach().resolution)
+
+    def show(self, image):
+        """ Write the frame into the buffer in the panel's inks, for the driver to pick up """
+        buffer = self._attach()
+        buffer.write(framebuffer.ink_indices(image, self.profile.palette))
+
+class HeadlessSink:
+    """ Keeps the last frame in memory instead of driving a panel """
+    def __init__(self, path=None, profile=panels.DEFAULT_PROFILE):
+        self.path = path
+        self.profile = profile
+        self.frame = None
+        self.frames_shown = 0
+
+    @property
+    def resolution(self):
+        """ The size frames must be drawn at """
+        return tuple(self.profile.resolution)
+
+    def show(self, image):
+        """ Store the frame, and write it as a PNG when the sink was given a path """
+        self.frame = image
+        self.frames_shown += 1
+        if self.path:
+            image.save(self.path, "PNG")
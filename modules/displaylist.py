@@ -0,0 +1,194 @@
+""" Display lists: the layout pass records a frame as plain draw ops (with its fonts, positions
+ and colours resolved), and the rasterizer replays them onto a PIL canvas """
+
+import json                 # for serializing display lists
+import hashlib              # for keying caches on a display list
+import functools            # for caching the fonts and images the rasterizer loads
+import numpy as np          # for the chart series
+from PIL import Image,ImageDraw,ImageFont,ImageOps,ImageColor
+                            # for rendering via PIL `pip3 install pillow`
+import modules.chart as chart
+                            # for the hourly chart and the nowcast strip
+
+class DisplayList:
+    """
+    Custom object to record drawing as a list of draw ops, with the subset of the
+    ImageDraw and Image API the layout pass uses.
+
+    Every op is a tuple of plain values, so a display list can be compared with the
+    previous frame's, hashed for a cache key, written out as JSON and rasterized on another
+    machine (given the same fonts and icons):
+
+        ('text', (x, y), text, fill, font, stroke_width, stroke_fill)
+        ('rectangle', (x0, y0, x1, y1), fill, outline)
+        ('paste', image, (x, y), masked)
+
+    A font is (path, size, index, encoding), and an image is a spec that load_image turns
+    into the image, e.g. ('icon', path, size, recolour).
+
+    Rasterized with a palette, the frame is a 'P' image of the panel's inks, a third of the
+    size of an RGB frame: text and rectangles are drawn in the ink nearest their colour
+    (and text is not anti-aliased), and images are dithered in the inks, as the panel
+    would dither an RGB frame.
+    """
+    def __init__(self, size, ops=None):
+        self.size = tuple(size)
+        self.ops = ops if ops is not None else []
+
+    def text(self, xy, text, fill=None, font=None, stroke_width=0, stroke_fill=None):
+        """ Record ImageDraw.text """
+        self.ops.append(('text', tuple(xy), text, fill, font_spec(font), stroke_width,
+                         stroke_fill))
+
+    def rectangle(self, box, fill=None, outline=None):
+        """ Record ImageDraw.rectangle """
+        self.ops.append(('rectangle', tuple(box), fill, outline))
+
+    def paste(self, image, xy, masked=False):
+        """ Record pasting an image spec, through its own alpha if masked """
+        self.ops.append(('paste', image, tuple(xy), masked))
+
+    def digest(self):
+        """ Hash the ops, e.g. to cache the rasterized layer """
+        return hashlib.blake2b(self.to_json().encode(), digest_size=16).hexdigest()
+
+    def diff(self, other):
+        """ Return the ops that are not in another display list, e.g. the previous frame's """
+        previous = set(other.ops)
+        return [op for op in self.ops if op not in previous]
+
+    def to_json(self):
+        """ Serialize the display list """
+        return json.dumps({'size': self.size, 'ops': self.ops}, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, text):
+        """ Load a serialized display list; JSON arrays come back as tuples """
+        data = json.loads(text)
+        return cls(data['size'], [as_tuple(op) for op in data['ops']])
+
+    def rasterize(self, canvas=None, palette=None):
+        """ Replay the ops onto a canvas, by default a new white one, and return it
+
+        A 'P' canvas (see new_canvas) is drawn in its own inks.
+        """
+        if canvas is None:
+            canvas = new_canvas(self.size, palette)
+        inks = canvas_inks(canvas) if canvas.mode == 'P' else None
+        ink = (lambda colour: ink_index(colour, inks)) if inks else (lambda colour: colour)
+        draw = ImageDraw.Draw(canvas)
+        for op in self.ops:
+            if op[0] == 'text':
+                kind, xy, text, fill, font, stroke_width, stroke_fill = op
+                draw.text(xy, text, ink(fill), load_font(*font), stroke_width=stroke_width,
+                          stroke_fill=ink(stroke_fill))
+            elif op[0] == 'rectangle':
+                kind, box, fill, outline = op
+                draw.rectangle(box, fill=ink(fill), outline=ink(outline))
+            elif op[0] == 'paste':
+                kind, spec, xy, masked = op
+                if inks:
+                    image, mask = load_paletted(spec, inks)
+                else:
+                    image = mask = load_image(spec)
+                canvas.paste(image, xy, mask if masked else None)
+            else:
+                raise ValueError(f"Unknown draw op {op[0]!r}")
+        return canvas
+
+def new_canvas(size, palette=None):
+    """ Return a blank white canvas: RGB, or 'P' with the palette's inks as its colours """
+    if palette is None:
+        return Image.new('RGB', size, "white")
+    canvas = Image.new('P', size)
+    canvas.putpalette([channel for colour in palette for channel in colour])
+    canvas.paste(ink_index("white", tuple(palette)), (0, 0, *size))
+    return canvas
+
+def canvas_inks(canvas):
+    """ The colours of a 'P' canvas, as a tuple of RGB tuples """
+    values = canvas.getpalette()
+    return tuple(tuple(values[index:index + 3]) for index in range(0, len(values), 3))
+
+@functools.lru_cache(maxsize=256)
+def ink_index(colour, inks):
+    """ Return the index of the ink nearest a colour (a name or an RGB tuple), or None """
+    if colour is None:
+        return None
+    rgb = ImageColor.getrgb(colour) if isinstance(colour, str) else tuple(colour)
+    return min(range(len(inks)), key=lambda index: sum(
+        (channel - ink) ** 2 for channel, ink in zip(rgb[:3], inks[index])))
+
+def as_tuple(value):
+    """ Turn the lists of a decoded JSON value back into tuples, recursively """
+    if isinstance(value, list):
+        return tuple(as_tuple(item) for item in value)
+    return value
+
+def font_spec(font):
+    """ Describe a FreeType font by what it was loaded from """
+    if font is None:
+        return None
+    return font.path, font.size, font.index, font.encoding
+
+@functools.lru_cache(maxsize=64)
+def load_font(path, size, index=0, encoding=""):
+    """ Load a font for the rasterizer, once per process """
+    return ImageFont.truetype(path, size, index, encoding)
+
+@functools.lru_cache(maxsize=64)
+def load_image(spec):
+    """
+    Build the image an image spec describes, once per process:
+
+        ('icon', path, (width, height), colour): an icon file, resized band by band (since
+            resizing RGBA premultiplies the alpha and would turn the transparent background
+            black) if the size differs, and recoloured from black to colour unless None.
+        ('alert_icon', path, size): a square warning icon with its alpha, for a masked paste.
+        ('hourly_chart', temps, pops, (width, height)): see chart.render_chart.
+        ('nowcast_strip', precipitation, (width, height)): see chart.render_precipitation_strip.
+
+    The returned image is shared, so it must not be drawn on; release_images drops them.
+    """
+    kind = spec[0]
+    if kind == 'icon':
+        kind, path, size, colour = spec
+        img = Image.open(path)
+        if img.size != size:
+            img = Image.merge(img.mode, [band.resize(size, Image.LANCZOS)
+                                         for band in img.split()])
+        if colour is not None:
+            img = ImageOps.colorize(img.convert('L'), black=colour, white="white")
+        return img
+    if kind == 'alert_icon':
+        kind, path, size = spec
+        return Image.open(path).convert('RGBA').resize((size, size))
+    if kind == 'hourly_chart':
+        kind, temps, pops, size = spec
+        return chart.render_chart(np.array(temps), np.array(pops), size)
+    if kind == 'nowcast_strip':
+        kind, precipitation, size = spec
+        return chart.render_precipitation_strip(np.array(precipitation, dtype=np.float32), size)
+    raise ValueError(f"Unknown image spec {kind!r}")
+
+@functools.lru_cache(maxsize=64)
+def load_paletted(spec, inks):
+    """
+    Build an image spec (see load_image) dithered in a palette's inks, for a 'P' canvas.
+    Returns the image and a 1-bit mask of its alpha (None without one), since a
+    soft mask would blend palette indices rather than colours.
+    """
+    image = load_image(spec)
+    mask = None
+    if 'A' in image.getbands():
+        mask = image.getchannel('A').point(lambda alpha: 255 if alpha >= 128 else 0).convert('1')
+    palette_image = Image.new('P', (1, 1))
+    palette_image.putpalette([channel for colour in inks for channel in colour])
+    return (image.convert('RGB').quantize(palette=palette_image,
+                                          dither=Image.Dither.FLOYDSTEINBERG), mask)
+
+def release_images():
+    """ Drop the images the rasterizer has built, e.g. after each frame on a low-memory
+    device; fonts are kept, since every frame uses the same ones """
+    load_paletted.cache_clear()
+    load_image.cache_clear()
@@ -0,0 +1,214 @@
+""" The shared-memory frame buffer between the renderer and display-driver.py: the renderer
+ writes each finished frame in the panel's packed format, and the driver process, which owns
+ the Inky device, pulls the latest one and pushes it over SPI """
+
+import struct               # for the buffer header
+import zlib                 # for the frame checksum
+import signal               # for stopping the driver cleanly on SIGTERM
+import asyncio              # for polling the buffer while a refresh runs
+import sys                  # for the Python version, which decides how blocks are tracked
+from multiprocessing import shared_memory, resource_tracker
+                            # for the buffer both processes map
+import numpy as np          # for packing and unpacking the frame in place
+from PIL import Image       # for dithering RGB frames in the panel's inks
+
+import modules.displaylist as displaylist
+                            # for the inks of a palette frame
+import modules.watchdog as watchdog
+                            # for the refresh deadline
+
+FRAME_BUFFER_NAME = 'inky_weather_frame'
+
+# The header is followed by the frame: a panel's ink index per pixel, four bits each, two
+# pixels a byte with the left one in the high nibble, row by row (the Inky drivers' format).
+# The writer makes the sequence odd while it writes and even again when the frame and its
+# checksum are complete, so a reader can tell a finished frame from one being written, or
+# left half written by a renderer that crashed
+MAGIC = b'INKF'
+HEADER = struct.Struct('<4sHHQQI4x')    # magic, width, height, sequence, shown, checksum
+SEQUENCE = struct.Struct('<Q')
+SEQUENCE_OFFSET = 8
+SHOWN_OFFSET = 16
+CHECKSUM = struct.Struct('<I')
+CHECKSUM_OFFSET = 24
+
+def open_shared(name, create=False, size=0):
+    """ Map a shared memory block that outlives the process: neither side unlinks the buffer
+    when it exits, so the renderer and the driver can each restart without the other """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, create, size, track=False)
+    # Before Python 3.13 every process that maps the block registers it, to be unlinked when
+    # that process exits. The tracker knows it by its POSIX name, which has a leading slash
+    memory = shared_memory.SharedMemory(name, create, size)
+    resource_tracker.unregister(f"/{memory.name}", 'shared_memory')
+    return memory
+
+def unlink_shared(name):
+    """ Remove a block by name. It is mapped again with tracking on, so that unlink finds it
+    registered with the resource tracker (open_shared leaves it unregistered) """
+    memory = shared_memory.SharedMemory(name)
+    memory.close()
+    memory.unlink()
+
+def ink_indices(image, palette):
+    """
+    Convert a frame to the panel's ink indices: a palette frame drawn in the panel's inks
+    (see lowMemory) is used as it is, and any other is dithered in the inks, as the Inky
+    driver would dither it.
+
+    Returns:
+        ndarray: The ink index of each pixel, height x width.
+    """
+    inks = tuple(tuple(ink) for ink in palette)
+    if image.mode == 'P' and displaylist.canvas_inks(image)[:len(inks)] == inks:
+        return np.asarray(image)
+    palette_image = Image.new('P', (1, 1))
+    palette_image.putpalette([channel for ink in inks for channel in ink])
+    return np.asarray(image.convert('RGB').quantize(palette=palette_image,
+                                                    dither=Image.Dither.FLOYDSTEINBERG))
+
+class FrameBuffer:
+    """
+    Custom object to read and write the shared frame buffer. The renderer packs each frame
+    straight into the shared memory and the driver unpacks it straight into the panel's
+    buffer, so a frame is never encoded, decoded or copied in between.
+
+    There is one writer (the renderer) and one reader (the driver); the sequence and the
+    checksum are enough to keep them apart without a lock between the processes.
+    """
+    def __init__(self, memory):
+        self.memory = memory
+        magic, width, height, sequence, shown, checksum = HEADER.unpack_from(memory.buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{memory.name} is not a frame buffer")
+        self.resolution = (width, height)
+        self.data = np.ndarray((height, width // 2), np.uint8, memory.buf, HEADER.size)
+
+    @classmethod
+    def create(cls, resolution, name=FRAME_BUFFER_NAME):
+        """ Create the buffer for a panel, on the driver's side, or keep the one an earlier
+        driver left if it is for the same panel (with the frame it holds); a buffer for
+        another panel is retired, so that a renderer still mapping it attaches again """
+        width, height = resolution
+        if width % 2:
+            raise ValueError(f"A {width} pixel wide panel cannot be packed two pixels a byte")
+        size = HEADER.size + width * height // 2
+        try:
+            memory = open_shared(name)
+            if (memory.size >= size and bytes(memory.buf[:4]) == MAGIC
+                    and HEADER.unpack_from(memory.buf, 0)[1:3] == (width, height)):
+                return cls(memory)
+            if memory.size >= len(MAGIC):
+                memory.buf[:len(MAGIC)] = bytes(len(MAGIC))
+            memory.close()
+            unlink_shared(name)
+        except FileNotFoundError:
+            pass
+        memory = open_shared(name, create=True, size=size)
+        HEADER.pack_into(memory.buf, 0, MAGIC, width, height, 0, 0, 0)
+        return cls(memory)
+
+    @classmethod
+    def attach(cls, name=FRAME_BUFFER_NAME):
+        """ Map the buffer the driver created, on the renderer's side
+
+        Raises:
+            FileNotFoundError: If there is no buffer, i.e. the driver has never run.
+        """
+        try:
+            return cls(open_shared(name))
+        except FileNotFoundError:
+            raise FileNotFoundError(f"No frame buffer {name!r}; is display-driver.py "
+                                    f"running?") from None
+
+    def retired(self):
+        """ Whether the driver has replaced the buffer, e.g. on starting for another panel,
+        so that this mapping is no longer the one it reads """
+        magic, width, height = HEADER.unpack_from(self.memory.buf, 0)[:3]
+        return magic != MAGIC or (width, height) != self.resolution
+
+    def sequence(self):
+        """ The number of the latest frame; odd while a frame is being written """
+        return SEQUENCE.unpack_from(self.memory.buf, SEQUENCE_OFFSET)[0]
+
+    def shown(self):
+        """ The number of the last frame the driver pushed to the panel """
+        return SEQUENCE.unpack_from(self.memory.buf, SHOWN_OFFSET)[0]
+
+    def write(self, indices):
+        """
+        Pack a frame of ink indices (see ink_indices) into the buffer.
+
+        Returns:
+            int: The frame's sequence number.
+        """
+        if indices.shape != self.resolution[::-1]:
+            raise ValueError(f"Frame is {indices.shape[1]}x{indices.shape[0]} but the panel is "
+                             f"{self.resolution[0]}x{self.resolution[1]}")
+        # Odd whatever state a crashed writer left it in
+        sequence = (self.sequence() + 1) | 1
+        SEQUENCE.pack_into(self.memory.buf, SEQUENCE_OFFSET, sequence)
+        np.left_shift(indices[:, 0::2], 4, out=self.data)
+        np.bitwise_or(self.data, indices[:, 1::2] & 0x0F, out=self.data)
+        CHECKSUM.pack_into(self.memory.buf, CHECKSUM_OFFSET, zlib.crc32(self.data))
+        SEQUENCE.pack_into(self.memory.buf, SEQUENCE_OFFSET, sequence + 1)
+        return sequence + 1
+
+    def read_into(self, frame):
+        """
+        Unpack the latest frame into an array of ink indices, height x width.
+
+        Returns:
+            int: The frame's sequence number, or None if there is no complete frame: none
+                 was written yet, one is being written (or was left half written), or it
+                 changed while it was read.
+        """
+        sequence = self.sequence()
+        if sequence == 0 or sequence % 2:
+            return None
+        checksum = CHECKSUM.unpack_from(self.memory.buf, CHECKSUM_OFFSET)[0]
+        if zlib.crc32(self.data) != checksum:
+            return None
+        np.right_shift(self.data, 4, out=frame[:, 0::2])
+        np.bitwise_and(self.data, 0x0F, out=frame[:, 1::2])
+        return sequence if self.sequence() == sequence else None
+
+    def mark_shown(self, sequence):
+        """ Record that the driver has pushed a frame to the panel """
+        SEQUENCE.pack_into(self.memory.buf, SHOWN_OFFSET, sequence)
+
+    def close(self):
+        """ Unmap the buffer, leaving it for the other process """
+        self.data = None
+        self.memory.close()
+
+async def drive_panel(buffer, sink, out, poll_seconds=1.0, deadline=600):
+    """
+    Push the latest frame in the buffer to the panel whenever there is a new one, as the
+    display driver process. Frames written during a refresh are skipped but the last, and
+    the frame the buffer holds is shown again when the driver (re)starts.
+
+    Args:
+        buffer (FrameBuffer): The buffer the renderer writes to.
+        sink (InkySink): The panel.
+        out: The output object.
+        poll_seconds (float, optional): How often to check for a new frame.
+        deadline (float, optional): How long a refresh may take before it counts as stuck.
+
+    Raises:
+        StageTimeout: If a refresh is stuck, e.g. on a hung SPI bus; only a new process can
+                      recover the device.
+    """
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+
+    width, height = buffer.resolution
+    frame = np.zeros((height, width), np.uint8)
+    shown = None
+    while True:
+        sequence = buffer.read_into(frame)
+        if sequence is not None and sequence != shown:
+            out.logger.info("Showing frame %d", sequence)
+            await watchdog.run_stage('refresh', deadline, sink.show_indices, frame)
+            buffer.mark_shown(sequence)
+            shown = sequence
+        await asyncio.sleep(poll_seconds)
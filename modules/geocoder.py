@@ -0,0 +1,293 @@
+""" Offline geocoding from the bundled gazetteer: city names to coordinates, and snapping
+ nearby coordinates together so that cities close to each other share one API call """
+
+import os                   # for the gazetteer path
+import mmap                 # for reading the gazetteer without loading it
+import struct               # for the gazetteer's binary records
+import math                 # for the distance between places
+import bisect               # for the binary search of the name index
+import unicodedata          # for matching names without their accents
+import csv                  # for reading the gazetteer sources
+import functools            # for opening the gazetteer once per process
+
+GAZETTEER_FILE = os.path.join('gazetteer', 'cities.bin')
+GAZETTEER_SOURCE = os.path.join('gazetteer', 'cities.tsv')
+EARTH_RADIUS_KM = 6371.0
+
+# The file is a header, the places (stored in the order of an implicit k-d tree over their
+# positions on the unit sphere), the name keys (sorted, pointing at places) and the strings
+MAGIC = b'GAZ1'
+HEADER = struct.Struct('<4sIII')        # magic, place count, key count, strings offset
+PLACE = struct.Struct('<ffIIH2x')       # lat, lon, population, label offset and length
+KEY = struct.Struct('<IIH2x')           # key offset, place index, key length
+
+class Place:
+    """ Custom object to store one gazetteer entry """
+    def __init__(self, name, admin, country, lat, lon, population=0):
+        self.name: str = name
+        self.admin: str = admin
+        self.country: str = country
+        self.lat: float = lat
+        self.lon: float = lon
+        self.population: int = population
+
+    def __repr__(self):
+        region = ", ".join(part for part in (self.admin, self.country) if part)
+        return f"Place({self.name}, {region}, {self.lat:.4f}, {self.lon:.4f})"
+
+def normalize(name):
+    """ Reduce a name to the form it is indexed by: unaccented, case-folded, without
+    apostrophes, and with any run of other punctuation and spaces as one space ('St. John's'
+    and 'st johns' both give 'st johns') """
+    decomposed = unicodedata.normalize('NFKD', name.replace("'", "").replace("\u2019", ""))
+    letters = "".join(char for char in decomposed if not unicodedata.combining(char))
+    words = "".join(char if char.isalnum() else " " for char in letters.casefold())
+    return " ".join(words.split())
+
+def unit_vector(lat, lon):
+    """ The position of a coordinate on the unit sphere, where straight-line distance grows
+    with great-circle distance, with no special case at the poles or the antimeridian """
+    lat, lon = math.radians(lat), math.radians(lon)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+def chord(kilometres):
+    """ The straight-line distance on the unit sphere of a great-circle distance """
+    return 2 * math.sin(min(kilometres / EARTH_RADIUS_KM, math.pi) / 2)
+
+def distance_km(lat_one, lon_one, lat_two, lon_two):
+    """ The great-circle distance between two coordinates """
+    gap = math.dist(unit_vector(lat_one, lon_one), unit_vector(lat_two, lon_two))
+    return 2 * EARTH_RADIUS_KM * math.asin(min(gap / 2, 1.0))
+
+class Gazetteer:
+    """
+    Custom object to look places up in a gazetteer file (see build), which is memory-mapped
+    rather than read, so it costs no memory until it is searched and is shared between
+    processes.
+
+    Names are found by a binary search of the sorted name index and positions by a search
+    of the implicit k-d tree the places are stored in; both take microseconds.
+    """
+    def __init__(self, path=GAZETTEER_FILE):
+        with open(path, 'rb') as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.place_count, self.key_count, self.strings_offset = \
+            HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a gazetteer file")
+        self.keys_offset = HEADER.size + self.place_count * PLACE.size
+
+    def __len__(self):
+        return self.place_count
+
+    def string(self, offset, length):
+        """ Read one string from the strings section """
+        start = self.strings_offset + offset
+        return self.data[start:start + length].decode('utf-8')
+
+    def position(self, index):
+        """ The coordinates of a place, without building the Place """
+        lat, lon, population, label_offset, label_length = \
+            PLACE.unpack_from(self.data, HEADER.size + index * PLACE.size)
+        return lat, lon
+
+    def place(self, index):
+        """ Build the Place at an index """
+        lat, lon, population, label_offset, label_length = \
+            PLACE.unpack_from(self.data, HEADER.size + index * PLACE.size)
+        name, admin, country = self.string(label_offset, label_length).split('\t')
+        return Place(name, admin, country, round(lat, 4), round(lon, 4), population)
+
+    def key(self, index):
+        """ The normalized name and place index of one entry of the name index """
+        key_offset, place_index, key_length = \
+            KEY.unpack_from(self.data, self.keys_offset + index * KEY.size)
+        start = self.strings_offset + key_offset
+        return self.data[start:start + key_length], place_index
+
+    def lookup(self, query):
+        """
+        Find a place by name, e.g. 'Boston', 'Portland, ME' or 'London, GB': anything after
+        a comma must match the place's state or province code, or its country code.
+
+        Returns:
+            Place: The most populous match, or None if no place matches.
+        """
+        name, *qualifiers = query.split(',')
+        wanted = normalize(name).encode('utf-8')
+        qualifiers = [qualifier.strip().upper() for qualifier in qualifiers if qualifier.strip()]
+
+        keys = KeyView(self)
+        index = bisect.bisect_left(keys, wanted)
+        # Places sharing a name are indexed most populous first
+        while index < self.key_count:
+            key, place_index = self.key(index)
+            if key != wanted:
+                break
+            place = self.place(place_index)
+            if all(qualifier in (place.admin.upper(), place.country.upper())
+                   for qualifier in qualifiers):
+                return place
+            index += 1
+        return None
+
+    def nearest(self, lat, lon, radius_km=None):
+        """
+        Find the place nearest a coordinate.
+
+        Args:
+            radius_km (float, optional): Only consider places within this distance.
+
+        Returns:
+            Place: The nearest place, or None if there is none within the radius.
+        """
+        target = unit_vector(lat, lon)
+        best = [None, chord(radius_km) ** 2 if radius_km is not None else math.inf]
+
+        # The tree is implicit: the middle of a range is its node, split on the axis of its
+        # depth. The nearer half is searched first, and the farther half only if the
+        # splitting plane is closer than the best place found by then
+        stack = [(0, self.place_count, 0, 0.0)]
+        while stack:
+            low, high, depth, plane_distance = stack.pop()
+            if low >= high or plane_distance >= best[1]:
+                continue
+            middle = (low + high) // 2
+            point = unit_vector(*self.position(middle))
+            distance = sum((a - b) ** 2 for a, b in zip(point, target))
+            if distance < best[1]:
+                best = [middle, distance]
+            offset = target[depth % 3] - point[depth % 3]
+            near, far = ((low, middle), (middle + 1, high)) if offset < 0 else \
+                ((middle + 1, high), (low, middle))
+            stack.append((*far, depth + 1, offset ** 2))
+            stack.append((*near, depth + 1, 0.0))
+
+        return self.place(best[0]) if best[0] is not None else None
+
+class KeyView:
+    """ The normalized names of a gazetteer's name index, as a sequence for bisect """
+    def __init__(self, gazetteer):
+        self.gazetteer = gazetteer
+
+    def __len__(self):
+        return self.gazetteer.key_count
+
+    def __getitem__(self, index):
+        return self.gazetteer.key(index)[0]
+
+@functools.lru_cache(maxsize=4)
+def open_gazetteer(path=GAZETTEER_FILE):
+    """ Open a gazetteer once per process
+
+    Raises:
+        OSError: If the file is missing or unreadable.
+    """
+    return Gazetteer(path)
+
+def snap(lat, lon, radius_km, gazetteer=None):
+    """
+    Move a coordinate onto the nearest gazetteer place within radius_km, so that coordinates
+    entered a little differently (or for neighbouring addresses) share a cache key.
+
+    Returns:
+        tuple: The place's (lat, lon), or the coordinate itself if no place is that close.
+    """
+    gazetteer = gazetteer or open_gazetteer()
+    place = gazetteer.nearest(lat, lon, radius_km) if radius_km > 0 else None
+    return (place.lat, place.lon) if place else (lat, lon)
+
+def merge_nearby(coordinates, radius_km):
+    """
+    Give coordinates that lie within radius_km of an earlier one the earlier one's value,
+    so that nearby cities share one API call.
+
+    Args:
+        coordinates (list): (lat, lon) pairs, in order of precedence.
+
+    Returns:
+        list: The (lat, lon) pair to use for each.
+    """
+    merged = []
+    for lat, lon in coordinates:
+        merged.append(next((kept for kept in merged
+                            if distance_km(lat, lon, *kept) <= radius_km), (lat, lon)))
+    return merged
+
+def read_source(path=GAZETTEER_SOURCE):
+    """ Read the bundled source list: name, admin1, country, latitude, longitude, population
+    and comma-separated aliases, tab separated with a header row """
+    with open(path, encoding='utf-8', newline='') as file:
+        for row in csv.DictReader(file, delimiter='\t', quoting=csv.QUOTE_NONE):
+            aliases = [alias for alias in (row.get('aliases') or '').split(',') if alias]
+            yield (Place(row['name'], row['admin1'], row['country'], float(row['latitude']),
+                         float(row['longitude']), int(row['population'] or 0)), aliases)
+
+def read_geonames(path, min_population=0):
+    """ Read a GeoNames dump (e.g. cities15000.txt from download.geonames.org/export/dump),
+    keeping the name and its ASCII form as the only aliases, to keep the file compact """
+    with open(path, encoding='utf-8', newline='') as file:
+        for row in csv.reader(file, delimiter='\t', quoting=csv.QUOTE_NONE):
+            population = int(row[14] or 0)
+            if population < min_population:
+                continue
+            yield (Place(row[1], row[10] if row[8] in ('US', 'CA', 'AU') else '', row[8],
+                         float(row[4]), float(row[5]), population), [row[2]])
+
+def build(entries, path=GAZETTEER_FILE):
+    """
+    Write a gazetteer file from (Place, aliases) pairs, e.g. from read_source.
+
+    Returns:
+        tuple: The number of places and of name keys written.
+    """
+    entries = list(entries)
+    places = [place for place, aliases in entries]
+    aliases = [aliases for place, aliases in entries]
+    order = kd_order(list(range(len(places))),
+                     [unit_vector(place.lat, place.lon) for place in places], 0)
+    position = {index: stored for stored, index in enumerate(order)}
+
+    strings = bytearray()
+    def add_string(text):
+        offset = len(strings)
+        strings.extend(text.encode('utf-8'))
+        return offset, len(strings) - offset
+
+    place_records = []
+    for index in order:
+        place = places[index]
+        label_offset, label_length = add_string(f"{place.name}\t{place.admin}\t{place.country}")
+        place_records.append(PLACE.pack(place.lat, place.lon, place.population, label_offset,
+                                        label_length))
+
+    keys = set()
+    for index, place in enumerate(places):
+        for name in [place.name] + aliases[index]:
+            if normalize(name):
+                keys.add((normalize(name).encode('utf-8'), -place.population, position[index]))
+    key_records = []
+    for key, population, stored in sorted(keys):
+        key_offset, key_length = add_string(key.decode('utf-8'))
+        key_records.append(KEY.pack(key_offset, stored, key_length))
+
+    strings_offset = HEADER.size + len(place_records) * PLACE.size + len(key_records) * KEY.size
+    temp_path = path + ".tmp"
+    with open(temp_path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, len(place_records), len(key_records), strings_offset))
+        file.writelines(place_records)
+        file.writelines(key_records)
+        file.write(strings)
+    os.replace(temp_path, path)
+    return len(place_records), len(key_records)
+
+def kd_order(indices, points, depth):
+    """ Order points as an implicit k-d tree: each range's median (on the axis of its depth)
+    in its middle, the points below it before and the points above it after """
+    if len(indices) <= 1:
+        return indices
+    axis = depth % 3
+    indices = sorted(indices, key=lambda index: points[index][axis])
+    middle = len(indices) // 2
+    return (kd_order(indices[:middle], points, depth + 1) + [indices[middle]]
+            + kd_order(indices[middle + 1:], points, depth + 1))
@@ -4,11 +4,21 @@
     interpreting the log level from the config file 
 """
 import logging      # for logging errors
+import logging.handlers # for the queue listener and rotating file handlers
+import queue        # for handing log records to the listener thread
+import gzip         # for compressing rotated log files
+import shutil       # for streaming rotated log files into the archive
+import os           # for removing rotated log files and polling the config file
+import atexit       # for flushing the log queue on shutdown
 import traceback    # for printing exceptions
 import sys          # for logging to stdout
 import configparser # for reading the config file
 import subprocess   # for running pip commands
 import pip          # for installing missing packages
+import modules.geocoder as geocoder # for looking cities up by name (standard library only)
+
+# The intervals TimedRotatingFileHandler accepts for logRotateWhen, in any case
+LOG_ROTATE_INTERVALS = ('S', 'M', 'H', 'D', 'MIDNIGHT') + tuple(f"W{day}" for day in range(7))
 
 def import_or_install(package, alt_package_name=None):
     """ 
@@ -45,7 +55,6 @@ def check_dependencies():
     import_or_install('requests')
     import_or_install('PIL', 'Pillow')
     import_or_install('numpy')
-    import_or_install('scikit-learn')
     import_or_install('inky', 'inky[rpi,example-depends]')
 
 def interpret_log_level(log_level):
@@ -60,61 +69,332 @@ def interpret_log_level(log_level):
         # default to WARNING if the log level is not recognized
         }.get(log_level.upper(), logging.WARNING)
 
-def get_config():
+# Values shipped in config.ini.DEFAULT that mean "not configured"
+PLACEHOLDERS = ('', 'city_name', 'latitude', 'longitude', 'your_api_key_here')
+
+class ConfigError(Exception):
+    """ Raised when config.ini is missing, unreadable, or holds an invalid value """
+
+class CityConfig:
+    """ Custom object to hold one configured city """
+    def __init__(self, name, lat, lon):
+        self.name: str = name
+        self.lat: float = lat
+        self.lon: float = lon
+
+    def __eq__(self, other):
+        return (isinstance(other, CityConfig)
+                and (self.name, self.lat, self.lon) == (other.name, other.lat, other.lon))
+
+    def __repr__(self):
+        return f"CityConfig({self.name!r}, {self.lat}, {self.lon})"
+
+def is_placeholder(value):
+    """ True when a config value is missing, blank, or still the shipped placeholder """
+    return value is None or value.strip().lower() in PLACEHOLDERS
+
+def parse_coordinate(value, option, limit):
+    """ Parse a latitude/longitude string, checking it lies within +/- limit degrees
+
+    Raises:
+        ConfigError: If the value is not a number or is out of range.
+    """
+    try:
+        coordinate = float(value)
+    except ValueError as error:
+        raise ConfigError(f"{option} must be a number, not {value!r}") from error
+    if not -limit <= coordinate <= limit:
+        raise ConfigError(f"{option} must be between -{limit} and {limit}, not {coordinate}")
+    return coordinate
+
+def geocode_city(name, number):
+    """ Look a city given only by name up in the bundled gazetteer
+
+    Raises:
+        ConfigError: If the name is not in the gazetteer, or the gazetteer is missing.
+    """
+    try:
+        place = geocoder.open_gazetteer().lookup(name)
+    except (OSError, ValueError) as error:
+        raise ConfigError(f"city{number}Name cannot be looked up without coordinates: "
+                          f"{error}") from error
+    if place is None:
+        raise ConfigError(f"city{number}Name {name!r} is not in the gazetteer; add a state or "
+                          f"country code (e.g. 'Portland, ME'), or set city{number}Lati and "
+                          f"city{number}Long")
+    return CityConfig(place.name, place.lat, place.lon)
+
+def snap_city(city, snap_km):
+    """ Move a city onto the nearest gazetteer place within snapKm, if there is one (and the
+    gazetteer is available; coordinates never need it) """
+    try:
+        city.lat, city.lon = geocoder.snap(city.lat, city.lon, snap_km)
+    except (OSError, ValueError):
+        pass
+    return city
+
+def parse_city(section, number, snap_km=0):
+    """ Parse cityNName/cityNLati/cityNLong, returning None if the city is not configured
+
+    A city with a name but no coordinates is looked up in the gazetteer, and a city with
+    coordinates is snapped onto a gazetteer place within snap_km of them.
+
+    Raises:
+        ConfigError: If the city is partly configured, its coordinates are invalid, or its
+                     name cannot be looked up.
+    """
+    name = section.get(f'city{number}Name')
+    lat = section.get(f'city{number}Lati')
+    lon = section.get(f'city{number}Long')
+    if is_placeholder(lat) and is_placeholder(lon):
+        if is_placeholder(name):
+            return None
+        return geocode_city(name.strip(), number)
+    if is_placeholder(name):
+        raise ConfigError(f"city{number}Name must be set when city {number} has coordinates")
+    return snap_city(CityConfig(name.strip(),
+                                parse_coordinate(lat, f'city{number}Lati', 90),
+                                parse_coordinate(lon, f'city{number}Long', 180)), snap_km)
+
+class Config:
+    """ Custom object to hold the configuration data, parsed and validated once """
+    def __init__(self, raw_config):
+        if not raw_config.has_section('OPENWEATHER'):
+            raise ConfigError("config.ini has no [OPENWEATHER] section")
+        openweather = raw_config['OPENWEATHER']
+
+        try:
+            config_log_level = raw_config.get('APPLICATION', 'logLevel', fallback='WARNING')
+            self.log_level: int = interpret_log_level(config_log_level)
+            self.log_max_bytes: int = raw_config.getint(
+                'APPLICATION', 'logMaxBytes', fallback=1048576)
+            self.log_backup_count: int = raw_config.getint(
+                'APPLICATION', 'logBackupCount', fallback=5)
+            self.log_rotate_when: str = raw_config.get(
+                'APPLICATION', 'logRotateWhen', fallback='') or None
+            self.units: str = raw_config.get(
+                'APPLICATION', 'units', fallback='imperial').lower()
+            self.color_theme: str = raw_config.get(
+                'APPLICATION', 'colorTheme', fallback='').lower() or None
+            self.refresh_minutes: int = raw_config.getint(
+                'APPLICATION', 'refreshMinutes', fallback=60)
+            self.config_poll_seconds: int = raw_config.getint(
+                'APPLICATION', 'configPollSeconds', fallback=10)
+            self.cycle_deadline_seconds: int = raw_config.getint(
+                'APPLICATION', 'cycleDeadlineSeconds', fallback=600)
+            self.panel: str = raw_config.get(
+                'APPLICATION', 'panel', fallback='auto').lower()
+            self.driver_process: bool = raw_config.getboolean(
+                'APPLICATION', 'driverProcess', fallback=False)
+            self.render_workers: int = raw_config.getint(
+                'APPLICATION', 'renderWorkers', fallback=1)
+            self.low_memory: bool = raw_config.getboolean(
+                'APPLICATION', 'lowMemory', fallback=False)
+            self.trace_memory: bool = raw_config.getboolean(
+                'APPLICATION', 'traceMemory', fallback=False)
+            self.alert_poll_minutes: int = raw_config.getint(
+                'APPLICATION', 'alertPollMinutes', fallback=15)
+            self.nowcast_threshold: float = raw_config.getfloat(
+                'APPLICATION', 'nowcastThreshold', fallback=0.5)
+            self.nowcast_hours: int = raw_config.getint(
+                'APPLICATION', 'nowcastHours', fallback=2)
+            self.nowcast_minutes: int = raw_config.getint(
+                'APPLICATION', 'nowcastMinutes', fallback=10)
+            self.metrics_port: int = raw_config.getint(
+                'APPLICATION', 'metricsPort', fallback=0)
+            self.metrics_address: str = raw_config.get(
+                'APPLICATION', 'metricsAddress', fallback='') or '127.0.0.1'
+            self.snap_km: float = raw_config.getfloat(
+                'APPLICATION', 'snapKm', fallback=5)
+            self.archive_file: str = raw_config.get(
+                'APPLICATION', 'archiveFile', fallback='').strip() or None
+        except ValueError as error:
+            raise ConfigError(f"[APPLICATION] {error}") from error
+
+        self.api_key: str = openweather.get('apiKey', '').strip()
+        if is_placeholder(self.api_key):
+            raise ConfigError("apiKey must be set to an OpenWeather API key")
+
+        if self.snap_km < 0:
+            raise ConfigError("snapKm cannot be negative")
+        city_one = parse_city(openweather, 1, self.snap_km)
+        if city_one is None:
+            raise ConfigError("city1Name (and optionally city1Lati and city1Long) is required")
+        city_two = parse_city(openweather, 2, self.snap_km)
+        self.cities: list = [city for city in (city_one, city_two) if city]
+        # Cities within snapKm of each other share the first one's coordinates, and so its
+        # API call and cache entry
+        for city, (lat, lon) in zip(self.cities, geocoder.merge_nearby(
+                [(city.lat, city.lon) for city in self.cities], self.snap_km)):
+            city.lat, city.lon = lat, lon
+        self.mode: str = 'dual' if city_two else 'single'
+
+        self.city_one_name: str = city_one.name
+        self.city_one_lat: float = city_one.lat
+        self.city_one_lon: float = city_one.lon
+        if city_two:
+            self.city_two_name: str = city_two.name
+            self.city_two_lat: float = city_two.lat
+            self.city_two_lon: float = city_two.lon
+
+        self._validate()
+
+    def _validate(self):
+        """ Check the values that name things defined elsewhere in the application """
+        # Imported here since this module runs before check_dependencies has installed numpy/PIL
+        import modules.units as units
+        import modules.colors as colors
+        import modules.panels as panels
+
+        if self.units not in units.UNIT_SYSTEMS:
+            raise ConfigError(f"units must be one of {', '.join(units.UNIT_SYSTEMS)}")
+        if self.color_theme and self.color_theme not in colors.THEMES:
+            raise ConfigError(f"colorTheme must be one of {', '.join(colors.THEMES)}")
+        if self.panel != 'auto' and self.panel not in panels.PROFILES:
+            raise ConfigError(f"panel must be auto or one of {', '.join(panels.PROFILES)}")
+        if self.refresh_minutes < 1:
+            raise ConfigError("refreshMinutes must be at least 1")
+        if self.cycle_deadline_seconds < 60:
+            raise ConfigError("cycleDeadlineSeconds must be at least 60")
+        if self.log_max_bytes < 0 or self.log_backup_count < 0:
+            raise ConfigError("logMaxBytes and logBackupCount cannot be negative")
+        if self.log_rotate_when and self.log_rotate_when.upper() not in LOG_ROTATE_INTERVALS:
+            raise ConfigError("logRotateWhen must be blank, S, M, H, D, W0-W6 (a weekday, "
+                              "Monday first) or midnight")
+        if self.render_workers < 1:
+            raise ConfigError("renderWorkers must be at least 1")
+        if self.alert_poll_minutes < 0:
+            raise ConfigError("alertPollMinutes cannot be negative")
+        if not 0 <= self.nowcast_threshold <= 1:
+            raise ConfigError("nowcastThreshold must be between 0 (off) and 1")
+        if not 1 <= self.nowcast_hours <= 48:
+            raise ConfigError("nowcastHours must be between 1 and 48")
+        if self.nowcast_threshold > 0 and self.nowcast_minutes < 1:
+            raise ConfigError("nowcastMinutes must be at least 1")
+        # A city in nowcast mode is never fetched less often than the others
+        self.nowcast_minutes = min(self.nowcast_minutes, self.refresh_minutes)
+        if not 0 <= self.metrics_port <= 65535:
+            raise ConfigError("metricsPort must be between 0 (off) and 65535")
+
+    def __repr__(self):
+        return (f"Config(mode={self.mode}, cities={self.cities}, units={self.units}, "
+                f"color_theme={self.color_theme}, log_level={self.log_level})")
+
+def get_config(path='config.ini'):
     """Import the config file and return the data object.
     
-    Reads the 'config.ini' file and extracts the necessary configuration data.
-    The function returns a data object containing the configuration values.
+    Reads the config file and extracts and validates the configuration data.
+
+    Args:
+        path (str, optional): The config file. Defaults to 'config.ini'.
 
     Returns:
-        config: A data object containing the configuration values.
+        Config: A data object containing the configuration values.
 
     Raises:
-        FileNotFoundError: If the 'config.ini' file is not found.
-        Exception: If there is an error parsing the config file.
+        ConfigError: If the file is missing or unreadable, or a value is invalid.
     """
+    raw_config = configparser.ConfigParser()
     try:
-        raw_config = configparser.ConfigParser()
-        raw_config.read('config.ini')
-    except FileNotFoundError:
-        print("Error reading config file")
-        traceback.print_exc()
-        sys.exit()
+        if not raw_config.read(path):
+            raise ConfigError(f"{path} not found")
+    except configparser.Error as error:
+        raise ConfigError(f"Error parsing {path}: {error}") from error
+    return Config(raw_config)
 
-    try:
-        class Config:
-            """ Custom object to hold the configuration data"""
-            def __init__(self):
-                config_log_level = raw_config.get('APPLICATION', 'logLevel', fallback='WARNING')
-                self.log_level = interpret_log_level(config_log_level)
-
-                self.api_key = raw_config['OPENWEATHER']['apiKey']
-
-                self.city_one_name = raw_config['OPENWEATHER']['city1Name']
-                self.city_one_lat = raw_config['OPENWEATHER']['city1Lati']
-                self.city_one_lon = raw_config['OPENWEATHER']['city1Long']
-
-                if raw_config['OPENWEATHER']['city2Lati'] != 'latitude':
-                    self.mode = 'dual'
-                    self.city_two_name = raw_config['OPENWEATHER']['city2Name']
-                    self.city_two_lat = raw_config['OPENWEATHER']['city2Lati']
-                    self.city_two_lon = raw_config['OPENWEATHER']['city2Long']
-                else:
-                    self.mode = 'single'
-    except Exception:
-        print("Error parsing config file")
-        traceback.print_exc()
-        exit(1)
-
-    output = Config()
-    return output
+# Which subsystems depend on which config attributes; a reload only invalidates the
+# subsystems whose attributes actually changed
+SUBSYSTEMS = {
+    'fetch': ('api_key', 'cities', 'refresh_minutes', 'nowcast_threshold', 'nowcast_hours',
+              'nowcast_minutes'),
+    'layout': ('mode', 'units', 'color_theme', 'panel', 'low_memory', 'driver_process'),
+    'logging': ('log_level', 'log_max_bytes', 'log_backup_count', 'log_rotate_when',
+                'trace_memory'),
+    'metrics': ('metrics_port', 'metrics_address'),
+}
+
+class ConfigWatcher:
+    """ Polls the config file's mtime and reloads it when it changes
+
+    An invalid edit is logged and ignored, so the running configuration stays in effect
+    until the file is fixed. Callbacks registered with on_change receive the new Config.
+    """
+    def __init__(self, config, out, path='config.ini'):
+        self.config = config
+        self.out = out
+        self.path = path
+        self.callbacks = {subsystem: [] for subsystem in SUBSYSTEMS}
+        self.signature = self._signature()
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def on_change(self, subsystem, callback):
+        """ Register callback(config) to run when the subsystem's settings change """
+        self.callbacks[subsystem].append(callback)
+
+    def check(self):
+        """ Reload the config if the file changed since the last check
+
+        Returns:
+            set: The names of the subsystems that were invalidated (empty if none).
+        """
+        signature = self._signature()
+        if signature is None or signature == self.signature:
+            return set()
+        self.signature = signature
+
+        try:
+            new_config = get_config(self.path)
+        except ConfigError as error:
+            self.out.logger.error("Ignoring invalid config change: %s", error)
+            return set()
+
+        changed = {subsystem for subsystem, attributes in SUBSYSTEMS.items()
+                   if any(getattr(self.config, attribute, None)
+                          != getattr(new_config, attribute, None)
+                          for attribute in attributes)}
+        self.config = new_config
+        self.out.logger.info("Reloaded %s; invalidated: %s",
+                             self.path, ", ".join(sorted(changed)) or "nothing")
+        for subsystem in sorted(changed):
+            for callback in self.callbacks[subsystem]:
+                callback(new_config)
+        return changed
 
 
-def start_logging(log_level):
+def gzip_namer(name):
+    """ Name rotated log files with a .gz suffix, since gzip_rotator compresses them """
+    return name + ".gz"
+
+def gzip_rotator(source, dest):
+    """ Compress a rotated log file into its archive name and remove the original
+
+    Args:
+        source (str): The path of the log file that was just rotated out.
+        dest (str): The archive path produced by gzip_namer.
+    """
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+def start_logging(log_level, max_bytes=1048576, backup_count=5, rotate_when=None):
     """Set up logging for the main application, with a log object that can be passed to methods
 
+    Records are put on an in-memory queue by the calling thread, and a QueueListener thread
+    does the formatting and the (slow, SD card bound) file and stdout writes. The log file is
+    rotated by size, or by time when rotate_when is given, and rotated files are gzipped.
+
     Args:
         log_level (int): The log level to be set for the logger and handlers.
+        max_bytes (int, optional): Rotate the log file once it reaches this size.
+        backup_count (int, optional): The number of compressed log files to keep.
+        rotate_when (str, optional): A TimedRotatingFileHandler interval (e.g. 'midnight');
+                                     when set, rotation is by time instead of by size.
 
     Returns:
         Track: An instance of the Track class that holds the logger 
@@ -127,19 +407,65 @@ def start_logging(log_level):
             self.logger = logging.getLogger()
             self.logger.setLevel(log_level)
 
-            self.file_handler = logging.FileHandler('weatherDisplay.log')
-            self.file_handler.setLevel(log_level)
+            intermediate = '%(asctime)s - %(name)s - %(levelname)s: %(message)s'
+            self.formatter = logging.Formatter(intermediate)
+
+            self.rotation = (max_bytes, backup_count, rotate_when)
+            self.file_handler = self._file_handler(log_level)
 
             self.stdout_handler = logging.StreamHandler(sys.stdout)
             self.stdout_handler.setLevel(log_level)
+            self.stdout_handler.setFormatter(self.formatter)
 
-            intermediate = '%(asctime)s - %(name)s - %(levelname)s: %(message)s'
-            self.formatter = logging.Formatter(intermediate)
+            self.queue = queue.SimpleQueue()
+            self.queue_handler = logging.handlers.QueueHandler(self.queue)
+            self.listener = logging.handlers.QueueListener(
+                self.queue, self.file_handler, self.stdout_handler,
+                respect_handler_level=True)
 
-            self.file_handler.setFormatter(self.formatter)
-            self.stdout_handler.setFormatter(self.formatter)
+            self.logger.addHandler(self.queue_handler)
+            self.listener.start()
+            self.running = True
+            atexit.register(self.stop)
+
+        def _file_handler(self, level):
+            """ Open the log file with a handler for the current rotation settings """
+            max_bytes, backup_count, rotate_when = self.rotation
+            if rotate_when:
+                handler = logging.handlers.TimedRotatingFileHandler(
+                    'weatherDisplay.log', when=rotate_when, backupCount=backup_count)
+            else:
+                handler = logging.handlers.RotatingFileHandler(
+                    'weatherDisplay.log', maxBytes=max_bytes, backupCount=backup_count)
+            handler.namer = gzip_namer
+            handler.rotator = gzip_rotator
+            handler.setLevel(level)
+            handler.setFormatter(self.formatter)
+            return handler
+
+        def set_rotation(self, max_bytes, backup_count, rotate_when):
+            """ Reopen the log file for new rotation settings, e.g. after a config reload;
+            records logged meanwhile wait on the queue for the new handler """
+            if (max_bytes, backup_count, rotate_when) == self.rotation or not self.running:
+                return
+            self.rotation = (max_bytes, backup_count, rotate_when)
+            self.listener.stop()
+            self.file_handler.close()
+            self.file_handler = self._file_handler(self.file_handler.level)
+            self.listener.handlers = (self.file_handler, self.stdout_handler)
+            self.listener.start()
+
+        def set_level(self, level):
+            """ Change the log level of the logger and handlers, e.g. after a config reload """
+            self.logger.setLevel(level)
+            self.file_handler.setLevel(level)
+            self.stdout_handler.setLevel(level)
 
-            self.logger.addHandler(self.file_handler)
-            self.logger.addHandler(self.stdout_handler)
+        def stop(self):
+            """ Drain the log queue and close the handlers; safe to call more than once """
+            if self.running:
+                self.running = False
+                self.listener.stop()
+                self.file_handler.close()
     output = Track()
     return output
@@ -0,0 +1,269 @@
+""" Runtime counters (API errors, fallbacks, section failures, restarts), kept in memory
+ and saved to metrics.json so the counts survive the hourly runs and watchdog restarts.
+ Gauges and stage latencies are kept alongside them, and can be served to Prometheus from
+ an embedded HTTP endpoint """
+
+import os                   # for resetting the lock and counters in forked render workers
+import json                 # for persisting the counters
+import threading            # for updating counters from the cycle and watchdog threads
+import time                 # for timing stages
+import contextlib           # for the stage timer
+import resource             # for the peak resident memory of the process
+import tracemalloc          # for the peak Python heap of each stage, when traceMemory is on
+import http.server          # for the metrics endpoint
+
+METRICS_FILE = 'metrics.json'
+PREFIX = 'weather_display_'
+# Upper bounds of the latency buckets in seconds; a panel refresh alone takes ~40 seconds
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_latencies = {}
+# Bumped on every update, so the exposition text is only rebuilt after something changed
+_version = 0
+_exposition = (None, b'')
+
+def _reset_after_fork():
+    # A forked process (a render worker) may inherit the lock held by another thread, and
+    # counts its own increments, which take_counters hands back to the main process
+    global _lock
+    _lock = threading.Lock()
+    _counters.clear()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def increment(name, amount=1, **labels):
+    """ Add to a counter, e.g. increment('api_errors', city='Boston') """
+    global _version
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+        _version += 1
+
+def value(name, **labels):
+    """ Return the current value of one counter (0 if it was never incremented) """
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+def counters():
+    """ Return every counter as a list of (name, labels dict, value), sorted by name """
+    with _lock:
+        items = sorted(_counters.items())
+    return [(name, dict(labels), count) for (name, labels), count in items]
+
+def take_counters():
+    """ Return the counters, as for counters(), and reset them to zero; a render worker sends
+    its increments back to the main process this way, for add_counters """
+    with _lock:
+        items = sorted(_counters.items())
+        _counters.clear()
+    return [(name, dict(labels), count) for (name, labels), count in items]
+
+def add_counters(items):
+    """ Add counters returned by take_counters in another process """
+    for name, labels, count in items:
+        increment(name, count, **labels)
+
+def save(path=METRICS_FILE):
+    """ Write the counters to a JSON file """
+    data = [{'name': name, 'labels': labels, 'value': count}
+            for name, labels, count in counters()]
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, indent=4)
+
+def load(path=METRICS_FILE):
+    """ Restore counters saved by an earlier run; a missing or corrupt file starts from zero """
+    try:
+        with open(path, encoding='utf-8') as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return
+    global _version
+    with _lock:
+        for entry in data:
+            _counters[_key(entry['name'], entry['labels'])] = entry['value']
+        _version += 1
+
+def set_gauge(name, value, **labels):
+    """ Set a gauge to its latest value, e.g. set_gauge('temperature_kelvin', 290.1, city='Boston')
+
+    A value of None (e.g. a field missing from a response) removes the gauge instead.
+    """
+    global _version
+    key = _key(name, labels)
+    with _lock:
+        if value is None:
+            _gauges.pop(key, None)
+        else:
+            _gauges[key] = float(value)
+        _version += 1
+
+def observe(name, seconds, **labels):
+    """ Record one latency in a histogram, e.g. observe('stage_seconds', 0.4, stage='parse') """
+    global _version
+    key = _key(name, labels)
+    with _lock:
+        buckets, total, count = _latencies.get(key, ([0] * len(LATENCY_BUCKETS), 0.0, 0))
+        buckets = [bucket + (seconds <= bound) for bucket, bound in zip(buckets, LATENCY_BUCKETS)]
+        _latencies[key] = (buckets, total + seconds, count + 1)
+        _version += 1
+
+@contextlib.contextmanager
+def timer(stage):
+    """ Time the enclosed block as one stage of the cycle (fetch, parse, render, refresh);
+    the latency and the peak memory are recorded whether or not the block raised """
+    start = time.perf_counter()
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    try:
+        yield
+    finally:
+        observe('stage_seconds', time.perf_counter() - start, stage=stage)
+        record_stage_memory(stage)
+
+def record_stage_memory(stage):
+    """ Record the peak memory at the end of a stage
+
+    The peak resident memory is the process's so far, so the stage that raised it is the
+    one that set the peak. While tracing, the peak of the Python heap since the stage began
+    is recorded too; stages that overlap (the fetches of two cities) share one peak.
+    """
+    # ru_maxrss is in kilobytes on Linux
+    set_gauge('stage_max_resident_memory_bytes',
+              resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, stage=stage)
+    if tracemalloc.is_tracing():
+        set_gauge('stage_peak_traced_memory_bytes', tracemalloc.get_traced_memory()[1],
+                  stage=stage)
+
+def stage_memory():
+    """ Return the peak memory recorded for each stage, as {stage: (resident bytes, traced
+    bytes or None)}, in the order the stages were first recorded """
+    with _lock:
+        gauges = list(_gauges.items())
+    resident = {dict(labels)['stage']: gauge for (name, labels), gauge in gauges
+                if name == 'stage_max_resident_memory_bytes'}
+    traced = {dict(labels)['stage']: gauge for (name, labels), gauge in gauges
+              if name == 'stage_peak_traced_memory_bytes'}
+    return {stage: (peak, traced.get(stage)) for stage, peak in resident.items()}
+
+def trace_memory(enabled):
+    """ Start or stop tracing Python allocations, which adds the heap peak of each stage
+    at the cost of some memory and speed """
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not enabled and tracemalloc.is_tracing():
+        tracemalloc.stop()
+        for stage in stage_memory():
+            set_gauge('stage_peak_traced_memory_bytes', None, stage=stage)
+
+def record_memory():
+    """ Update the resident memory gauges of this process
+
+    Called once per cycle rather than on every scrape, so a scrape never reads /proc.
+    """
+    try:
+        with open('/proc/self/statm', encoding='ascii') as file:
+            pages = int(file.read().split()[1])
+        set_gauge('process_resident_memory_bytes', pages * resource.getpagesize())
+    except (OSError, ValueError, IndexError):
+        pass
+    # ru_maxrss is in kilobytes on Linux
+    set_gauge('process_max_resident_memory_bytes',
+              resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _format_value(number):
+    return repr(float(number)) if isinstance(number, float) else str(number)
+
+def _render():
+    """ Build the Prometheus text exposition of every metric; called with _lock held """
+    lines = []
+
+    def family(metric, kind, items):
+        lines.append(f"# TYPE {metric} {kind}")
+        for labels, line_value in items:
+            lines.append(f"{metric}{labels} {line_value}")
+
+    def grouped(store):
+        names = {}
+        for (name, labels), stored in sorted(store.items()):
+            names.setdefault(name, []).append((labels, stored))
+        return names.items()
+
+    for name, items in grouped(_counters):
+        family(f"{PREFIX}{name}_total", 'counter',
+               [(_format_labels(labels), _format_value(count)) for labels, count in items])
+
+    for name, items in grouped(_gauges):
+        metric = name if name.startswith('process_') else f"{PREFIX}{name}"
+        family(metric, 'gauge',
+               [(_format_labels(labels), _format_value(gauge)) for labels, gauge in items])
+
+    for name, items in grouped(_latencies):
+        metric = f"{PREFIX}{name}"
+        lines.append(f"# TYPE {metric} histogram")
+        for labels, (buckets, total, count) in items:
+            for bound, bucket in zip(LATENCY_BUCKETS, buckets):
+                lines.append(f"{metric}_bucket{_format_labels(labels, [('le', bound)])} {bucket}")
+            lines.append(f"{metric}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {count}")
+
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+def exposition():
+    """ Return every metric in the Prometheus text format, as bytes
+
+    The text is cached and only rebuilt after a metric has changed, so a scrape between
+    two cycles costs a lock and a version comparison.
+    """
+    global _exposition
+    with _lock:
+        if _exposition[0] != _version:
+            _exposition = (_version, _render())
+        return _exposition[1]
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """ Serves the exposition text at /metrics """
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = exposition()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would flood stderr
+        pass
+
+def serve(port, host='127.0.0.1'):
+    """ Start the metrics endpoint on a background thread
+
+    Args:
+        port (int): The port to listen on; 0 picks a free one (see server.server_address).
+        host (str, optional): The address to bind. Defaults to localhost only.
+
+    Returns:
+        ThreadingHTTPServer: The running server; call shutdown() to stop it.
+    """
+    server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='metrics-endpoint', daemon=True)
+    thread.start()
+    return server
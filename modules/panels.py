@@ -0,0 +1,45 @@
+""" Profiles of the Inky panels the display can drive: resolution, inks and how long a
+ refresh takes. The layout is drawn natively at the profile's resolution """
+
+class PanelProfile:
+    """ Custom object to store the characteristics of one e-ink panel """
+    def __init__(self, name, resolution, palette, refresh_seconds):
+        self.name = name
+        self.resolution = resolution
+        self.palette = palette
+        self.refresh_seconds = refresh_seconds
+
+    def __repr__(self):
+        return f"PanelProfile({self.name}, {self.resolution[0]}x{self.resolution[1]})"
+
+# The seven inks of the Impression panels, in the order of the panel's colour indices
+SEVEN_COLOUR = ((0, 0, 0), (255, 255, 255), (0, 255, 0), (0, 0, 255),
+                (255, 0, 0), (255, 255, 0), (255, 140, 0))
+
+IMPRESSION_7_3 = PanelProfile('impression-7.3', (800, 480), SEVEN_COLOUR, 40)
+IMPRESSION_5_7 = PanelProfile('impression-5.7', (600, 448), SEVEN_COLOUR, 30)
+IMPRESSION_4 = PanelProfile('impression-4', (640, 400), SEVEN_COLOUR, 30)
+
+PROFILES = {profile.name: profile for profile in (IMPRESSION_7_3, IMPRESSION_5_7, IMPRESSION_4)}
+
+# The layout was designed at this resolution; other panels scale it
+DEFAULT_PROFILE = IMPRESSION_7_3
+
+def get_profile(name):
+    """ Return the PanelProfile for a config name (e.g. 'impression-7.3'), or None for 'auto'
+
+    Raises:
+        KeyError: If the profile is not defined.
+    """
+    if name.lower() == 'auto':
+        return None
+    return PROFILES[name.lower()]
+
+def profile_for_resolution(resolution):
+    """ Find the profile of a detected panel by its resolution, falling back to a profile
+    with the default panel's inks and refresh time """
+    for profile in PROFILES.values():
+        if tuple(profile.resolution) == tuple(resolution):
+            return profile
+    return PanelProfile('custom', tuple(resolution), DEFAULT_PROFILE.palette,
+                        DEFAULT_PROFILE.refresh_seconds)
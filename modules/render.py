@@ -2,13 +2,45 @@
  to an image using PIL and displaying it on the e-ink display"""
 
 import traceback            # for error handling
-import sys                  # for error handling
+import contextlib           # for isolating failures to one section of the frame
 import time                 # for time formatting
-from inky.auto import auto  # for working with the e-ink display
-                            #   `pip3 install inky[rpi,example-depends]`
-from PIL import Image,ImageDraw,ImageFont,ImageFilter,ImageOps  
+import logging              # for the default logger of a Layout
+import itertools            # for passing the same static layer to every render job
+import multiprocessing      # for forking the render workers
+import concurrent.futures   # for the render worker pool
+from PIL import Image,ImageFont,ImageChops
                             # for rendering via PIL `pip3 install pillow`
-
+import modules.chart as chart
+                            # for the hourly temperature/precipitation chart series
+import modules.displaylist as displaylist
+                            # for recording the layout pass as draw ops to rasterize
+import modules.colors as colors
+                            # for the temperature colour lookup tables
+import modules.units as units
+                            # for converting the SI weather model to display units
+import modules.display as display
+                            # for sending the finished frame to the e-ink display
+import modules.metrics as metrics
+                            # for counting render failures
+
+ALERT_BAND_HEIGHT = 40
+# The labels of the current conditions, drawn once on the static layer
+FEELS_LIKE_LABEL = "Feels like: "
+HUMIDITY_LABEL = "Humidity: "
+WIND_LABEL = "Wind Speed: "
+# Alerts whose event or tags mention one of these are shown with the cloud warning icon
+WEATHER_ALERT_WORDS = ('rain', 'flood', 'snow', 'ice', 'wind', 'storm', 'thunder', 'fog',
+                       'hail', 'tornado', 'hurricane', 'cyclone', 'blizzard')
+
+# The last frame sent to the display, which the alert fast path redraws the band over
+_last_frame = None
+# The display list of the last frame rendered at debug level, which the next one is compared with
+_last_display_list = None
+# The rasterized static layers of earlier renders, keyed by their display list
+_static_cache = {}
+STATIC_CACHE_SIZE = 8
+# The render worker processes, forked at startup (see get_pool)
+_pool = None
 
 def get_size(font, text):
     """Get the size of the text using getbbox() since getsize() is deprecated in Pillow 8.0.0.
@@ -33,76 +65,194 @@ def type_int(value):
     value (any): The value to be converted.
 
     Returns:
-    int: The converted integer value. If the conversion fails, returns 0.
+    int: The converted integer value. If the conversion fails (or the value is missing),
+    returns 0.
     """
     try:
         return int(value)
-    except ValueError:
+    except (ValueError, TypeError):
         return 0
 
-def temp_color(input):
+def temp_color(input, table=None):
     """
     Determines the color based on the temperature.
 
     Parameters:
-    temp (float or int): The temperature value.
+    temp (float or int): The temperature value, or None if it is missing.
+    table (TempColorTable, optional): The theme's lookup table. Defaults to fahrenheit.
+
+    Returns:
+    tuple: A tuple containing the RGB color, RGB outline color, and icon name.
+    """
+    if table is None:
+        table = colors.get_table()
+    entry = table.lookup(None if input is None else type_int(input))
+    return entry.fill, entry.outline, entry.icon
+
+def city_alerts(*cities):
+    """ Gather the alerts of (city name, WeatherData) pairs, skipping cities without data
+
+    Returns:
+        list: (city name, Alert) pairs, in city order.
+    """
+    return [(name, alert) for name, weather_data in cities if weather_data
+            for alert in weather_data.alerts]
+
+def alert_icon(alert):
+    """ Pick the warning icon for an alert: the cloud variant for weather hazards """
+    text = " ".join((alert.event,) + alert.tags).lower()
+    if any(word in text for word in WEATHER_ALERT_WORDS):
+        return 'icons/23 Cloud Warning.png'
+    return 'icons/101 Warning.png'
+
+def draw_alert_band(canvas, alerts, layout):
+    """
+    Draw the alert band across the top of the frame, over the date and time header.
+
+    The first alert is shown with its city and end time, and any others are counted. The
+    band covers its whole area, so it can be redrawn over a frame that already has one.
+
+    Parameters:
+    canvas (DisplayList): The display list to record the band on.
+    alerts (list): (city name, Alert) pairs, as returned by city_alerts.
+    layout (Layout): The layout of the frame, for its scale.
+    """
+    width = canvas.size[0]
+    band_height = layout.band_height
+    canvas.rectangle((0, 0, width - 1, band_height - 1), fill='orange', outline='black')
+
+    city_name, alert = alerts[0]
+    icon_size = band_height - layout.font_size(4)
+    canvas.paste(('alert_icon', alert_icon(alert), icon_size),
+                 (int(layout.x(4)), int(layout.scaled(2))), masked=True)
+
+    font = ImageFont.truetype(
+        "/usr/share/fonts/truetype/Urbanist-ExtraBold.ttf", layout.font_size(25),
+        encoding="unic")
+    more = f"  +{len(alerts) - 1} MORE" if len(alerts) > 1 else ""
+    text = f"{alert.event} · {city_name}".upper()
+    if alert.end_time:
+        text += f" UNTIL {alert.end_time}"
+
+    # Shorten the event text rather than the count of further alerts
+    text_x_position = icon_size + layout.scaled(10)
+    available_width = width - text_x_position - layout.x(5) - get_size(font, more)[0]
+    while text and get_size(font, text)[0] > available_width:
+        text = text[:-2] + "…"
+    canvas.text((text_x_position, layout.scaled(5)), text + more, 'black', font)
+
+def alert_frame(alerts, out):
+    """
+    Fast path for a change in alerts: draw only the alert band over the last frame, instead
+    of laying out the whole frame again.
+
+    Args:
+        alerts (list): (city name, Alert) pairs; must not be empty.
+        out: The output object.
 
     Returns:
-    tuple: A tuple containing the color and icon name.
-    """
-
-    temp = type_int(input)
-
-    icon_none = 'thermometer'
-    icon_cold = 'thermometer_low'
-    icon_moderate = 'thermometer_half'
-    icon_hot = 'thermometer_high'
-    icon_nope = 'thermometer_full'
-
-    if temp <= 39:
-        color = 'powderblue'
-        outline_color = 'darkturquoise'
-        icon = icon_cold
-    elif 40 <= temp <= 49:
-        color = 'lightblue'
-        outline_color = 'darkturquoise'
-        icon = icon_cold
-    elif 50 <= temp <= 59:
-        color = 'lightskyblue'
-        outline_color = 'darkturquoise'
-        icon = icon_moderate
-    elif 60 <= temp <= 69:
-        color = 'cornflowerblue'
-        outline_color = 'darkturquoise'
-        icon = icon_moderate
-    elif 70 <= temp <= 79:
-        color = 'goldenrod'
-        outline_color = 'black'
-        icon = icon_moderate
-    elif 80 <= temp <= 89:
-        color = 'hotpink'
-        outline_color = 'maroon'
-        icon = icon_hot
-    elif 90 <= temp <= 99:
-        color = 'lightcoral'
-        outline_color = 'maroon'
-        icon = icon_hot
-    elif 100 <= temp <= 109:
-        color = 'firebrick'
-        outline_color = 'maroon'
-        icon = icon_nope
-    elif 110 <= temp:
-        color = 'floralwhite'
-        outline_color = 'firebrick'
-        icon = icon_nope
-    else:
-        color = 'black'
-        icon = icon_none
-    return color, outline_color, icon
-
-def render_pil(city_one_name, city_one_weather, out, city_two_name = None, city_two_weather = None):
-    """
-    Render text to image using PIL.
+        Image: The frame, or None if there is no earlier frame to draw over, or drawing
+               failed (logged and counted).
+    """
+    if _last_frame is None:
+        return None
+
+    out.logger.info("Redrawing the alert band: %s", ", ".join(
+        f"{alert.event} ({city_name})" for city_name, alert in alerts))
+    try:
+        with metrics.timer('alert_render'):
+            canvas = _last_frame.copy()
+            band = displaylist.DisplayList(canvas.size)
+            draw_alert_band(band, alerts, Layout(logger=out.logger, size=canvas.size))
+            band.rasterize(canvas)
+    except Exception:
+        out.logger.critical("Error drawing the alert band")
+        out.logger.critical(traceback.format_exc())
+        metrics.increment('render_failures')
+        return None
+    return canvas
+
+def release_images():
+    """ Drop the icons and charts built for the frame; the next frame rebuilds what it needs """
+    chart.clear_cache()
+    displaylist.release_images()
+
+def invalidate_layout():
+    """ Drop everything cached from earlier renders, after a layout-affecting config change """
+    global _last_frame
+    release_images()
+    _static_cache.clear()
+    # A different panel or units, so the alert band must not be drawn over the old frame
+    _last_frame = None
+
+def render_frame(city_one_name, city_one_weather, out, city_two_name = None,
+                 city_two_weather = None, color_theme=None, unit_system='imperial', sink=None,
+                 now=None, workers=1, low_memory=False):
+    """
+    Render a frame at the display's resolution, without showing it.
+
+    Args:
+        See render_pil.
+
+    Returns:
+        Image: The frame, or None if detecting the display or rendering failed (logged and
+               counted).
+    """
+    try:
+        if sink is None:
+            sink = display.InkySink()
+        size = sink.resolution
+        palette = tuple(sink.profile.palette) if low_memory else None
+    except Exception:
+        out.logger.critical("Error detecting the display")
+        out.logger.critical(traceback.format_exc())
+        metrics.increment('display_failures')
+        return None
+
+    try:
+        with metrics.timer('render'):
+            return compose_pil(city_one_name, city_one_weather, out, city_two_name,
+                               city_two_weather, color_theme, unit_system, now, workers, size,
+                               palette)
+    except Exception:
+        metrics.increment('render_failures')
+        return None
+    finally:
+        if low_memory:
+            release_images()
+
+def show_frame(canvas, out, sink=None):
+    """
+    Send a frame to the display, blocking for the refresh, and keep it as the last frame
+    for the alert fast path.
+
+    Args:
+        canvas (Image): The frame.
+        out: The output object.
+        sink (optional): Where the frame is sent. Defaults to the Inky display.
+
+    Returns:
+        bool: True if the frame reached the display; a failure is logged and counted.
+    """
+    global _last_frame
+    try:
+        if sink is None:
+            sink = display.InkySink()
+        with metrics.timer('refresh'):
+            sink.show(canvas)
+    except Exception:
+        out.logger.critical("Error sending the rendered image to the display")
+        out.logger.critical(traceback.format_exc())
+        metrics.increment('display_failures')
+        return False
+    _last_frame = canvas
+    return True
+
+def render_pil(city_one_name, city_one_weather, out, city_two_name = None, city_two_weather = None,
+               color_theme=None, unit_system='imperial', sink=None, now=None, workers=1,
+               low_memory=False):
+    """
+    Render text to image using PIL, and show it on the display.
 
     Args:
         city_one_name (str): The name of the first city.
@@ -110,303 +260,498 @@ def render_pil(city_one_name, city_one_weather, out, city_two_name = None, city_
         out: The output object.
         city_two_name (str, optional): The name of the second city. Defaults to None.
         city_two_weather (optional): The weather data for the second city. Defaults to None.
+        color_theme (str, optional): The temperature colour theme. Defaults to the theme
+                                     matching the unit system.
+        unit_system (str, optional): The display units, 'imperial' or 'metric'.
+        sink (optional): Where the frame is sent, which sets the resolution it is drawn at.
+                         Defaults to the Inky display.
+        now (float, optional): The epoch time to stamp the frame with. Defaults to now.
+        workers (int, optional): The number of processes to render on. Defaults to 1.
+        low_memory (bool, optional): Draw the frame in the panel's inks ('P' mode) rather
+                                     than RGB, and drop the icons and charts built for it
+                                     once it is drawn.
+
+    Returns:
+        bool: True if the frame reached the display; failures are logged and counted,
+              and the display keeps showing the previous frame.
     """
-    # The Urbanist font family is used for rendering the text:
-    #     Urbanist-Thin.ttf,          Urbanist-ThinItalic.ttf
-    #     Urbanist-ExtraLight.ttf,    Urbanist-ExtraLightItalic.ttf
-    #     Urbanist-Light.ttf,         Urbanist-LightItalic.ttf
-    #     Urbanist-Regular.ttf,       Urbanist-Italic.ttf
-    #     Urbanist-Medium.ttf,        Urbanist-MediumItalic.ttf
-    #     Urbanist-SemiBold.ttf,      Urbanist-SemiBoldItalic.ttf
-    #     Urbanist-Bold.ttf,          Urbanist-BoldItalic.ttf
-    #     Urbanist-ExtraBold.ttf,     Urbanist-ExtraBoldItalic.ttf
-    #     Urbanist-Black.ttf,         Urbanist-BlackItalic.ttf
-    out.logger.info("Rendering weather data to image using PIL")
+    if sink is None:
+        sink = display.InkySink()
+    canvas = render_frame(city_one_name, city_one_weather, out, city_two_name, city_two_weather,
+                          color_theme, unit_system, sink, now, workers, low_memory)
+    return canvas is not None and show_frame(canvas, out, sink)
 
-    try:
-        max_width = 800
-        max_height = 480
-        canvas = Image.new('RGB', (max_width, max_height), "white")
-        draw = ImageDraw.Draw(canvas)
-
-        date = time.strftime("%B %-d", time.localtime())
-        weekday = time.strftime("%a", time.localtime())
-        load_time = time.strftime("%-I:%M %p", time.localtime())
-
-        header_one = ImageFont.truetype(
-            "/usr/share/fonts/truetype/Urbanist-ExtraBold.ttf", 64, encoding="unic")
-        header_two = ImageFont.truetype(
-            "/usr/share/fonts/truetype/Urbanist-SemiBoldItalic.ttf", 35, encoding="unic")
-        forecast_header = ImageFont.truetype(
-            "/usr/share/fonts/truetype/Urbanist-SemiBold.ttf", 25, encoding="unic")
-        forecast_city = ImageFont.truetype(
-            "/usr/share/fonts/truetype/Urbanist-ExtraBold.ttf", 45, encoding="unic")
-        forecast_paragraph = ImageFont.truetype(
-            "/usr/share/fonts/truetype/Urbanist-Bold.ttf", 14, encoding="unic")
-        paragraph = ImageFont.truetype(
-            "/usr/share/fonts/truetype/Urbanist-Regular.ttf", 20, encoding="unic")
-        big_number = ImageFont.truetype(
-            "/usr/share/fonts/truetype/Urbanist-Black.ttf", 64, encoding="unic")
-        mid_number = ImageFont.truetype(
-            "/usr/share/fonts/truetype/Urbanist-Bold.ttf", 25, encoding="unic")
-        subtext = ImageFont.truetype(
-            "/usr/share/fonts/truetype/Urbanist-Italic.ttf", 16, encoding="unic")
+class Layout:
+    """
+    Custom object to hold what every part of a frame is drawn with: the fonts and their
+    heights, the unit system and the colour table.
+
+    The layout was designed at 800x480; for any other panel resolution, the positions of the
+    blocks of the frame are scaled per axis, and fonts, icons and the spacing between lines
+    of text by the smaller of the two factors, so the frame is drawn natively at the panel's
+    size.
+
+    The layout pass measures text with these fonts, and records them in the display lists
+    by what they were loaded from, so the rasterizer (in this process, a render worker or
+    another machine) loads its own. Failed sections are collected in failures, for the
+    caller to log.
+    """
+    def __init__(self, unit_system='imperial', color_theme=None, logger=None, size=(800, 480)):
+        # The Urbanist font family is used for rendering the text:
+        #     Urbanist-Thin.ttf,          Urbanist-ThinItalic.ttf
+        #     Urbanist-ExtraLight.ttf,    Urbanist-ExtraLightItalic.ttf
+        #     Urbanist-Light.ttf,         Urbanist-LightItalic.ttf
+        #     Urbanist-Regular.ttf,       Urbanist-Italic.ttf
+        #     Urbanist-Medium.ttf,        Urbanist-MediumItalic.ttf
+        #     Urbanist-SemiBold.ttf,      Urbanist-SemiBoldItalic.ttf
+        #     Urbanist-Bold.ttf,          Urbanist-BoldItalic.ttf
+        #     Urbanist-ExtraBold.ttf,     Urbanist-ExtraBoldItalic.ttf
+        #     Urbanist-Black.ttf,         Urbanist-BlackItalic.ttf
+        self.max_width, self.max_height = size
+        self.scale_x = self.max_width / 800
+        self.scale_y = self.max_height / 480
+        self.scale = min(self.scale_x, self.scale_y)
+        self.band_height = self.font_size(ALERT_BAND_HEIGHT)
+        self.units = units.get_unit_system(unit_system)
+        self.color_table = colors.get_table(color_theme or self.units.color_theme)
+        self.logger = logger or logging.getLogger()
+        self.failures = []
+
+        self.header_one = ImageFont.truetype(
+            "/usr/share/fonts/truetype/Urbanist-ExtraBold.ttf", self.font_size(64), encoding="unic")
+        self.header_two = ImageFont.truetype(
+            "/usr/share/fonts/truetype/Urbanist-SemiBoldItalic.ttf", self.font_size(35),
+            encoding="unic")
+        self.forecast_header = ImageFont.truetype(
+            "/usr/share/fonts/truetype/Urbanist-SemiBold.ttf", self.font_size(25), encoding="unic")
+        self.forecast_city = ImageFont.truetype(
+            "/usr/share/fonts/truetype/Urbanist-ExtraBold.ttf", self.font_size(45), encoding="unic")
+        self.forecast_paragraph = ImageFont.truetype(
+            "/usr/share/fonts/truetype/Urbanist-Bold.ttf", self.font_size(14), encoding="unic")
+        self.paragraph = ImageFont.truetype(
+            "/usr/share/fonts/truetype/Urbanist-Regular.ttf", self.font_size(20), encoding="unic")
+        self.big_number = ImageFont.truetype(
+            "/usr/share/fonts/truetype/Urbanist-Black.ttf", self.font_size(64), encoding="unic")
+        self.mid_number = ImageFont.truetype(
+            "/usr/share/fonts/truetype/Urbanist-Bold.ttf", self.font_size(25), encoding="unic")
+        self.subtext = ImageFont.truetype(
+            "/usr/share/fonts/truetype/Urbanist-Italic.ttf", self.font_size(16), encoding="unic")
 
         # Use 'Ag' to cover normal full height range above and below the line
-        dummy_width, big_number_height = get_size(big_number, "Ag")
-        dummy_width, header_one_height = get_size(header_one, "Ag")
-        dummy_width, header_two_height = get_size(header_two, "Ag")
-        dummy_width, forecast_header_height = get_size(forecast_header, "Ag")
-
-        time_stamp = f"CONDITIONS AS OF {load_time}"
-        # Use an actual string to determine the x position for right-justification on the canvas
-        time_stamp_width, dummy_height = get_size(paragraph, time_stamp)
-
-        ### Draw the [day of the week], [month] [day] header, top-left
-        date_stamp = f"{weekday}, {date}".upper()
-        draw.text((5, 1), date_stamp, 'blue', header_two)
-
-        ### Draw the [time] header, top-right, right-justified
-        draw.text((max_width - time_stamp_width - 5, 1), time_stamp, 'blue', paragraph)
-
-        def draw_city_data(x_position, city_name, weather_data, draw, y_position, city_number=1):
-            """
-            Draw the city name, weather data, and forecast information on the canvas.
-
-            Parameters:
-            - x_position (int): The x-coordinate position to start drawing.
-            - city_name (str): The name of the city.
-            - weather_data (WeatherData): An object containing weather data.
-            - draw (ImageDraw): The ImageDraw object used for drawing on the canvas.
-            - y_position (int): The y-coordinate position to start drawing.
-            - city_number (int, optional): The number of the city. Defaults to 1.
-
-            Returns:
-            None
-            """
-            ### NAME ###
-            city_name = city_name.upper()
-            out.logger.debug(f"Y position: {y_position}: {city_name}")
-            draw.text((x_position, y_position), f"{city_name}", 'red', header_one,
-                      stroke_width=2, stroke_fill='black')
-            y_position += header_one_height
-
-            ### TEXT SUMMARY ###
-            summary_position = x_position, y_position
-
-            summary = f"{weather_data.daily[0].summary}"
-            out.logger.debug(f"Y position: {y_position}: {summary}")
-
-            summary_width, summary_height = get_size(subtext, summary)
-            if summary_width > max_width / 2:
-                temp_font_size = 20
-                while summary_width > max_width / 2:
-                    temp_font_size -= 1
-                    temp_paragraph = ImageFont.truetype(
-                        "/usr/share/fonts/truetype/Urbanist-Regular.ttf", temp_font_size)
-                    summary_width, summary_height = get_size(temp_paragraph, summary)
-                draw.text(summary_position, summary, 'black', temp_paragraph)
-            else:
-                draw.text(summary_position, summary, 'black', paragraph)
-            y_position += 20
-
-            ### CURRENT CONDITION ICON ###
-            icon_file = f'icons/{weather_data.current.weather.icon}.png'
-
-            try:
-                img = Image.open(icon_file)
-            except FileNotFoundError:
-                img = Image.open('icons/unknown.png')
-
-            icon_width, icon_height = img.size
-            img.resize((icon_width * 3, icon_height * 3))
-
-            img.filter(ImageFilter.EDGE_ENHANCE_MORE)
-
-            img_x_position = int(x_position + 400 - icon_width * 2.5)
-            img_y_position = int(y_position + icon_height / 1.8)
-            img_position = img_x_position, img_y_position
-
-            canvas.paste(img, img_position)
-
-            ### DESCRIPTION ###
-            description = f"{weather_data.current.weather.description}"
-            description_width, description_height = get_size(subtext, description)
-            img_x_midpoint = img_x_position + (icon_width / 2)
-            img_y_bottom = img_y_position + icon_height
-            description_position = img_x_midpoint - (description_width / 2), img_y_bottom + 5
-
-            draw.text(description_position, description, 'black', subtext)
-
-            ### THERMOMETER ICON ###
-            temp = type_int(weather_data.current.temp)
-            color, outline_color, icon = temp_color(temp)
-            out.logger.debug(f"Temperature variable type after type_int: {type(temp)}")
-
-            out.logger.debug(f"temp: {temp}, color: {color}, icon: {icon}")
-
-            icon_file = f'icons/{icon}.png'
-            try:
-                img = Image.open(icon_file)
-            except FileNotFoundError:
-                out.logger.error(f"Error opening icon file: {icon_file}")
-                img = Image.open('icons/thermometer.png')
-
-            # Determine Big Temp position
-            current_temp = f"{temp:.0f}°F"
-            temp_width, temp_height = get_size(big_number, current_temp)
-
-            position = x_position + temp_width, y_position + 5
-            icon_width, icon_height = img.size
-            out.logger.debug(f"Position: {position}, {icon}")
-
-            img_l = img.convert('L')
-            img_recolor = ImageOps.colorize(img_l, black = color, white = "white")
-            canvas.paste(img_recolor, position)
-
-            ### BIG TEMP ###
-            position = x_position, y_position
-
-            out.logger.debug(f"Y position: {y_position}: {current_temp}")
-
-            draw.text(position, f"{current_temp}", color, big_number,
-                      stroke_width=3, stroke_fill=outline_color)
-
-            feels_like_x_position = x_position
-            temp_x_position = x_position + temp_width - 15
-
-            y_position += big_number_height
-
-            ### HIGH/LOW TEMP ###
-            section_font = header_two
-
-            daily_max_int = type_int(weather_data.daily[0].temp.max)
-            daily_max_color, outline_color, icon = temp_color(daily_max_int)
-            daily_max_string = f"↑{daily_max_int:.0f}"
-            daily_max_width, daily_max_height = get_size(section_font, daily_max_string)
-
-            draw.text((x_position, y_position), daily_max_string, daily_max_color, section_font,
-                      stroke_width=2, stroke_fill=outline_color)
-            x_position += daily_max_width
-
-            separator = " / "
-            separator_width, separator_height = get_size(section_font, separator)
-            draw.text((x_position, y_position), separator, 'black', section_font)
-            x_position += separator_width
-
-            daily_min_int = type_int(weather_data.daily[0].temp.min)
-            daily_min_color, outline_color, icon = temp_color(daily_min_int)
-            daily_min_string = f"↓{daily_min_int:.0f}°F"
-
-            draw.text((x_position, y_position), daily_min_string, daily_min_color, section_font,
-                      stroke_width=2, stroke_fill=outline_color)
-
-            out.logger.debug(f"Y position: {y_position}: {daily_max_string}{daily_min_string}")
-
-            y_position += header_two_height
+        dummy_width, self.big_number_height = get_size(self.big_number, "Ag")
+        dummy_width, self.header_one_height = get_size(self.header_one, "Ag")
+        dummy_width, self.header_two_height = get_size(self.header_two, "Ag")
+        dummy_width, self.forecast_header_height = get_size(self.forecast_header, "Ag")
+
+        # The rows of a city panel, from the top down, shared by the static layer (the
+        # name and the labels) and the current conditions drawn over it
+        rows = {'name': self.header_one_height - self.scaled(35)}
+        rows['summary'] = rows['name'] + self.header_one_height
+        rows['current_temp'] = rows['summary'] + self.scaled(20)
+        rows['high_low'] = rows['current_temp'] + self.big_number_height
+        rows['feels_like'] = rows['high_low'] + self.header_two_height
+        rows['humidity'] = rows['feels_like'] + self.scaled(20)
+        rows['wind'] = rows['humidity'] + self.scaled(20)
+        self.city_rows = rows
+
+        # The forecast strip: the day headers, then a row for each city
+        self.forecast_header_y = self.max_height / 2 + self.y(30)
+        self.forecast_rows = (
+            self.forecast_header_y + self.forecast_header_height + self.scaled(5),
+            self.max_height / 2 + self.y(160))
+
+    def x(self, value):
+        """ Scale a horizontal distance from the 800x480 design to the panel """
+        return value if self.scale_x == 1 else value * self.scale_x
+
+    def y(self, value):
+        """ Scale a vertical distance from the 800x480 design to the panel """
+        return value if self.scale_y == 1 else value * self.scale_y
+
+    def scaled(self, value):
+        """ Scale a distance that goes with the text size, e.g. the spacing between lines """
+        return value if self.scale == 1 else value * self.scale
+
+    def font_size(self, size):
+        """ Scale a font size from the 800x480 design to the panel """
+        return max(1, round(size * self.scale))
+
+    def stroke(self, width):
+        """ Scale a text stroke width, keeping at least one pixel """
+        return max(1, round(width * self.scale))
+
+    def icon(self, path, colour=None):
+        """ Describe an icon sized for the panel, recoloured from black to colour if given
+
+        Returns:
+            tuple: The image spec to paste (see displaylist.load_image), and its size.
+
+        Raises:
+            FileNotFoundError: If there is no such icon.
+        """
+        with Image.open(path) as img:
+            size = img.size
+        if self.scale != 1:
+            size = self.font_size(size[0]), self.font_size(size[1])
+        return ('icon', path, size, colour), size
+
+    @contextlib.contextmanager
+    def section(self, canvas, name, placeholder_position=None):
+        """
+        Isolate one section of the frame. A failure is recorded, a placeholder is drawn in
+        its place if a position is given, and the rest of the frame renders.
+        """
+        try:
+            yield
+        except Exception:
+            self.failures.append((name, traceback.format_exc()))
+            if placeholder_position:
+                canvas.text(placeholder_position, "--", 'black', self.subtext)
+
+def draw_header(canvas, layout, date_stamp, time_stamp):
+    """ Draw the date header, top-left, and the time header, top-right """
+
+    ### Draw the [day of the week], [month] [day] header, top-left
+    with layout.section(canvas, 'date'):
+        canvas.text((layout.x(5), layout.y(1)), date_stamp, 'blue', layout.header_two)
+
+    ### Draw the [time] header, top-right, right-justified
+    with layout.section(canvas, 'time'):
+        # Use an actual string to determine the x position for right-justification
+        time_stamp_width, dummy_height = get_size(layout.paragraph, time_stamp)
+        canvas.text((layout.max_width - time_stamp_width - layout.x(5), layout.y(1)), time_stamp,
+                    'blue', layout.paragraph)
+
+def draw_static(canvas, layout, cities):
+    """
+    Draw the parts of the frame that only change with the configuration: the city name
+    banners, the labels of the current conditions and the city labels of the forecast strip.
 
-            ### FEELS LIKE ###
-            x_position = feels_like_x_position
-            daily_feels_int = type_int(weather_data.current.feels_like)
-            color, outline_color, unused_icon = temp_color(daily_feels_int)
-            daily_feels_string = f"{daily_feels_int:.0f}°F"
-            position = x_position, y_position
-            out.logger.debug(f"Y position: {y_position}: Feels like: {daily_feels_string}")
+    Parameters:
+    - canvas (DisplayList): The display list to record the drawing on.
+    - layout (Layout): The fonts and colours to draw with.
+    - cities (list): (x position, city name, has weather data) for each city, in order.
+                     A city without weather data gets only its name.
 
-            text = "Feels like: "
-            text_width, text_height = get_size(paragraph, text)
-            draw.text((position), text, 'black', paragraph)
+    Returns:
+    None
+    """
+    rows = layout.city_rows
+
+    for city_number, (x_position, city_name, has_data) in enumerate(cities, 1):
+        ### NAME ###
+        city_name = city_name.upper()
+        with layout.section(canvas, 'name'):
+            layout.logger.debug("Y position: %s: %s", rows['name'], city_name)
+            canvas.text((x_position, rows['name']), f"{city_name}", 'red', layout.header_one,
+                        stroke_width=layout.stroke(2), stroke_fill='black')
+
+        if not has_data:
+            continue
+
+        ### LABELS ###
+        with layout.section(canvas, 'labels'):
+            for label, row in ((FEELS_LIKE_LABEL, 'feels_like'), (HUMIDITY_LABEL, 'humidity'),
+                               (WIND_LABEL, 'wind')):
+                canvas.text((x_position, rows[row]), label, 'black', layout.paragraph)
+
+        ### FORECAST ROW LABEL ###
+        with layout.section(canvas, 'forecast_label'):
+            city_name_trunc = city_name[:3]
+            canvas.text((layout.x(5), layout.forecast_rows[city_number - 1]),
+                        f"{city_name_trunc}", 'red', layout.forecast_city,
+                        stroke_width=layout.stroke(1), stroke_fill='black')
 
-            temp_position = x_position + text_width, y_position
-            draw.text((temp_position), daily_feels_string, color, paragraph,
-                      stroke_width=1, stroke_fill='black') # Default black for legibility
-            y_position += 20
+def static_layer(static, palette=None):
+    """
+    Return the rasterized static layer, drawing it on first use.
 
-            ### HUMIDITY ###
-            humidity = f"{type_int(weather_data.current.humidity)}%"
-            out.logger.debug(f"Y position: {y_position}: Humidity: {humidity}")
-            draw.text((x_position, y_position), f"Humidity: {humidity}", 'black', paragraph)
-            y_position += 20
-
-            ### WIND SPEED AND DIRECTION ###
-            wind_speed = type_int(weather_data.current.wind_speed)
-            daily_wind = f"{wind_speed:.0f}mph {weather_data.current.wind_dir}"
-            out.logger.debug(f"Y position: {y_position}: Wind Speed: {daily_wind}")
-            draw.text((x_position, y_position), f"Wind Speed: {daily_wind}", 'black', paragraph)
+    The layer is keyed by its display list, so in daemon mode the stroked names and the
+    labels are rasterized once per configuration rather than every frame.
 
-            ### DAILY FORECAST ###
-            if city_number == 1:
-                y_position = max_height / 2 + 30
+    Parameters:
+    - static (DisplayList): The static layer's display list (see draw_static).
+    - palette (tuple, optional): The panel's inks, to rasterize a 'P' layer in.
 
-                counter = 0
-                for day in weather_data.daily: # Draw the header
-                    counter += 1
-                    if counter == 1:
-                        continue # Skip the first day
-                    x_position += int(max_width / 7)
-                    date = time.strftime('%a %d', time.localtime(day.dt))
-                    draw.text((x_position, y_position), f"{date}", 'red', forecast_header, stroke_width = 1, stroke_fill='black')
-
-                y_position += forecast_header_height + 5
-            else:
-                y_position = max_height / 2 + 160
+    Returns:
+    Image: The layer; the caller must copy it before drawing on it.
+    """
+    key = static.digest(), palette
+    layer = _static_cache.get(key)
+    if layer is not None:
+        metrics.increment('cache_hits', cache='static')
+        return layer
+
+    metrics.increment('cache_misses', cache='static')
+    layer = static.rasterize(palette=palette)
+    if len(_static_cache) >= STATIC_CACHE_SIZE:
+        _static_cache.clear()
+    _static_cache[key] = layer
+    return layer
+
+def draw_city_data(canvas, layout, x_position, city_name, weather_data, display):
+    """
+    Draw the city name and current weather data on the canvas.
 
-            city_name_trunc = city_name[:3]
-            x_position = 5
-            row = y_position
-            y_spacing = 5
+    Parameters:
+    - canvas (DisplayList): The display list to record the drawing on.
+    - layout (Layout): The fonts and colours to draw with.
+    - x_position (int): The x-coordinate position to start drawing.
+    - city_name (str): The name of the city.
+    - weather_data (WeatherData): An object containing weather data, or None if
+                                  neither fresh nor cached data was available.
+    - display (DisplayWeather): The weather data converted to the display's units.
 
-            column_width = int(max_width / 7)
+    The name and the labels are on the static layer (see draw_static); only the values are
+    drawn here.
 
-            counter = 0
-            for day in weather_data.daily:
-                y_position = row
+    Returns:
+    None
+    """
+    rows = layout.city_rows
+    y_position = rows['summary']
+
+    if weather_data is None:
+        canvas.text((x_position, y_position), "Weather data unavailable", 'black',
+                    layout.paragraph)
+        return
+
+    ### TEXT SUMMARY ###
+    with layout.section(canvas, 'summary', (x_position, y_position)):
+        summary_position = x_position, y_position
+
+        summary = weather_data.daily[0].summary if weather_data.daily else "--"
+        layout.logger.debug("Y position: %s: %s", y_position, summary)
+
+        summary_width, summary_height = get_size(layout.subtext, summary)
+        if summary_width > layout.max_width / 2:
+            temp_font_size = layout.font_size(20)
+            while summary_width > layout.max_width / 2:
+                temp_font_size -= 1
+                temp_paragraph = ImageFont.truetype(
+                    "/usr/share/fonts/truetype/Urbanist-Regular.ttf", temp_font_size)
+                summary_width, summary_height = get_size(temp_paragraph, summary)
+            canvas.text(summary_position, summary, 'black', temp_paragraph)
+        else:
+            canvas.text(summary_position, summary, 'black', layout.paragraph)
+    y_position = rows['current_temp']
+
+    ### CURRENT CONDITION ICON ###
+    with layout.section(canvas, 'condition'):
+        icon_file = f'icons/{weather_data.current.weather.icon}.png'
+
+        try:
+            img, (icon_width, icon_height) = layout.icon(icon_file)
+        except FileNotFoundError:
+            img, (icon_width, icon_height) = layout.icon('icons/unknown.png')
+
+        img_x_position = int(x_position + layout.x(400) - icon_width * 2.5)
+        img_y_position = int(y_position + icon_height / 1.8)
+        img_position = img_x_position, img_y_position
+
+        canvas.paste(img, img_position)
+
+        ### DESCRIPTION ###
+        description = f"{weather_data.current.weather.description}"
+        description_width, description_height = get_size(layout.subtext, description)
+        img_x_midpoint = img_x_position + (icon_width / 2)
+        img_y_bottom = img_y_position + icon_height
+        description_position = (img_x_midpoint - (description_width / 2),
+                                img_y_bottom + layout.scaled(5))
+
+        canvas.text(description_position, description, 'black', layout.subtext)
+
+    ### THERMOMETER ICON ###
+    with layout.section(canvas, 'current_temp', (x_position, y_position)):
+        temp = display.current_temp
+        color, outline_color, icon = temp_color(temp, layout.color_table)
+        layout.logger.debug("Temperature variable type after type_int: %s", type(temp))
+
+        layout.logger.debug("temp: %s, color: %s, icon: %s", temp, color, icon)
+
+        icon_file = f'icons/{icon}.png'
+        try:
+            img, (icon_width, icon_height) = layout.icon(icon_file, color)
+        except FileNotFoundError:
+            layout.logger.error("Error opening icon file: %s", icon_file)
+            img, (icon_width, icon_height) = layout.icon('icons/thermometer.png', color)
+
+        # Determine Big Temp position
+        current_temp = display.temp_text(temp)
+        temp_width, temp_height = get_size(layout.big_number, current_temp)
+
+        position = int(x_position + temp_width), int(y_position + layout.scaled(5))
+        layout.logger.debug("Position: %s, %s", position, icon)
+
+        canvas.paste(img, position)
+
+        ### BIG TEMP ###
+        position = x_position, y_position
+
+        layout.logger.debug("Y position: %s: %s", y_position, current_temp)
+
+        canvas.text(position, f"{current_temp}", color, layout.big_number,
+                    stroke_width=layout.stroke(3), stroke_fill=outline_color)
+
+    y_position = rows['high_low']
+
+    ### HIGH/LOW TEMP ###
+    with layout.section(canvas, 'high_low', (x_position, y_position)):
+        section_font = layout.header_two
+        high_low_x_position = x_position
+
+        # The daily forecast can be missing altogether
+        daily_max_int = display.daily_max[0] if display.daily_max else None
+        daily_max_color, outline_color, icon = temp_color(daily_max_int, layout.color_table)
+        daily_max_string = "↑--" if daily_max_int is None else f"↑{daily_max_int:.0f}"
+        daily_max_width, daily_max_height = get_size(section_font, daily_max_string)
+
+        canvas.text((high_low_x_position, y_position), daily_max_string, daily_max_color,
+                    section_font, stroke_width=layout.stroke(2), stroke_fill=outline_color)
+        high_low_x_position += daily_max_width
+
+        separator = " / "
+        separator_width, separator_height = get_size(section_font, separator)
+        canvas.text((high_low_x_position, y_position), separator, 'black', section_font)
+        high_low_x_position += separator_width
+
+        daily_min_int = display.daily_min[0] if display.daily_min else None
+        daily_min_color, outline_color, icon = temp_color(daily_min_int, layout.color_table)
+        daily_min_string = f"↓{display.temp_text(daily_min_int)}"
+
+        canvas.text((high_low_x_position, y_position), daily_min_string, daily_min_color,
+                    section_font, stroke_width=layout.stroke(2), stroke_fill=outline_color)
+
+        layout.logger.debug("Y position: %s: %s%s",
+                            y_position, daily_max_string, daily_min_string)
+
+    y_position = rows['feels_like']
+
+    ### FEELS LIKE ###
+    with layout.section(canvas, 'feels_like', (x_position, y_position)):
+        daily_feels_int = display.current_feels_like
+        color, outline_color, unused_icon = temp_color(daily_feels_int, layout.color_table)
+        daily_feels_string = display.temp_text(daily_feels_int)
+        position = x_position, y_position
+        layout.logger.debug("Y position: %s: Feels like: %s", y_position, daily_feels_string)
+
+        text_width, text_height = get_size(layout.paragraph, FEELS_LIKE_LABEL)
+        temp_position = x_position + text_width, y_position
+        # Default black stroke for legibility
+        canvas.text((temp_position), daily_feels_string, color, layout.paragraph,
+                    stroke_width=layout.stroke(1), stroke_fill='black')
+    y_position = rows['humidity']
+
+    ### HUMIDITY ###
+    with layout.section(canvas, 'humidity', (x_position, y_position)):
+        humidity_raw = weather_data.current.humidity_raw
+        humidity = "--" if humidity_raw is None else f"{type_int(humidity_raw)}%"
+        layout.logger.debug("Y position: %s: Humidity: %s", y_position, humidity)
+        value_position = x_position + layout.paragraph.getlength(HUMIDITY_LABEL), y_position
+        canvas.text(value_position, humidity, 'black', layout.paragraph)
+    y_position = rows['wind']
+
+    ### WIND SPEED AND DIRECTION ###
+    with layout.section(canvas, 'wind', (x_position, y_position)):
+        wind_speed = display.current_wind_speed
+        daily_wind = f"{display.speed_text(wind_speed)} {weather_data.current.wind_dir}"
+        layout.logger.debug("Y position: %s: Wind Speed: %s", y_position, daily_wind)
+        value_position = x_position + layout.paragraph.getlength(WIND_LABEL), y_position
+        canvas.text(value_position, daily_wind, 'black', layout.paragraph)
+
+    ### HOURLY CHART, OR THE NOWCAST WHILE RAIN IS IMMINENT ###
+    with layout.section(canvas, 'hourly_chart'):
+        chart_size = int(layout.x(170)), int(layout.scaled(34))
+        chart_position = int(x_position + layout.x(225)), int(y_position)
+        if weather_data.minutely is not None:
+            precipitation = tuple(weather_data.minutely.precipitation.tolist())
+            canvas.paste(('nowcast_strip', precipitation, chart_size), chart_position)
+        elif weather_data.hourly:
+            temps, pops = chart.hourly_series(weather_data.hourly)
+            if len(temps):
+                canvas.paste(('hourly_chart', tuple(temps.tolist()), tuple(pops.tolist()),
+                              chart_size), chart_position)
+
+def draw_forecast(canvas, layout, cities):
+    """
+    Draw the daily forecast strip: the day headers, then one row per city.
+
+    Parameters:
+    - canvas (DisplayList): The display list to record the drawing on.
+    - layout (Layout): The fonts and colours to draw with.
+    - cities (list): (city name, WeatherData, DisplayWeather) for each city, in order.
+                     A city without weather data gets no row (and city one no headers).
 
-                counter += 1
-                if counter == 1:
-                    continue
-                if counter == 2:
-                    draw.text((x_position, y_position), f"{city_name_trunc}", 'red', forecast_city,
-                              stroke_width=1, stroke_fill='black')
+    The city labels of the rows are on the static layer (see draw_static).
+
+    Returns:
+    None
+    """
+    column_width = int(layout.max_width / 7)
 
-                x_position += column_width
+    for city_number, (city_name, weather_data, display) in enumerate(cities, 1):
+        if weather_data is None:
+            continue
 
-                date = time.strftime('%a %d', time.localtime(day.dt))
-                pop = day.pop * 100
+        if city_number == 1:
+            y_position = layout.forecast_header_y
 
-                max_color, outline_color, icon = temp_color(day.temp.max)
-                min_color, outline_color, icon = temp_color(day.temp.min)
+            header_x_position = layout.x(5)
+            for day in weather_data.daily[1:]: # Draw the header, skipping the first day
+                header_x_position += column_width
+                with layout.section(canvas, 'forecast_header'):
+                    canvas.text((header_x_position, y_position), day.label, 'red',
+                                layout.forecast_header, stroke_width=layout.stroke(1),
+                                stroke_fill='black')
+
+        x_position = layout.x(5)
+        row = layout.forecast_rows[city_number - 1]
+        y_spacing = layout.scaled(5)
+
+        for index, day in enumerate(weather_data.daily):
+            if index == 0:
+                continue # Skip the first day
+            x_position += column_width
+            y_position = row
+
+            with layout.section(canvas, 'forecast_day', (x_position, y_position)):
+                pop = round(day.pop_raw * 100)
+
+                day_max = display.daily_max[index]
+                day_min = display.daily_min[index]
+                max_color, outline_color, icon = temp_color(day_max, layout.color_table)
+                min_color, outline_color, icon = temp_color(day_min, layout.color_table)
 
                 ### MAX TEMP ###
-                section_font = mid_number
+                section_font = layout.mid_number
 
-                daily_max = f"{type_int(day.temp.max):.0f}"
-                text = f"{daily_max}"
-                draw.text((x_position, y_position), text, max_color, section_font,
-                          stroke_width=2, stroke_fill='black')
+                text = "--" if day_max is None else f"{day_max}"
+                canvas.text((x_position, y_position), text, max_color, section_font,
+                            stroke_width=layout.stroke(2), stroke_fill='black')
                 daily_max_width, daily_max_height = get_size(section_font, text)
                 temp_x_position = x_position + daily_max_width
 
                 text = "/"
-                draw.text((temp_x_position, y_position), text, 'black', section_font)
+                canvas.text((temp_x_position, y_position), text, 'black', section_font)
                 separator_width, separator_height = get_size(section_font, text)
                 temp_x_position += separator_width
 
                 ### MIN TEMP ###
-                text = f"{type_int(day.temp.min):.0f}°F"
-                draw.text((temp_x_position, y_position), text, min_color, section_font,
-                          stroke_width=2, stroke_fill='black')
-                dummy_width, text_height = get_size(section_font, text)
+                text = display.temp_text(day_min)
+                canvas.text((temp_x_position, y_position), text, min_color, section_font,
+                            stroke_width=layout.stroke(2), stroke_fill='black')
+                # Measured on a digit, so a missing temperature's "--" keeps the row height
+                dummy_width, text_height = get_size(section_font, "0")
 
                 ### WEATHER DESCRIPTION ###
-                section_font = forecast_paragraph
+                section_font = layout.forecast_paragraph
                 text = f"{day.weather.description}"
                 y_position += text_height + y_spacing
                 position = x_position, y_position # Use tuple since it's coded twice
 
                 # Dynamic font size, since description can vary wildly in length
                 overide_font_size = False
-                temp_font_size = 14
+                temp_font_size = layout.font_size(14)
                 text_width, text_height = get_size(section_font, text)
                 if text_width > column_width:
                     overide_font_size = True
@@ -418,43 +763,260 @@ def render_pil(city_one_name, city_one_weather, out, city_two_name = None, city_
 
                 # Used two draw commands instead of temporarily overwriting the section_font
                 if overide_font_size:
-                    draw.text(position, text, 'black', temp_font)
+                    canvas.text(position, text, 'black', temp_font)
                     overide_font_size = False
                 else:
-                    draw.text(position, text, 'black', section_font)
+                    canvas.text(position, text, 'black', section_font)
 
                 ### POP ###
                 text = f"{type_int(pop)}% precip."
                 y_position += text_height + y_spacing
-                draw.text((x_position, y_position), text, 'black', section_font)
+                canvas.text((x_position, y_position), text, 'black', section_font)
                 text_width, text_height = get_size(section_font, text)
 
                 ### WIND SPEED ###
-                text = f"{type_int(day.wind_speed):.0f}mph"
+                text = display.speed_text(display.daily_wind_speed[index])
                 y_position += text_height + y_spacing
-                draw.text((x_position, y_position), text, 'black', section_font)
+                canvas.text((x_position, y_position), text, 'black', section_font)
+
+def draw_alerts(canvas, layout, alerts):
+    """ Draw the alert band, which takes priority over the date and time header """
+    with layout.section(canvas, 'alerts'):
+        draw_alert_band(canvas, alerts, layout)
+
+def run_job(display_list, static):
+    """ Rasterize one render job's display list over the static layer, in a worker process
+
+    Each worker keeps its own static layer cache, so in daemon mode the layer is rasterized
+    once per worker.
+
+    Returns:
+        tuple: The layer, and the worker's counter increments (see metrics.take_counters).
+    """
+    layer = display_list.rasterize(static_layer(static).copy())
+    return layer, metrics.take_counters()
+
+def ink_mask(layer, base):
+    """ Return a mask of the pixels that were drawn over the base image (any channel differs) """
+    red, green, blue = ImageChops.difference(layer, base).split()
+    drawn = ImageChops.lighter(ImageChops.lighter(red, green), blue)
+    return drawn.point(lambda value: 255 if value else 0)
+
+def composite_layers(jobs, results, static):
+    """
+    Paste the layers of parallel render jobs together in job order, over the static layer.
+
+    A job with an opaque box (the alert band) covers that whole box, so its box is pasted as
+    is; any other job contributes only the pixels it drew. This gives the same bytes as
+    drawing the jobs in turn on one canvas, provided no two jobs draw on the same pixel.
 
-        ### CITY FORECAST DATA ###
-        y_position = header_one_height - 35
-        draw_city_data(5, city_one_name, city_one_weather, draw, y_position)
+    Returns:
+        Image: The frame, or None if two jobs drew on the same pixel (e.g. a long summary
+               running into the other city's panel), in which case anti-aliased edges would
+               differ and the frame has to be drawn sequentially instead.
+    """
+    canvas = static.copy()
+    drawn = Image.new('L', static.size, 0)
+    for (display_list, opaque_box), layer in zip(jobs, results):
+        if opaque_box:
+            canvas.paste(layer.crop(opaque_box), opaque_box[:2])
+            drawn.paste(255, opaque_box)
+            continue
+        mask = ink_mask(layer, static)
+        if ImageChops.multiply(mask, drawn).getbbox():
+            return None
+        canvas.paste(layer, (0, 0), mask)
+        drawn = ImageChops.lighter(drawn, mask)
+    return canvas
+
+def get_pool(workers):
+    """ Return the process pool for parallel renders, creating it and starting its workers
+    on first use
+
+    Workers are forked, so they start with this module already imported, and forking a
+    process while other threads run can deadlock the child: call this at startup, before
+    the log listener or any stage thread starts. The pool keeps the size it was created
+    with for the life of the process, so a later call never forks again.
+    """
+    global _pool
+    if _pool is None:
+        _pool = concurrent.futures.ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context('fork'))
+        # The first task forks every worker, now rather than from a render stage's thread
+        _pool.submit(int).result()
+    return _pool
+
+def shutdown_pool():
+    """ Stop the render worker processes, e.g. before the watchdog re-executes the process """
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def layout_frame(city_one_name, city_one_weather, out, city_two_name = None,
+                 city_two_weather = None, color_theme=None, unit_system='imperial', now=None,
+                 size=(800, 480)):
+    """
+    The layout pass: measure and place everything on the frame, recording it as display
+    lists with the fonts, positions and colours resolved, without drawing a pixel.
 
-        if city_two_weather:
-            draw_city_data(int(max_width / 2), city_two_name, city_two_weather, draw, y_position, 2)
+    The frame is the static layer (the city names and the labels, which only change with
+    the configuration) and independent jobs over it: each city panel (the first with the
+    header), the forecast strip and the alert band. A failed section is logged and counted,
+    and is recorded as a placeholder.
 
-        ### ACTUAL RENDERING ###
-        canvas.save("pil-text.png", "PNG")
+    Args:
+        See compose_pil.
 
-        inky = auto(ask_user=True, verbose=True)
-        saturation = 1
+    Returns:
+        tuple: The static layer's DisplayList, and the jobs as (DisplayList, opaque box)
+               pairs; a job with an opaque box covers that whole box (see composite_layers).
+    """
+    layout = Layout(unit_system, color_theme, out.logger, size)
+
+    local_now = time.localtime(now)
+    date = time.strftime("%B %-d", local_now)
+    weekday = time.strftime("%a", local_now)
+    load_time = time.strftime("%-I:%M %p", local_now)
+    date_stamp = f"{weekday}, {date}".upper()
+    time_stamp = f"CONDITIONS AS OF {load_time}"
+
+    cities = [(layout.x(5), city_one_name, city_one_weather)]
+    if city_two_name:
+        cities.append((int(layout.max_width / 2), city_two_name, city_two_weather))
+
+    displays = []
+    for x_position, city_name, weather_data in cities:
+        display = None
+        if weather_data is not None:
+            with layout.section(None, 'units'):
+                display = units.DisplayWeather(weather_data, layout.units)
+        displays.append(display)
+
+    static = displaylist.DisplayList(size)
+    draw_static(static, layout, [(x_position, city_name, weather_data is not None)
+                                 for x_position, city_name, weather_data in cities])
+
+    # Each job is a list of (draw function, arguments) steps and an opaque box, and
+    # draws on pixels no other job draws on (see composite_layers). The header shares
+    # a job with city one, so a dual frame is three jobs
+    panels = [[(draw_city_data, (x_position, city_name, weather_data, display))]
+              for (x_position, city_name, weather_data), display in zip(cities, displays)]
+    panels[0].insert(0, (draw_header, (date_stamp, time_stamp)))
+    steps = [(job_steps, None) for job_steps in panels]
+    steps.append(([(draw_forecast, ([(city_name, weather_data, display) for
+                                    (x_position, city_name, weather_data), display
+                                    in zip(cities, displays)],))], None))
+
+    ### ALERTS ###
+    # Drawn last, over the header, so active alerts take priority over the date and time
+    alerts = city_alerts((city_one_name, city_one_weather), (city_two_name, city_two_weather))
+    if alerts:
+        steps.append(([(draw_alerts, (alerts,))], (0, 0, layout.max_width, layout.band_height)))
+
+    jobs = []
+    for job_steps, opaque_box in steps:
+        display_list = displaylist.DisplayList(size)
+        for func, args in job_steps:
+            func(display_list, layout, *args)
+        jobs.append((display_list, opaque_box))
+
+    for name, error in layout.failures:
+        out.logger.error("Error rendering the %s section", name)
+        out.logger.error(error)
+        metrics.increment('render_section_failures', section=name)
+
+    return static, jobs
+
+def rasterize_frame(static, jobs, out, workers=1, palette=None):
+    """
+    The rasterizer: replay the display lists of a frame onto a copy of the static layer.
 
-        image = Image.open("pil-text.png")
-        resizedimage = image.resize(inky.resolution)
+    With more than one worker the jobs are rasterized on copies of the static layer in a
+    process pool and composited; the result is byte-identical to replaying them in turn.
+    A frame in a palette is always replayed in turn, since it is only drawn that way to
+    save memory, which a copy of the frame per worker would undo.
 
-        inky.set_image(resizedimage, saturation=saturation)
-        canvas.show()
-        inky.show()
+    Args:
+        static (DisplayList): The static layer.
+        jobs (list): (DisplayList, opaque box) pairs, as returned by layout_frame.
+        out: The output object.
+        workers (int, optional): The number of processes to rasterize the jobs on.
+                                 Defaults to 1, which replays them in turn in this process.
+        palette (tuple, optional): The panel's inks, to draw a 'P' frame in instead of RGB.
+
+    Returns:
+        Image: The frame.
+    """
+    canvas = None
+    if workers > 1 and palette is None:
+        pool = get_pool(workers)
+        results = []
+        for layer, counts in pool.map(run_job, [display_list for display_list, opaque_box in jobs],
+                                      itertools.repeat(static)):
+            metrics.add_counters(counts)
+            results.append(layer)
+        canvas = composite_layers(jobs, results, static_layer(static))
+        if canvas is None:
+            out.logger.info("Render jobs overlap; drawing them in turn instead")
+
+    if canvas is None:
+        canvas = static_layer(static, palette).copy()
+        for display_list, opaque_box in jobs:
+            display_list.rasterize(canvas)
+    return canvas
+
+def compose_pil(city_one_name, city_one_weather, out, city_two_name = None, city_two_weather = None,
+                color_theme=None, unit_system='imperial', now=None, workers=1, size=(800, 480),
+                palette=None):
+    """
+    Render text to image using PIL, in two passes: layout_frame records the frame as
+    display lists, and rasterize_frame replays them.
+
+    Args:
+        city_one_name (str): The name of the first city.
+        city_one_weather: The weather data for the first city.
+        out: The output object.
+        city_two_name (str, optional): The name of the second city. Defaults to None.
+        city_two_weather (optional): The weather data for the second city. Defaults to None.
+        color_theme (str, optional): The temperature colour theme. Defaults to the theme
+                                     matching the unit system.
+        unit_system (str, optional): The display units, 'imperial' or 'metric'.
+        now (float, optional): The epoch time to stamp the frame with. Defaults to now.
+        workers (int, optional): The number of processes to rasterize on. Defaults to 1,
+                                 which rasterizes in this process.
+        size (tuple, optional): The panel resolution, which the frame is drawn at natively.
+        palette (tuple, optional): The panel's inks, to draw a 'P' frame in instead of RGB.
+
+    Returns:
+        Image: The rendered frame.
+
+    Raises:
+        Exception: Any rendering error, after it has been logged.
+    """
+    global _last_display_list
+    out.logger.info("Rendering weather data to image using PIL")
+
+    try:
+        static, jobs = layout_frame(city_one_name, city_one_weather, out, city_two_name,
+                                    city_two_weather, color_theme, unit_system, now, size)
+
+        # Comparing the whole frame's draw ops is only worth it when the result is logged
+        if out.logger.isEnabledFor(logging.DEBUG):
+            frame = displaylist.DisplayList(size, static.ops + [
+                op for display_list, opaque_box in jobs for op in display_list.ops])
+            if _last_display_list is not None:
+                out.logger.debug("%s of %s draw ops changed since the last frame",
+                                 len(frame.diff(_last_display_list)), len(frame.ops))
+            _last_display_list = frame
+        else:
+            _last_display_list = None
+
+        canvas = rasterize_frame(static, jobs, out, workers, palette)
 
     except Exception:
         out.logger.critical("Error rendering weather data to image using PIL")
         out.logger.critical(traceback.format_exc())
-        sys.exit()
+        raise
+
+    return canvas
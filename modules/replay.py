@@ -0,0 +1,229 @@
+""" Batch replay of recorded One Call responses: renders the frames the panel showed (or would
+ show with the current layout) through headless sinks on a process pool, as a numbered image
+ sequence and optionally an animated WebP """
+
+import os                   # for the input and output paths
+import io                   # for opening the frame files without holding them open
+import json                 # for reading the recorded responses
+import time                 # for timing the replay
+import collections          # for the window of frames in flight
+import itertools            # for grouping the records of a cycle
+from PIL import Image       # for assembling the animated WebP
+
+import modules.weather as weather   # for parsing the recorded responses
+import modules.render as render     # for the frames and the render worker pool
+import modules.display as display   # for the headless sink each frame is drawn through
+import modules.geocoder as geocoder # for naming a city from a bare response's coordinates
+import modules.panels as panels     # for the panel the frames are drawn for
+
+FRAME_NAME = "frame_{:06d}.png"
+PENDING_NAME = "pending_{:06d}.png"
+# A bare response (with no city name recorded) is named after the gazetteer place this close
+PLACE_RADIUS_KM = 50
+
+class Record:
+    """ Custom object to store one recorded response: the cities it was for, when the cycle
+    that fetched it started (the time its frame is stamped with), and the cities that frame
+    showed, in order, when they were recorded """
+    def __init__(self, cities, time, response, frame=None):
+        self.cities = cities
+        self.time = time
+        self.response = response
+        self.frame = frame
+
+class ReplayResult:
+    """ Custom object to store the outcome and timing of a replay """
+    def __init__(self):
+        self.frames = 0
+        self.failed = 0
+        self.seconds = 0.0
+
+    @property
+    def frames_per_second(self):
+        """ The rendering throughput, frames written over the wall-clock time of the replay """
+        return self.frames / self.seconds if self.seconds else 0.0
+
+def place_name(response):
+    """ Name the city of a response that was recorded without one: the nearest gazetteer
+    place, else the city of its timezone (e.g. 'America/New_York' gives 'New York') """
+    try:
+        place = geocoder.open_gazetteer().nearest(response['lat'], response['lon'],
+                                                  PLACE_RADIUS_KM)
+    except (OSError, KeyError, ValueError):
+        place = None
+    if place:
+        return place.name
+    return response.get('timezone', 'Unknown').split('/')[-1].replace('_', ' ')
+
+def as_record(data):
+    """ Read one recorded item: a record written by weather.archive_response, or a bare One
+    Call response (e.g. a file from the cache), which is stamped with its observation time """
+    if 'response' in data:
+        return Record(data['cities'], data['time'], data['response'], data['frame'])
+    return Record([place_name(data)], data['current']['dt'], data)
+
+def read_records(path):
+    """
+    Stream the recorded responses from a JSONL file (a record or response per line, in
+    order) or a directory of .json files (one each, in the order of their names), reading
+    one at a time so that memory does not grow with the input.
+
+    Raises:
+        OSError: If the path cannot be read.
+        ValueError: If an item is not JSON, or not a response.
+    """
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            if name.endswith('.json'):
+                with open(os.path.join(path, name), encoding='utf-8') as file:
+                    yield as_record(json.load(file))
+        return
+    with open(path, encoding='utf-8') as file:
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                yield as_record(json.loads(line))
+            except (ValueError, KeyError) as error:
+                raise ValueError(f"{path} line {number}: not a recorded response "
+                                 f"({error})") from error
+
+def replay_frames(records, cities=None):
+    """
+    Turn a stream of records into frames the way daemon mode does: the records of one cycle
+    (those with the same time) make one frame, and a city that was not fetched in a cycle
+    is shown from its latest earlier response. A cycle that fetched none of the shown cities
+    makes no frame.
+
+    Args:
+        records: Record objects, in the order they were fetched.
+        cities (list, optional): The names of the one or two cities to show, in order.
+                                 Defaults to the cities of the first cycle's frame (for bare
+                                 responses, the cities of the first cycle's responses).
+
+    Yields:
+        tuple: The time to stamp the frame with, and its (name, response) pairs.
+    """
+    latest = {}
+    shown = list(cities) if cities else None
+    for cycle_time, cycle in itertools.groupby(records, key=lambda record: record.time):
+        cycle = list(cycle)
+        if shown is None:
+            shown = list(cycle[0].frame or dict.fromkeys(
+                name for record in cycle for name in record.cities))[:2]
+        fetched = False
+        for record in cycle:
+            for name in record.cities:
+                if name in shown:
+                    latest[name] = record.response
+                    fetched = True
+        if fetched and all(city in latest for city in shown):
+            yield cycle_time, [(city, latest[city]) for city in shown]
+
+def render_replay_frame(path, now, cities, out, profile, unit_system, color_theme, low_memory):
+    """ Parse one frame's responses and draw it to a PNG, in a render worker
+
+    Returns:
+        bool: True if the frame was written; failures are logged.
+    """
+    try:
+        parsed = [(name, weather.WeatherData(response)) for name, response in cities]
+    except Exception:
+        out.logger.exception("Error parsing the responses for the frame at %s", now)
+        return False
+    city_one_name, city_one_weather = parsed[0]
+    city_two_name, city_two_weather = parsed[1] if len(parsed) > 1 else (None, None)
+    sink = display.HeadlessSink(path, profile)
+    return render.render_pil(city_one_name, city_one_weather, out, city_two_name,
+                             city_two_weather, color_theme, unit_system, sink=sink, now=now,
+                             low_memory=low_memory)
+
+def replay(records, output_dir, out, workers=1, cities=None, profile=panels.DEFAULT_PROFILE,
+           unit_system='imperial', color_theme=None, low_memory=False):
+    """
+    Render the frames of a stream of records to output_dir as frame_000000.png onwards.
+
+    Frames are rendered on the render worker pool, one whole frame per worker, with at most
+    two per worker in flight, and only their paths come back; so memory stays flat however
+    long the input is. Frames are numbered in order, without gaps for the ones that fail.
+
+    Args:
+        records: Record objects, e.g. from read_records.
+        output_dir (str): The folder to write the frames to.
+        out: The output object.
+        workers (int, optional): The number of render processes. Defaults to 1.
+        cities (list, optional): See replay_frames.
+        profile (PanelProfile, optional): The panel to draw the frames for.
+        unit_system (str, optional): The display units, 'imperial' or 'metric'.
+        color_theme (str, optional): The temperature colour theme.
+        low_memory (bool, optional): Draw the frames in the panel's inks, as lowMemory does.
+
+    Returns:
+        ReplayResult: The number of frames written and failed, and the time taken.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    result = ReplayResult()
+    start = time.perf_counter()
+    pool = render.get_pool(workers) if workers > 1 else None
+    in_flight = collections.deque()
+
+    def collect(pending_path, rendered):
+        if rendered:
+            os.replace(pending_path, os.path.join(output_dir, FRAME_NAME.format(result.frames)))
+            result.frames += 1
+        else:
+            result.failed += 1
+            if os.path.exists(pending_path):
+                os.remove(pending_path)
+
+    for index, (now, frame_cities) in enumerate(replay_frames(records, cities)):
+        pending_path = os.path.join(output_dir, PENDING_NAME.format(index))
+        arguments = (pending_path, now, frame_cities, out, profile, unit_system, color_theme,
+                     low_memory)
+        if pool is None:
+            collect(pending_path, render_replay_frame(*arguments))
+            continue
+        in_flight.append((pending_path, pool.submit(render_replay_frame, *arguments)))
+        if len(in_flight) >= 2 * workers:
+            pending_path, future = in_flight.popleft()
+            collect(pending_path, future.result())
+    while in_flight:
+        pending_path, future = in_flight.popleft()
+        collect(pending_path, future.result())
+
+    result.seconds = time.perf_counter() - start
+    out.logger.info("Replayed %d frames (%d failed) in %.1f seconds, %.2f frames per second",
+                    result.frames, result.failed, result.seconds, result.frames_per_second)
+    return result
+
+def open_frame(path):
+    """ Open a frame file for the WebP encoder without decoding it yet, or keeping the file
+    open (an archive can make more frames than the process may have open files) """
+    with open(path, 'rb') as file:
+        return Image.open(io.BytesIO(file.read()))
+
+def frame_paths(output_dir, count):
+    """ The paths of the first count frames replay wrote to output_dir """
+    return [os.path.join(output_dir, FRAME_NAME.format(index)) for index in range(count)]
+
+def write_webp(paths, path, frame_ms=500, lossless=True):
+    """
+    Assemble frame files into an animated WebP. The frames are decoded as the encoder
+    reaches them, but Pillow holds on to each one until the file is written, so this takes
+    about 1 MB a frame at 800x480.
+
+    Args:
+        paths (list): The frame files, in order.
+        path (str): The WebP file to write.
+        frame_ms (int, optional): How long each frame is shown, in milliseconds.
+        lossless (bool, optional): Keep the inks exact, which also suits the flat colours
+                                   of a frame best.
+
+    Raises:
+        ValueError: If there are no frames.
+    """
+    if not paths:
+        raise ValueError("No frames to write")
+    open_frame(paths[0]).save(path, 'WEBP', save_all=True,
+                              append_images=(open_frame(frame) for frame in paths[1:]),
+                              duration=frame_ms, loop=0, lossless=lossless, method=0)
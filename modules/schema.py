@@ -0,0 +1,85 @@
+""" Declarative field schemas for the One Call response, compiled into plain parsing
+ functions so a missing field takes its default instead of raising a KeyError """
+
+class Field:
+    """
+    Custom object to describe one attribute of a parsed object.
+
+    Parameters:
+    attr (str): The attribute to set on the parsed object.
+    key (str, optional): The JSON key to read. Defaults to attr.
+    converter (callable, optional): Applied to the JSON value. Defaults to using it as is.
+    default (any, optional): Used when the key is absent or null. Defaults to None.
+    convert_missing (bool, optional): Call the converter with None instead of using the
+                                      default, e.g. to build an empty nested object.
+    """
+    def __init__(self, attr, key=None, converter=None, default=None, convert_missing=False):
+        self.attr = attr
+        self.key = key or attr
+        self.converter = converter
+        self.default = default
+        self.convert_missing = convert_missing
+
+def build_parser(cls, fields, name):
+    """
+    Generate a parsing function for a schema.
+
+    The function is generated as straight-line Python source (one dict subscript per JSON
+    key and one attribute store per field, with no per-field loop or dispatch) and compiled
+    once at import. The object is created without calling cls.__init__, so every attribute
+    that __init__ would set and the schema does not mention is set to None explicitly.
+
+    Parameters:
+    cls (type): The class to instantiate, e.g. CurrentWeather.
+    fields (list): The Field objects describing its attributes.
+    name (str): The name of the generated function, for tracebacks.
+
+    Returns:
+    function: parse(data) -> cls instance, where data is a dict (or None for all defaults).
+    """
+    namespace = {'_cls': cls}
+    keys = list(dict.fromkeys(field.key for field in fields))
+    key_names = {key: f"value_{index}" for index, key in enumerate(keys)}
+
+    # Fast path: every key is present, so plain subscripts do the lookups. A missing key
+    # falls through to .get(), which yields None and so the field's default.
+    body = ["    try:"]
+    body += [f"        {key_names[key]} = data[{key!r}]" for key in keys]
+    body += ["    except (KeyError, TypeError):",
+             "        get = (data or {}).get"]
+    body += [f"        {key_names[key]} = get({key!r})" for key in keys]
+    body.append("    obj = _cls.__new__(_cls)")
+
+    for index, field in enumerate(fields):
+        value = key_names[field.key]
+        if field.converter:
+            namespace[f"_convert_{index}"] = field.converter
+        if field.default is not None:
+            namespace[f"_default_{index}"] = field.default
+
+        if field.converter and field.convert_missing:
+            expression = f"_convert_{index}({value})"
+        elif field.converter and field.default is not None:
+            expression = f"_default_{index} if {value} is None else _convert_{index}({value})"
+        elif field.converter:
+            expression = f"None if {value} is None else _convert_{index}({value})"
+        elif field.default is not None:
+            expression = f"_default_{index} if {value} is None else {value}"
+        else:
+            expression = value
+        body.append(f"    obj.{field.attr} = {expression}")
+
+    covered = {field.attr for field in fields}
+    for attr in vars(cls()):
+        if attr not in covered:
+            body.append(f"    obj.{attr} = None")
+    body.append("    return obj")
+
+    # The converters, defaults and class are bound as keyword defaults, so the generated
+    # code reads them as fast locals rather than globals
+    parameters = ", ".join(["data"] + [f"{name}={name}" for name in namespace])
+    source = "\n".join([f"def {name}({parameters}):"] + body) + "\n"
+    exec(compile(source, f"<schema {name}>", "exec"), namespace)
+    parser = namespace[name]
+    parser.source = source
+    return parser
@@ -0,0 +1,179 @@
+""" Golden-image regression checks for the renderer: renders fixture One Call responses
+ through a headless sink and compares the frames against stored PNGs """
+
+import json                 # for reading the fixture cases and responses
+import os                   # for building fixture and golden paths
+import time                 # for timing each render, and pinning the render timezone
+import numpy as np          # for the pixel and perceptual diffs
+from PIL import Image       # for loading and saving golden images
+
+import modules.weather as weather   # for parsing the fixture responses
+import modules.render as render     # for composing the frames under test
+import modules.panels as panels     # for the panel resolution of each case
+
+SNAPSHOT_DIR = 'snapshots'
+FIXTURE_DIR = os.path.join(SNAPSHOT_DIR, 'fixtures')
+GOLDEN_DIR = os.path.join(SNAPSHOT_DIR, 'golden')
+FAILURE_DIR = os.path.join(SNAPSHOT_DIR, 'failures')
+CASES_FILE = os.path.join(SNAPSHOT_DIR, 'cases.json')
+
+# A pixel counts as changed when any channel moves by more than this (0-255)
+PIXEL_THRESHOLD = 16
+# Luminance weights used for the perceptual comparison (ITU-R BT.601)
+LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114])
+
+class DiffResult:
+    """ Custom object to store the outcome of comparing a frame against its golden image """
+    def __init__(self):
+        self.size_mismatch = False
+        self.max_delta = 0
+        self.changed_fraction = 0.0
+        self.perceptual = 0.0
+        self.diff_image = None
+
+    def passed(self, tolerance, perceptual_tolerance):
+        """ True when the changed pixel fraction and the perceptual error are both in tolerance """
+        return (not self.size_mismatch
+                and self.changed_fraction <= tolerance
+                and self.perceptual <= perceptual_tolerance)
+
+class CaseResult:
+    """ Custom object to store the outcome and timing of one fixture case """
+    def __init__(self, name):
+        self.name = name
+        self.render_seconds = None
+        self.diff = None
+        self.status = None
+
+def box_blur(values, radius):
+    """ Mean filter a 2D array over a (2 * radius + 1) square window using summed-area tables """
+    if radius <= 0:
+        return values
+    size = 2 * radius + 1
+    padded = np.pad(values, radius, mode='edge')
+    summed = np.pad(padded.cumsum(axis=0).cumsum(axis=1), ((1, 0), (1, 0)))
+    window = (summed[size:, size:] - summed[:-size, size:]
+              - summed[size:, :-size] + summed[:-size, :-size])
+    return window / (size * size)
+
+def image_diff(actual, expected, blur_radius=1):
+    """
+    Compare two frames pixel by pixel and perceptually.
+
+    The perceptual score is the largest luminance difference (0-1) after both frames are
+    box blurred, so one-pixel anti-aliasing shifts score low while a missing or recoloured
+    glyph scores high.
+
+    Args:
+        actual (Image): The frame that was just rendered.
+        expected (Image): The golden frame.
+        blur_radius (int, optional): The blur radius for the perceptual score.
+
+    Returns:
+        DiffResult: The comparison metrics, with a diff image highlighting changed pixels.
+    """
+    result = DiffResult()
+    if actual.size != expected.size:
+        result.size_mismatch = True
+        return result
+
+    actual_pixels = np.asarray(actual.convert('RGB'), dtype=np.int16)
+    expected_pixels = np.asarray(expected.convert('RGB'), dtype=np.int16)
+    delta = actual_pixels - expected_pixels
+
+    channel_delta = np.abs(delta).max(axis=2)
+    changed = channel_delta > PIXEL_THRESHOLD
+    result.max_delta = int(channel_delta.max())
+    result.changed_fraction = float(changed.mean())
+
+    luma_delta = box_blur(delta @ LUMA_WEIGHTS, blur_radius)
+    result.perceptual = float(np.abs(luma_delta).max() / 255)
+
+    if changed.any():
+        highlight = (expected_pixels // 3 + 170).astype(np.uint8)
+        highlight[changed] = (255, 0, 0)
+        result.diff_image = Image.fromarray(highlight, 'RGB')
+    return result
+
+def load_cases(cases_file=CASES_FILE):
+    """ Read the list of fixture cases; each names its cities, response files, units and time """
+    with open(cases_file, encoding='utf-8') as file:
+        return json.load(file)
+
+def render_case(case, out, workers=1):
+    """ Parse a case's fixture responses and compose its frame through a headless sink
+
+    Returns:
+        tuple: The rendered Image and the render time in seconds (parsing excluded).
+    """
+    cities = []
+    for city_name, response_file in case['cities']:
+        with open(os.path.join(FIXTURE_DIR, response_file), encoding='utf-8') as file:
+            cities.append((city_name, weather.WeatherData(json.load(file))))
+
+    city_one_name, city_one_weather = cities[0]
+    city_two_name, city_two_weather = cities[1] if len(cities) > 1 else (None, None)
+
+    sink = render.display.HeadlessSink(
+        profile=panels.get_profile(case.get('panel', 'impression-7.3')))
+    start = time.perf_counter()
+    render.render_pil(city_one_name, city_one_weather, out, city_two_name, city_two_weather,
+                      case.get('colorTheme'), case.get('units', 'imperial'),
+                      sink=sink, now=case['now'], workers=workers,
+                      low_memory=case.get('lowMemory', False))
+    return sink.frame, time.perf_counter() - start
+
+def run_cases(out, update=False, tolerance=0.002, perceptual_tolerance=0.05, names=None,
+              workers=1):
+    """
+    Render every fixture case and compare it to its golden image.
+
+    Frames are composed in UTC, so the goldens do not depend on the machine's timezone.
+    Failing cases get their frame and a diff image written to the failures folder.
+
+    Args:
+        out: The output object.
+        update (bool, optional): Overwrite the goldens with the new frames instead of comparing.
+        tolerance (float, optional): The largest allowed fraction of changed pixels.
+        perceptual_tolerance (float, optional): The largest allowed perceptual error (0-1).
+        names (list, optional): Only run the cases with these names.
+        workers (int, optional): The number of render processes, to check that the parallel
+                                 renderer matches the goldens too.
+
+    Returns:
+        list: A CaseResult per case that was run.
+    """
+    os.environ['TZ'] = 'UTC'
+    time.tzset()
+
+    results = []
+    for case in load_cases():
+        if names and case['name'] not in names:
+            continue
+        result = CaseResult(case['name'])
+        frame, result.render_seconds = render_case(case, out, workers)
+        golden_path = os.path.join(GOLDEN_DIR, f"{case['name']}.png")
+
+        if update:
+            os.makedirs(GOLDEN_DIR, exist_ok=True)
+            frame.save(golden_path, "PNG")
+            result.status = 'updated'
+        elif not os.path.exists(golden_path):
+            result.status = 'missing'
+        else:
+            with Image.open(golden_path) as golden:
+                result.diff = image_diff(frame, golden)
+            if result.diff.passed(tolerance, perceptual_tolerance):
+                result.status = 'passed'
+            else:
+                result.status = 'failed'
+                os.makedirs(FAILURE_DIR, exist_ok=True)
+                frame.save(os.path.join(FAILURE_DIR, f"{case['name']}.png"), "PNG")
+                if result.diff.diff_image:
+                    result.diff.diff_image.save(
+                        os.path.join(FAILURE_DIR, f"{case['name']}.diff.png"), "PNG")
+
+        out.logger.info("Snapshot %s: %s in %.3f seconds",
+                        result.name, result.status, result.render_seconds)
+        results.append(result)
+    return results
@@ -0,0 +1,92 @@
+""" Converts the canonical SI weather model (kelvin, metres per second) into the unit
+ system of a particular display, at render time """
+
+import numpy as np          # for converting every value of a response in one pass
+
+class UnitSystem:
+    """ Custom object to store how one display presents temperatures and speeds """
+    def __init__(self, name, temp_symbol, speed_symbol, temp_scale, temp_offset,
+                 speed_scale, color_theme):
+        self.name = name
+        self.temp_symbol = temp_symbol
+        self.speed_symbol = speed_symbol
+        self.temp_scale = temp_scale
+        self.temp_offset = temp_offset
+        self.speed_scale = speed_scale
+        self.color_theme = color_theme
+
+    def temperature(self, kelvin):
+        """ Convert kelvin (scalar or array) to this system's temperature unit """
+        return np.asarray(kelvin, dtype=float) * self.temp_scale + self.temp_offset
+
+    def speed(self, metres_per_second):
+        """ Convert metres per second (scalar or array) to this system's speed unit """
+        return np.asarray(metres_per_second, dtype=float) * self.speed_scale
+
+IMPERIAL = UnitSystem('imperial', '°F', 'mph', 9 / 5, -459.67, 2.2369362920544, 'fahrenheit')
+METRIC = UnitSystem('metric', '°C', 'km/h', 1, -273.15, 3.6, 'celsius')
+
+UNIT_SYSTEMS = {
+    'imperial': IMPERIAL,
+    'metric': METRIC,
+}
+
+def get_unit_system(name):
+    """ Return the UnitSystem for a config name (e.g. 'imperial', 'metric')
+
+    Raises:
+        KeyError: If the unit system is not defined.
+    """
+    return UNIT_SYSTEMS[name.lower()]
+
+def to_int(values):
+    """ Round an array to a list of whole display units; missing (NaN) values become None """
+    rounded = np.rint(values)
+    return [None if missing else int(value)
+            for value, missing in zip(rounded.tolist(), np.isnan(rounded).tolist())]
+
+class DisplayWeather:
+    """ Custom object to store one city's weather values converted for one display
+
+    Every temperature and every speed the panel shows is gathered into one array and
+    converted in a single vectorized pass, so a response can feed any number of displays
+    without being fetched or parsed again. Missing values come out as None.
+    """
+    def __init__(self, weather_data, unit_system):
+        self.units = unit_system
+
+        daily = weather_data.daily
+        day_count = len(daily)
+
+        temps = np.empty(2 + 2 * day_count)
+        temps[0] = weather_data.current.temp
+        temps[1] = weather_data.current.feels_like
+        temps[2:2 + day_count] = [day.temp.max for day in daily]
+        temps[2 + day_count:] = [day.temp.min for day in daily]
+        temps = unit_system.temperature(temps)
+
+        speeds = np.empty(1 + day_count)
+        speeds[0] = weather_data.current.wind_speed
+        speeds[1:] = [day.wind_speed for day in daily]
+        speeds = to_int(unit_system.speed(speeds))
+
+        whole_temps = to_int(temps)
+        self.current_temp = whole_temps[0]
+        self.current_feels_like = whole_temps[1]
+        self.daily_max = whole_temps[2:2 + day_count]
+        self.daily_min = whole_temps[2 + day_count:]
+
+        self.current_wind_speed = speeds[0]
+        self.daily_wind_speed = speeds[1:]
+
+    def temp_text(self, value):
+        """ Format a whole-unit temperature with this display's symbol, e.g. '72°F' """
+        if value is None:
+            return "--"
+        return f"{value}{self.units.temp_symbol}"
+
+    def speed_text(self, value):
+        """ Format a whole-unit speed with this display's symbol, e.g. '8mph' """
+        if value is None:
+            return "--"
+        return f"{value}{self.units.speed_symbol}"
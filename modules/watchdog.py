@@ -0,0 +1,75 @@
+""" Supervises the stages of the display pipeline: each stage runs against a deadline, and
+ a stage that is stuck (e.g. an SPI hang inside inky.show()) gets the process restarted """
+
+import os                   # for re-executing the process
+import sys                  # for the interpreter and arguments to re-execute with
+import threading            # for running a stage in a worker that can be abandoned
+import asyncio              # for awaiting stages from the pipeline's event loop
+import modules.metrics as metrics
+                            # for counting timeouts and restarts
+
+class StageTimeout(Exception):
+    """ Raised when a stage of the pipeline is still running after its deadline """
+    def __init__(self, stage, deadline):
+        super().__init__(f"The {stage} stage is still running after {deadline} seconds")
+        self.stage = stage
+
+async def run_stage(stage, deadline, func, *args):
+    """
+    Run the blocking func(*args) in a worker thread, and await it for at most deadline
+    seconds, so the event loop stays free while it runs.
+
+    Python cannot kill a thread, so a worker that misses the deadline, or whose caller is
+    cancelled, is abandoned (it is a daemon thread, so it will not hold up the exit) and
+    the caller decides whether to restart.
+
+    Args:
+        stage (str): The stage name, for the log and the stage_timeouts counter.
+        deadline (float): The number of seconds to wait.
+        func (callable): The stage to run.
+
+    Returns:
+        The return value of func.
+
+    Raises:
+        StageTimeout: If func is still running after the deadline.
+        Exception: Whatever func raised.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def settle(method, value):
+        if not future.done():
+            method(value)
+
+    def target():
+        try:
+            value = func(*args)
+        except BaseException as error:
+            outcome = future.set_exception, error
+        else:
+            outcome = future.set_result, value
+        try:
+            loop.call_soon_threadsafe(settle, *outcome)
+        except RuntimeError:
+            pass # The loop has closed; nobody is waiting any more
+
+    worker = threading.Thread(target=target, name=f'{stage}-stage', daemon=True)
+    worker.start()
+    try:
+        return await asyncio.wait_for(future, deadline)
+    except asyncio.TimeoutError:
+        metrics.increment('stage_timeouts', stage=stage)
+        raise StageTimeout(stage, deadline) from None
+
+def restart_process(out):
+    """ Replace the running process with a fresh copy of itself
+
+    A fresh process re-opens the SPI device, which is the only reliable way out of a hung
+    refresh. The counters and the log queue are flushed first.
+    """
+    metrics.increment('watchdog_restarts')
+    out.logger.critical("Watchdog restarting %s", " ".join(sys.argv))
+    metrics.save()
+    out.stop()
+    os.execv(sys.executable, [sys.executable] + sys.argv)
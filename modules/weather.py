@@ -2,20 +2,36 @@
 
 import traceback                                    # for printing exceptions
 import time                                         # for delaying prior to retrying failed calls
-import sys                                          # for exiting upon fatal exception
-from datetime import datetime                       # for formatting the time
+import os                                           # for the last-good response cache
+import json                                         # for the last-good response cache
+from datetime import datetime, timedelta, timezone  # for formatting the time in each city's zone
 import requests                                     # for making the OpenWeather API request
 import numpy as np                                  # for linear regression
-from sklearn.linear_model import LinearRegression   # for trend analysis
-                                                    #   https://scikit-learn.org/stable/install.html
-                                                    #   pip3 install scikit-learn`
+import modules.metrics as metrics                   # for counting API calls and errors
+from modules.schema import Field, build_parser      # for the generated response parsers
+
+CACHE_DIR = 'cache'
 
 ### MODULE FUNCTIONS
 
-def get_data(api_key, lati, long, out):
-    """ Get weather data from the OpenWeather API, return data in custom object """
+# The exclude parameter for a cheap call that returns only the alerts (and the location)
+ALERTS_ONLY = "current,minutely,hourly,daily"
+# The exclude parameter for the full payload, with the minutely nowcast
+WITH_MINUTELY = ""
+
+def get_data(api_key, lati, long, out, exclude="minutely"):
+    """ Get weather data from the OpenWeather API, return the decoded JSON response
+
+    Args:
+        exclude (str, optional): The comma-separated parts of the response to leave out.
+                                 Defaults to "minutely"; ALERTS_ONLY polls for alerts,
+                                 and WITH_MINUTELY adds the nowcast.
+
+    Returns:
+        dict: The One Call response, or None if the call failed twice.
+    """
 
-    endpoint = "https://api.openweathermap.org/data/3.0/onecall?"
+    endpoint = "https://api.openweathermap.org/data/3.0/onecall"
     api_call_timeout = 60
     retry_delay = 60
     retry = False
@@ -23,15 +39,19 @@ def get_data(api_key, lati, long, out):
     try:
         out.logger.info("Performing API call to %s", endpoint)
 
-        lat_long = "lat=" + lati + "&lon=" + long
-        appid = "&appid=" + api_key
-        exclude = "&exclude=minutely"
-        units = "&units=imperial"
-        url = endpoint + lat_long + exclude + appid + units
+        # The coordinates are numbers (validated, or from the gazetteer), formatted here
+        # rather than pasted in, and requests encodes every parameter.
+        # No units parameter: the default 'standard' units (kelvin, m/s) are kept as the
+        # canonical model, and each display converts them at render time (see units.py)
+        params = {'lat': f"{float(lati):.4f}", 'lon': f"{float(long):.4f}",
+                  'exclude': exclude, 'appid': api_key}
 
-        response = requests.get(url, timeout=api_call_timeout)
+        metrics.increment('api_calls')
+        response = requests.get(endpoint, params=params, timeout=api_call_timeout)
+        response.raise_for_status()
         data = response.json()
     except Exception:
+        metrics.increment('api_errors')
         message = "Error getting weather data; will retry API call after %s seconds..."
         out.logger.critical(message, retry_delay)
         out.logger.critical(traceback.format_exc())
@@ -41,46 +61,122 @@ def get_data(api_key, lati, long, out):
             try:
                 time.sleep(retry_delay)
                 out.logger.info("Retrying API call...")
-                response = requests.get(url, timeout=api_call_timeout)
+                metrics.increment('api_calls')
+                response = requests.get(endpoint, params=params, timeout=api_call_timeout)
+                response.raise_for_status()
                 data = response.json()
             except Exception:
-                message = "Weather data collection failed a second time! Exiting program."
+                metrics.increment('api_errors')
+                message = "Weather data collection failed a second time! Giving up on this city."
                 out.logger.critical(message)
                 out.logger.critical(traceback.format_exc())
-                sys.exit()
+                return None
 
     out.logger.debug("Weather data: %s", data)
     return data
 
+def cache_path(lati, long):
+    """ The file holding the last good response for a location """
+    return os.path.join(CACHE_DIR, f"onecall_{float(lati):.4f}_{float(long):.4f}.json")
+
+def save_response(data, lati, long, out):
+    """ Keep a response that parsed cleanly, as the fallback for a failed fetch """
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        temp_path = cache_path(lati, long) + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(data, file)
+        os.replace(temp_path, cache_path(lati, long))
+    except OSError:
+        out.logger.error("Error saving the weather data cache")
+        out.logger.error(traceback.format_exc())
+
+def archive_response(data, city_names, frame_names, cycle_time, path, out):
+    """
+    Append a response to the archive (a JSON line per fetch), which replay-render.py renders
+    the frames of again.
+
+    Args:
+        city_names (list): The configured cities the response is for (cities close enough
+                           to share a fetch share the response).
+        frame_names (list): Every configured city, in the order the frame shows them.
+        cycle_time (float): When the cycle that fetched it started; the responses of one
+                            cycle make one frame.
+    """
+    record = {'time': int(cycle_time), 'cities': city_names, 'frame': frame_names,
+              'response': data}
+    try:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(record, separators=(',', ':')) + "\n")
+    except OSError:
+        out.logger.error("Error appending the weather data to the archive")
+        out.logger.error(traceback.format_exc())
+
+def load_response(lati, long, out):
+    """ Return the last good response for a location, or None if there is none """
+    try:
+        with open(cache_path(lati, long), encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        out.logger.warning("No cached weather data for %s, %s", lati, long)
+        return None
+
 def log_data(data, out):
     """ Log some general weather data for debugging purposes """
     out.logger.info("Weather data received")
-    out.logger.debug(f"{data.lat}, {data.lon}, {data.timezone}, {data.timezone_offset}")
-    out.logger.debug(f"{data.current.weather.description}")
-    out.logger.debug(f"Temperature: {data.current.temp}, Feels Like: {data.current.feels_like}")
-    out.logger.debug(f"Pressure: {data.current.pressure}, Humidity: {data.current.humidity}")
-    out.logger.debug(f"Dew Point: {data.current.dew_point}, UVI: {data.current.uvi}")
-    out.logger.debug(f"Clouds: {data.current.clouds}, Visibility: {data.current.visibility}")
-    out.logger.debug(f"Wind: {data.current.wind_description}")
-    out.logger.debug(f"Sunrise: {data.current.sunrise}, Sunset: {data.current.sunset}")
+    out.logger.debug("%s, %s, %s, %s", data.lat, data.lon, data.timezone, data.timezone_offset)
+    out.logger.debug("%s", data.current.weather.description)
+    out.logger.debug("Temperature: %sK, Feels Like: %sK",
+                     data.current.temp, data.current.feels_like)
+    out.logger.debug("Pressure: %s, Humidity: %s", data.current.pressure, data.current.humidity)
+    out.logger.debug("Dew Point: %sK, UVI: %s", data.current.dew_point, data.current.uvi)
+    out.logger.debug("Clouds: %s, Visibility: %s", data.current.clouds, data.current.visibility)
+    out.logger.debug("Wind: %sm/s %s", data.current.wind_speed, data.current.wind_dir)
+    out.logger.debug("Sunrise: %s, Sunset: %s", data.current.sunrise, data.current.sunset)
     return
 
-def format_temp(temp):
-    """ Format temperature to remove extra decimal places and negative zero """
-    try:
-        temp = float(temp)
-    except ValueError:
-        temp = -99
-    formatted_temp = f"{temp:.0f}"
-    if formatted_temp == "-0":
-        return "0"
-    else:
-        return formatted_temp
-
-def format_clocktime(dt):
-    """ Format the time to remove seconds """
-    formatted_time = datetime.fromtimestamp(dt).strftime('%I:%M %p')
-    return formatted_time
+class CityClock:
+    """ Custom object to format timestamps in a city's own time zone
+
+    The zone comes from the response's timezone_offset, so a remote city's days and clock
+    times are its own rather than the Pi's. Each timestamp is converted once, while the
+    response is parsed, and the renderer uses the stored labels.
+    """
+    def __init__(self, offset=0):
+        self.offset = offset
+        self.zone = timezone(timedelta(seconds=offset))
+
+    def local(self, dt):
+        """ Convert a timestamp to an aware datetime in the city's zone """
+        return datetime.fromtimestamp(dt, self.zone)
+
+    def clocktime(self, dt):
+        """ Format a timestamp as the city's clock time without seconds, e.g. '06:42 AM' """
+        if dt is None:
+            return None
+        return self.local(dt).strftime('%I:%M %p')
+
+    def label_day(self, day):
+        """ Set a DailyWeather's calendar labels and clock times from its timestamps """
+        labels = ('', '', '', '')
+        if day.dt is not None:
+            # One conversion and one strftime for all four labels
+            labels = self.local(day.dt).strftime('%A|%d|%B|%a %d').split('|')
+        day.day, day.day_of_month, day.month, day.label = labels
+        day.sunrise = self.clocktime(day.sunrise)
+        day.sunset = self.clocktime(day.sunset)
+        day.moonrise = self.clocktime(day.moonrise)
+        day.moonset = self.clocktime(day.moonset)
+
+    def label_hour(self, hour):
+        """ Set an HourlyWeather's clock time from its timestamp """
+        hour.time = self.clocktime(hour.dt)
+
+    def label_alert(self, alert):
+        """ Set an Alert's end time from its timestamp """
+        alert.end_time = self.clocktime(alert.end) or ''
 
 def get_compass_direction(degrees):
     """ Convert degrees to textual compass direction """
@@ -92,26 +188,28 @@ def get_compass_direction(degrees):
     return directions[index]
 
 def identify_trend(data_list):
-    """ Identify the trending direction of the given attribute """
-    i = 0
-    x = []
-    y = data_list
+    """ Identify the trending direction of the given attribute
 
-    for iteration in data_list:
-        i += 1
-        x.append(i)
-        #print(f"x: {i}, y: {iteration}")
+    An ordinary least squares fit against the sample number (1, 2, ...), computed in closed
+    form with numpy rather than scikit-learn, whose import alone costs ~100 MB of memory.
+    """
+    y = np.asarray(data_list, dtype=float)
+    x = np.arange(1, len(y) + 1, dtype=float)
 
-    x_array = np.array(x)
-    reshaped_x = x_array.reshape(-1, 1)
+    x_offset = x - x.mean()
+    spread = np.dot(x_offset, x_offset)
+    slope = np.dot(x_offset, y - y.mean()) / spread if spread else 0.0
+    intercept = y.mean() - slope * x.mean()
 
-    model = LinearRegression().fit(reshaped_x, y)
+    # The coefficient of determination; a flat series is fitted perfectly
+    residual = np.sum((y - (slope * x + intercept)) ** 2)
+    total = np.sum((y - y.mean()) ** 2)
 
     trend = TrendInfo()
 
-    trend.slope = model.coef_
-    trend.intercept = model.intercept_
-    trend.r_value = model.score(reshaped_x, y)
+    trend.slope = float(slope)
+    trend.intercept = float(intercept)
+    trend.r_value = float(1 - residual / total) if total else 1.0
     trend.no_slope = trend.slope == 0
     trend.positive_trend = trend.slope > 0
     trend.direction = "up" if trend.positive_trend else "down"
@@ -137,129 +235,45 @@ class TrendInfo:
         self.no_slope = None
 
 class WeatherData:
-    """ Custom object to store the weather data returned by the API call """
+    """ Custom object to store the weather data returned by the API call
+
+    Parsing is driven by the field schemas at the bottom of this module; any field that
+    OpenWeather omits (wind_gust, visibility, summary, ...) takes its schema default.
+    """
     def __init__(self, json_response):
-        self.lat = json_response['lat']
-        self.lon = json_response['lon']
-        self.timezone = json_response['timezone']
-        self.timezone_offset = json_response['timezone_offset']
-        self.current = self._parse_current(json_response['current'])
-        self.daily = [self._parse_daily(daily) for daily in json_response['daily']]
-        self.hourly = [self._parse_hourly(hourly) for hourly in json_response['hourly']]
-
-    def _parse_current(self, current_data):
-        current = CurrentWeather()
-        current.dt = current_data['dt']
-        current.sunrise = current_data['sunrise']
-        current.sunset = current_data['sunset']
-        current.temp = format_temp(current_data['temp'])
-        current.feels_like = format_temp(current_data['feels_like'])
-        current.pressure = f"{current_data['pressure']} hPa"
-        current.humidity = f"{current_data['humidity']:.0f}%"
-        current.humidity_raw = current_data['humidity']
-        current.dew_point = format_temp(current_data['dew_point'])
-        current.uvi = current_data['uvi']
-        current.clouds = f"{current_data['clouds']:.0f}%"
-        current.visibility = f"{current_data['visibility']/100:.0f}%"
-        current.wind_speed = current_data['wind_speed']
-        current.wind_deg = current_data['wind_deg']
-        current.wind_dir = get_compass_direction(current_data['wind_deg'])
-        current.wind_description = f"{current.wind_speed}mph {current.wind_dir}"
-        current.weather = self._parse_weather(current_data['weather'])
-        return current
-
-    def _parse_daily(self, daily_data):
-        daily = DailyWeather()
-        daily.dt = daily_data['dt']
-        daily.day = datetime.fromtimestamp(daily_data['dt']).strftime('%A')
-        daily.day_of_month = datetime.fromtimestamp(daily_data['dt']).strftime('%d')
-        daily.month = datetime.fromtimestamp(daily_data['dt']).strftime('%B')
-        daily.sunrise = format_clocktime(daily_data['sunrise'])
-        daily.sunset = format_clocktime(daily_data['sunset'])
-        daily.moonrise = format_clocktime(daily_data['moonrise'])
-        daily.moonset = format_clocktime(daily_data['moonset'])
-        daily.moon_phase = daily_data['moon_phase']
-        daily.summary = daily_data['summary']
-        daily.temp = self._parse_temp(daily_data['temp'])
-        daily.feels_like = self._parse_feels_like(daily_data['feels_like'])
-        daily.pressure = f"{daily_data['pressure']} hPa"
-        daily.humidity = f"{daily_data['humidity']:.0f}%"
-        daily.raw_humidity = daily_data['humidity']
-        daily.dew_point = format_temp(daily_data['dew_point'])
-        daily.wind_speed = daily_data['wind_speed']
-        daily.wind_deg = daily_data['wind_deg']
-        daily.wind_dir = get_compass_direction(daily_data['wind_deg'])
-        daily.wind_description = f"{daily.wind_speed}mph {daily.wind_dir}"
-        daily.wind_gust = daily_data['wind_gust']
-        daily.weather = self._parse_weather(daily_data['weather'])
-        daily.clouds = f"{daily_data['clouds']:.0f}%"
-        daily.pop = f"{daily_data['pop']:.0%}"
-        daily.pop_raw = daily_data['pop']
-        daily.uvi = daily_data['uvi']
-        return daily
-
-    def _parse_hourly(self, hourly_data):
-        hourly = HourlyWeather()
-        hourly.dt = format_clocktime(hourly_data['dt'])
-        hourly.temp_raw = hourly_data['temp']
-        hourly.temp = format_temp(hourly_data['temp'])
-        hourly.feels_like = format_temp(hourly_data['feels_like'])
-        hourly.pressure = f"{hourly_data['pressure']} hPa"
-        hourly.pressure_raw = hourly_data['pressure']
-        hourly.humidity = f"{hourly_data['humidity']:.0f}%"
-        hourly.humidity_raw = int(hourly_data['humidity'])
-        hourly.dew_point = hourly_data['dew_point']
-        hourly.uvi = hourly_data['uvi']
-        hourly.clouds = f"{hourly_data['clouds']:.0f}%"
-        hourly.visibility = f"{hourly_data['visibility']/100:.0f}%"
-        hourly.wind_speed = hourly_data['wind_speed']
-        hourly.wind_deg = hourly_data['wind_deg']
-        hourly.wind_dir = get_compass_direction(hourly_data['wind_deg'])
-        hourly.wind_description = f"{hourly.wind_speed}mph {hourly.wind_dir}"
-        hourly.wind_gust = hourly_data['wind_gust']
-        hourly.pop = f"{hourly_data['pop']:.0%}"
-        hourly.pop_raw = int(hourly_data['pop'])
-        hourly.weather = self._parse_weather(hourly_data['weather'])
-        return hourly
-
-    def _parse_temp(self, temp_data):
-        temp = Temperature()
-        temp.day_raw = int(temp_data['day'])
-        temp.day = format_temp(temp_data['day'])
-        temp.min = format_temp(temp_data['min'])
-        temp.max = format_temp(temp_data['max'])
-        temp.night = format_temp(temp_data['night'])
-        temp.eve = format_temp(temp_data['eve'])
-        temp.morn = format_temp(temp_data['morn'])
-        return temp
-
-    def _parse_feels_like(self, feels_like_data):
-        feels_like = FeelsLike()
-        feels_like.day_raw = int(feels_like_data['day'])
-        feels_like.day = format_temp(feels_like_data['day'])
-        feels_like.night = format_temp(feels_like_data['night'])
-        feels_like.eve = format_temp(feels_like_data['eve'])
-        feels_like.morn = format_temp(feels_like_data['morn'])
-        return feels_like
-
-    def _parse_weather(self, weather_data):
-        weather_class = Weather()
-        weather_class.id = weather_data[0]['id']
-        weather_class.main = weather_data[0]['main']
-        weather_class.description = weather_data[0]['description']
-        weather_class.icon = weather_data[0]['icon']
-        return weather_class
+        self.lat = json_response.get('lat')
+        self.lon = json_response.get('lon')
+        self.timezone = json_response.get('timezone', '')
+        self.timezone_offset = json_response.get('timezone_offset') or 0
+        self.clock = CityClock(self.timezone_offset)
+        self.current = parse_current(json_response.get('current'))
+        self.daily = [parse_daily(daily) for daily in json_response.get('daily') or ()]
+        self.hourly = [parse_hourly(hourly) for hourly in json_response.get('hourly') or ()]
+        self.alerts = parse_alerts(json_response.get('alerts'), self.clock)
+        self.minutely = parse_minutely(json_response.get('minutely'))
+        for day in self.daily:
+            self.clock.label_day(day)
+        for hour in self.hourly:
+            self.clock.label_hour(hour)
+
+class Nowcast:
+    """ Custom object to store the minutely precipitation forecast for the next hour
+
+    The series is only ever used as a whole, so it is kept as one float32 array (mm/h, a
+    value a minute) rather than an object per minute.
+    """
+    def __init__(self, start=None, precipitation=None):
+        self.start = start
+        self.precipitation = precipitation
 
 class CurrentWeather:
-    """ Custom object to store the current weather data """
+    """ Custom object to store the current weather data (temperatures in K, speeds in m/s) """
     def __init__(self):
         self.dt = None
         self.sunrise = None
         self.sunset = None
         self.temp = None
-        self.temp_raw = None
         self.feels_like = None
-        self.feels_like_raw = None
         self.pressure = None
         self.humidity = None
         self.humidity_raw = None
@@ -270,16 +284,16 @@ class CurrentWeather:
         self.wind_speed = None
         self.wind_deg = None
         self.wind_dir = None
-        self.wind_description = None
         self.weather = None
 
 class DailyWeather:
-    """ Custom object to store the daily weather data """
+    """ Custom object to store the daily weather data (temperatures in K, speeds in m/s) """
     def __init__(self):
         self.dt = None
         self.day = None
         self.day_of_month = None
         self.month = None
+        self.label = None
         self.sunrise = None
         self.sunset = None
         self.moonrise = None
@@ -296,7 +310,6 @@ class DailyWeather:
         self.wind_deg = None
         self.wind_dir = None
         self.wind_gust = None
-        self.wind_description = None
         self.weather = None
         self.clouds = None
         self.pop = None
@@ -304,13 +317,12 @@ class DailyWeather:
         self.uvi = None
 
 class HourlyWeather:
-    """ Custom object to store the hourly weather data"""
+    """ Custom object to store the hourly weather data (temperatures in K, speeds in m/s) """
     def __init__(self):
         self.dt = None
+        self.time = None
         self.temp = None
-        self.temp_raw = None
         self.feels_like = None
-        self.feels_like_raw = None
         self.pressure = None
         self.pressure_raw = None
         self.humidity = None
@@ -322,16 +334,14 @@ class HourlyWeather:
         self.wind_speed = None
         self.wind_deg = None
         self.wind_dir = None
-        self.wind_description = None
         self.wind_gust = None
         self.pop = None
         self.pop_raw = None
         self.weather = None
 
 class Temperature:
-    """ Custom object to store the temperature data """
+    """ Custom object to store the temperature data, in kelvin """
     def __init__(self):
-        self.day_raw = None
         self.day = None
         self.min = None
         self.max = None
@@ -340,9 +350,8 @@ class Temperature:
         self.morn = None
 
 class FeelsLike:
-    """ Custom object to store the feels_like data """
+    """ Custom object to store the feels_like data, in kelvin """
     def __init__(self):
-        self.day_raw = None
         self.day = None
         self.night = None
         self.eve = None
@@ -354,4 +363,182 @@ class Weather:
         self.id = None
         self.main = None
         self.description = None
-        self.icon = None
\ No newline at end of file
+        self.icon = None
+
+class Alert:
+    """ Custom object to store one weather alert issued for the location """
+    def __init__(self):
+        self.sender_name = None
+        self.event = None
+        self.start = None
+        self.end = None
+        self.end_time = None
+        self.description = None
+        self.tags = None
+
+    def key(self):
+        """ Identify the alert across polls, which return it again until it ends """
+        return self.sender_name, self.event, self.start
+
+### SCHEMAS
+
+def format_pressure(pressure):
+    """ Format pressure in hPa """
+    return f"{pressure} hPa"
+
+def format_percent(value):
+    """ Format a 0-100 value as a whole percentage """
+    return f"{value:.0f}%"
+
+def format_fraction(value):
+    """ Format a 0-1 value as a whole percentage """
+    return f"{value:.0%}"
+
+def format_visibility(metres):
+    """ Format visibility as a percentage of the 10km maximum """
+    return f"{metres/100:.0f}%"
+
+WEATHER_SCHEMA = [
+    Field('id'),
+    Field('main', default=''),
+    Field('description', default=''),
+    Field('icon', default='unknown'),
+]
+parse_weather = build_parser(Weather, WEATHER_SCHEMA, 'parse_weather')
+
+def parse_first_weather(weather_list):
+    """ Parse the first (primary) condition of a 'weather' array, or defaults if it is empty """
+    return parse_weather(weather_list[0] if weather_list else None)
+
+TEMPERATURE_SCHEMA = [
+    Field('day'),
+    Field('min'),
+    Field('max'),
+    Field('night'),
+    Field('eve'),
+    Field('morn'),
+]
+parse_temperature = build_parser(Temperature, TEMPERATURE_SCHEMA, 'parse_temperature')
+
+FEELS_LIKE_SCHEMA = [
+    Field('day'),
+    Field('night'),
+    Field('eve'),
+    Field('morn'),
+]
+parse_feels_like = build_parser(FeelsLike, FEELS_LIKE_SCHEMA, 'parse_feels_like')
+
+CURRENT_SCHEMA = [
+    Field('dt'),
+    Field('sunrise'),
+    Field('sunset'),
+    Field('temp'),
+    Field('feels_like'),
+    Field('pressure', converter=format_pressure),
+    Field('humidity', converter=format_percent),
+    Field('humidity_raw', 'humidity'),
+    Field('dew_point'),
+    Field('uvi'),
+    Field('clouds', converter=format_percent),
+    Field('visibility', converter=format_visibility),
+    Field('wind_speed'),
+    Field('wind_deg'),
+    Field('wind_dir', 'wind_deg', get_compass_direction, default=''),
+    Field('weather', converter=parse_first_weather, convert_missing=True),
+]
+parse_current = build_parser(CurrentWeather, CURRENT_SCHEMA, 'parse_current')
+
+DAILY_SCHEMA = [
+    # day, day_of_month, month, label and the clock times are set by CityClock.label_day
+    Field('dt'),
+    Field('sunrise'),
+    Field('sunset'),
+    Field('moonrise'),
+    Field('moonset'),
+    Field('moon_phase'),
+    Field('summary', default=''),
+    Field('temp', converter=parse_temperature, convert_missing=True),
+    Field('feels_like', converter=parse_feels_like, convert_missing=True),
+    Field('pressure', converter=format_pressure),
+    Field('humidity', converter=format_percent),
+    Field('raw_humidity', 'humidity'),
+    Field('dew_point'),
+    Field('wind_speed'),
+    Field('wind_deg'),
+    Field('wind_dir', 'wind_deg', get_compass_direction, default=''),
+    Field('wind_gust'),
+    Field('weather', converter=parse_first_weather, convert_missing=True),
+    Field('clouds', converter=format_percent),
+    Field('pop', converter=format_fraction, default='0%'),
+    Field('pop_raw', 'pop', default=0),
+    Field('uvi'),
+]
+parse_daily = build_parser(DailyWeather, DAILY_SCHEMA, 'parse_daily')
+
+HOURLY_SCHEMA = [
+    # time is set by CityClock.label_hour
+    Field('dt'),
+    Field('temp'),
+    Field('feels_like'),
+    Field('pressure', converter=format_pressure),
+    Field('pressure_raw', 'pressure'),
+    Field('humidity', converter=format_percent),
+    Field('humidity_raw', 'humidity', int),
+    Field('dew_point'),
+    Field('uvi'),
+    Field('clouds', converter=format_percent),
+    Field('visibility', converter=format_visibility),
+    Field('wind_speed'),
+    Field('wind_deg'),
+    Field('wind_dir', 'wind_deg', get_compass_direction, default=''),
+    Field('wind_gust'),
+    Field('pop', converter=format_fraction, default='0%'),
+    Field('pop_raw', 'pop', default=0),
+    Field('weather', converter=parse_first_weather, convert_missing=True),
+]
+parse_hourly = build_parser(HourlyWeather, HOURLY_SCHEMA, 'parse_hourly')
+
+ALERT_SCHEMA = [
+    Field('sender_name', default=''),
+    Field('event', default=''),
+    Field('start'),
+    Field('end'),
+    Field('description', default=''),
+    Field('tags', converter=tuple, default=()),
+]
+parse_alert = build_parser(Alert, ALERT_SCHEMA, 'parse_alert')
+
+def parse_alerts(alert_list, clock):
+    """ Parse an 'alerts' array, which OpenWeather omits entirely when there are none
+
+    Args:
+        alert_list (list): The 'alerts' array, or None.
+        clock (CityClock): The city's clock, for the end times.
+    """
+    alerts = [parse_alert(alert) for alert in alert_list or ()]
+    for alert in alerts:
+        clock.label_alert(alert)
+    return alerts
+
+def parse_minutely(minute_list):
+    """ Parse a 'minutely' array into a Nowcast
+
+    Returns:
+        Nowcast: The nowcast, or None if the response has no minutely data (it is excluded
+                 unless the city is in nowcast mode, and not every location has it).
+    """
+    if not minute_list:
+        return None
+    precipitation = np.fromiter((minute.get('precipitation') or 0 for minute in minute_list),
+                                dtype=np.float32, count=len(minute_list))
+    return Nowcast(minute_list[0].get('dt'), precipitation)
+
+def nowcast_wanted(weather_data, threshold, hours):
+    """ Whether a city's hourly outlook calls for the minutely nowcast: the probability of
+    precipitation reaches threshold within the next hours (a threshold of 0 turns it off) """
+    upcoming = weather_data.hourly[:hours]
+    return threshold > 0 and any(hour.pop_raw >= threshold for hour in upcoming)
+
+def alert_keys(alerts):
+    """ Return the set of keys of a list of alerts, for telling whether they changed """
+    return {alert.key() for alert in alerts}
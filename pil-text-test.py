@@ -1,5 +1,6 @@
 from inky.auto import auto                  # for working with the e-ink display
 from PIL import Image,ImageDraw,ImageFont   # for rendering via PIL
+import modules.colors as colors             # for the shared temperature colour table
 
 """ Render text to image using PIL """
 """ Urbanist-Thin.ttf,          Urbanist-ThinItalic.ttf
@@ -22,38 +23,7 @@ draw = ImageDraw.Draw(canvas)
 big_number = ImageFont.truetype("/usr/share/fonts/truetype/Urbanist-Black.ttf", 64, encoding="unic")
 mid_number = ImageFont.truetype("/usr/share/fonts/truetype/Urbanist-Bold.ttf", 21, encoding="unic")
 
-def get_color(temp):
-    if temp <= 39:
-        color = 'powderblue'
-        outline_color = 'darkturquoise'
-    elif 40 <= temp <= 49:
-        color = 'lightblue'
-        outline_color = 'darkturquoise'
-    elif 50 <= temp <= 59:
-        color = 'lightskyblue'
-        outline_color = 'darkturquoise'
-    elif 60 <= temp <= 69:
-        color = 'cornflowerblue'
-        outline_color = 'darkturquoise'
-    elif 70 <= temp <= 79:
-        color = 'goldenrod'
-        outline_color = 'black'
-    elif 80 <= temp <= 89:
-        color = 'hotpink'
-        outline_color = 'maroon'
-    elif 90 <= temp <= 99:
-        color = 'lightcoral'
-        outline_color = 'maroon'
-    elif 100 <= temp <= 109:
-        color = 'firebrick'
-        outline_color = 'maroon'
-    elif 110 <= temp:
-        color = 'floralwhite'
-        outline_color = 'firebrick'
-    else:
-        color = 'black'
-        outline_color = 'black'
-    return color, outline_color
+color_table = colors.get_table('fahrenheit')
 
 x_position = 20
 y_position = 20
@@ -63,7 +33,8 @@ for temp in temp_list:
     if temp == 80:
         y_position = 20
         x_position += (column_width * 2)
-    text_color, text_outline_color = get_color(temp)
+    entry = color_table.lookup(temp)
+    text_color, text_outline_color = entry.fill, entry.outline
 
     position = (x_position, y_position)
 
@@ -0,0 +1,66 @@
+""" Render recorded One Call responses again, e.g. to check what the panel showed, to make a
+ timelapse of a day, or to backfill the frames after a layout change
+
+    python replay-render.py archive/responses.jsonl         frames to replay/frame_000000.png...
+    python replay-render.py archive/responses.jsonl --webp day.webp
+                                                            and an animated WebP of them
+    python replay-render.py saved-responses/ --cities "New York"
+                                                            a folder of .json responses,
+                                                            in name order
+
+The input is the archiveFile the display appends to (see config.ini), or a folder of single
+responses; a response recorded without a city name is named after the nearest gazetteer city.
+"""
+import argparse                         # for the command line options
+import logging                          # for the replay log output
+import os                               # for the default number of workers
+import sys                              # for the exit status
+import types                            # for the minimal output object the modules expect
+
+import modules.replay as replay         # for streaming and rendering the recorded responses
+import modules.panels as panels         # for the panel the frames are drawn for
+
+parser = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('input', help="a JSONL archive, or a folder of .json responses")
+parser.add_argument('--output', default='replay', help="the folder to write the frames to")
+parser.add_argument('--webp', help="also assemble the frames into this animated WebP")
+parser.add_argument('--frame-ms', type=int, default=500,
+                    help="how long each frame of the WebP is shown, in milliseconds")
+parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                    help="render this many frames at once")
+parser.add_argument('--cities', nargs='+', help="the one or two cities to show, in order "
+                                                "(defaults to the cities of the first frame)")
+parser.add_argument('--panel', default=panels.DEFAULT_PROFILE.name, choices=panels.PROFILES,
+                    help="the panel to draw the frames for")
+parser.add_argument('--units', default='imperial', choices=('imperial', 'metric'))
+parser.add_argument('--color-theme', help="the temperature colour theme")
+parser.add_argument('--low-memory', action='store_true',
+                    help="draw the frames in the panel's inks, as lowMemory does")
+parser.add_argument('--verbose', action='store_true', help="log each frame's render")
+args = parser.parse_args()
+
+if args.cities and len(args.cities) > 2:
+    parser.error("--cities takes one or two cities")
+
+logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                    format='%(levelname)s: %(message)s')
+out = types.SimpleNamespace(logger=logging.getLogger('replay'))
+
+try:
+    result = replay.replay(replay.read_records(args.input), args.output, out, args.workers,
+                           args.cities, panels.get_profile(args.panel), args.units,
+                           args.color_theme, args.low_memory)
+except (OSError, ValueError) as error:
+    print(f"Cannot replay {args.input}: {error}")
+    sys.exit(1)
+
+print(f"Rendered {result.frames} frames ({result.failed} failed) to {args.output}/ "
+      f"in {result.seconds:.1f} s: {result.frames_per_second:.2f} frames per second")
+
+if args.webp and result.frames:
+    replay.write_webp(replay.frame_paths(args.output, result.frames), args.webp, args.frame_ms)
+    print(f"Wrote {result.frames} frames to {args.webp}")
+
+if result.failed:
+    sys.exit(1)
@@ -0,0 +1,51 @@
+""" Render the fixture cases in snapshots/ headlessly and compare them to the golden images
+
+    python snapshot-test.py            compare every case, exit 1 on any failure
+    python snapshot-test.py --update   re-record the goldens after an intended layout change
+"""
+import argparse                         # for the command line options
+import json                             # for writing the timing report
+import logging                          # for the harness log output
+import sys                              # for the exit status
+import types                            # for the minimal output object the modules expect
+
+import modules.snapshot as snapshot     # for rendering and diffing the fixture cases
+
+parser = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--update', action='store_true', help="re-record the golden images")
+parser.add_argument('--tolerance', type=float, default=0.002,
+                    help="largest allowed fraction of changed pixels")
+parser.add_argument('--perceptual-tolerance', type=float, default=0.05,
+                    help="largest allowed blurred luminance error (0-1)")
+parser.add_argument('--workers', type=int, default=1,
+                    help="render each frame on this many processes")
+parser.add_argument('--timings', help="write the per-case render timings to this JSON file")
+parser.add_argument('cases', nargs='*', help="only run these cases")
+args = parser.parse_args()
+
+logging.basicConfig(level=logging.WARNING, format='%(levelname)s: %(message)s')
+out = types.SimpleNamespace(logger=logging.getLogger('snapshot'))
+
+results = snapshot.run_cases(out, args.update, args.tolerance, args.perceptual_tolerance,
+                             args.cases, args.workers)
+
+for result in results:
+    line = f"{result.name:<24} {result.status:<8} {result.render_seconds * 1000:8.1f} ms"
+    if result.diff:
+        line += (f"   changed {result.diff.changed_fraction:.4%}"
+                 f"   perceptual {result.diff.perceptual:.4f}"
+                 f"   max delta {result.diff.max_delta}")
+    print(line)
+
+if args.timings:
+    with open(args.timings, 'w', encoding='utf-8') as file:
+        json.dump({result.name: result.render_seconds for result in results}, file, indent=4)
+
+if any(result.status == 'failed' for result in results):
+    print("Snapshot check failed; see snapshots/failures/ "
+          "(run with --update to accept new goldens)")
+if any(result.status == 'missing' for result in results):
+    print("Some cases have no golden image in snapshots/golden/; record them with --update")
+if any(result.status in ('failed', 'missing') for result in results):
+    sys.exit(1)
@@ -9,54 +9,530 @@ for Raspberry Pi and Pimoroni Inky Impression 7.3" e-ink display
 import time                     # for getting the current time
 from datetime import datetime   # for converting the time to human-readable format
 import os                       # for changing the working directory
+import sys                      # for the exit status
+import argparse                 # for the --daemon option
+import traceback                # for logging failed cycles
+import asyncio                  # for running the stages of the pipeline concurrently
+import threading                # for the lock that keeps panel refreshes in turn
+import signal                   # for stopping the daemon cleanly on SIGTERM
 
 ### Custom Modules
 import modules.initialization as init  # handles configuration and logging
 import modules.weather as weather      # handles querying the OpenWeather API
 import modules.render as img           # handles rendering HTML to image
+import modules.metrics as metrics      # handles the failure counters
+import modules.watchdog as watchdog    # handles cycle deadlines and restarts
+import modules.display as display      # handles sending frames to the panel
+import modules.panels as panels        # handles the panel profiles
+
+# Held for the whole of a panel refresh: the SPI bus takes one refresh at a time
+PANEL_LOCK = threading.Lock()
+
+### Functions
+
+def parse_city(city, city_data, out):
+    """ Parse a One Call response for a city, returning None (logged and counted) on failure """
+    try:
+        with metrics.timer('parse'):
+            weather_data = weather.WeatherData(city_data)
+        weather.log_data(weather_data, out)
+    except Exception:
+        out.logger.error("Error parsing weather data for %s", city.name)
+        out.logger.error(traceback.format_exc())
+        metrics.increment('parse_failures', city=city.name)
+        return None
+    return weather_data
+
+def fetch_city(city, config, out, nowcast=False, cycle_time=None):
+    """ Query the OpenWeather API for one configured city and parse the response
+
+    Args:
+        nowcast (bool, optional): Include the minutely nowcast in the call.
+        cycle_time (float, optional): When the cycle started, for the archive. Defaults to now.
+
+    Returns:
+        WeatherData: The parsed data, or None if the call or the parsing failed.
+    """
+    out.logger.info("Getting %sweather data for %s", "nowcast " if nowcast else "", city.name)
+    exclude = weather.WITH_MINUTELY if nowcast else "minutely"
+    with metrics.timer('fetch'):
+        city_data = weather.get_data(config.api_key, city.lat, city.lon, out, exclude)
+    if city_data is None:
+        return None
+    weather_data = parse_city(city, city_data, out)
+    if weather_data is not None:
+        weather.save_response(city_data, city.lat, city.lon, out)
+        if config.archive_file:
+            sharing = [other.name for other in config.cities
+                       if (other.lat, other.lon) == (city.lat, city.lon)]
+            weather.archive_response(city_data, sharing, [other.name for other in config.cities],
+                                     cycle_time or time.time(), config.archive_file, out)
+    return weather_data
+
+def fallback_city(city, cache, out):
+    """ Find the newest usable data for a city whose fetch failed: the in-memory cache
+    first, then the last good response on disk. Returns None if there is neither. """
+    key = (city.lat, city.lon)
+    if key in cache and cache[key][0]:
+        out.logger.warning("Showing weather data for %s from %s", city.name,
+                           datetime.fromtimestamp(cache[key][0]).strftime('%Y-%m-%d %H:%M'))
+        metrics.increment('city_fallbacks', city=city.name, source='memory')
+        return cache[key]
+
+    if key in cache:
+        # Loaded from disk already, see disk_cache
+        weather_data = cache[key][1]
+    else:
+        city_data = weather.load_response(city.lat, city.lon, out)
+        weather_data = parse_city(city, city_data, out) if city_data else None
+    if weather_data is None:
+        metrics.increment('city_fallbacks', city=city.name, source='placeholder')
+        return None
+    out.logger.warning("Showing cached weather data for %s", city.name)
+    metrics.increment('city_fallbacks', city=city.name, source='disk')
+    # A fetch time of 0 keeps the city due, so the next cycle tries the API again
+    return 0, weather_data
+
+def disk_cache(config, out):
+    """ Start a one-shot run's cache from the last good responses on disk, so that a city
+    whose last outlook crossed nowcastThreshold is fetched with the nowcast, as in daemon
+    mode; a fetch time of 0 keeps every city due. A response older than nowcastHours says
+    nothing about the coming hours, so it is left out. """
+    cache = {}
+    if not config.nowcast_threshold:
+        return cache
+    for city in config.cities:
+        key = (city.lat, city.lon)
+        path = weather.cache_path(city.lat, city.lon)
+        if (key in cache or not os.path.exists(path)
+                or time.time() - os.path.getmtime(path) >= config.nowcast_hours * 3600):
+            continue
+        city_data = weather.load_response(city.lat, city.lon, out)
+        weather_data = parse_city(city, city_data, out) if city_data else None
+        if weather_data is not None:
+            cache[key] = (0, weather_data)
+    return cache
+
+def record_city(city_name, weather_data):
+    """ Publish the latest observed conditions for a city as gauges, in the model's SI units """
+    current = weather_data.current
+    metrics.set_gauge('observation_timestamp_seconds', current.dt, city=city_name)
+    metrics.set_gauge('temperature_kelvin', current.temp, city=city_name)
+    metrics.set_gauge('feels_like_kelvin', current.feels_like, city=city_name)
+    metrics.set_gauge('dew_point_kelvin', current.dew_point, city=city_name)
+    metrics.set_gauge('humidity_percent', current.humidity_raw, city=city_name)
+    metrics.set_gauge('uv_index', current.uvi, city=city_name)
+    metrics.set_gauge('wind_speed_meters_per_second', current.wind_speed, city=city_name)
+    metrics.set_gauge('wind_direction_degrees', current.wind_deg, city=city_name)
+
+def in_nowcast(city, config, cache):
+    """ Whether a city is in nowcast mode: its latest data shows precipitation is likely soon """
+    key = (city.lat, city.lon)
+    return key in cache and weather.nowcast_wanted(cache[key][1], config.nowcast_threshold,
+                                                   config.nowcast_hours)
+
+def cycle_seconds(config, cache):
+    """ The time between cycles: nowcastMinutes while any city is in nowcast mode """
+    if any(in_nowcast(city, config, cache) for city in config.cities):
+        return config.nowcast_minutes * 60
+    return config.refresh_minutes * 60
+
+def log_memory(out):
+    """ Log the peak memory of each stage so far: the process's peak resident memory when
+    the stage ended, and the peak Python heap during it when traceMemory is on """
+    mebibyte = 1024 * 1024
+    stages = []
+    for stage, (resident, traced) in metrics.stage_memory().items():
+        traced_text = f" (heap {traced / mebibyte:.1f})" if traced is not None else ""
+        stages.append(f"{stage} {resident / mebibyte:.1f}{traced_text}")
+    if stages:
+        out.logger.info("Peak memory by stage (MiB): %s", ", ".join(stages))
+
+def panel_sink(config):
+    """ Return the sink for the configured panel (detected on first use when set to auto), or
+    for the shared frame buffer of display-driver.py when driverProcess is on """
+    if config.driver_process:
+        return display.SharedFrameSink()
+    return display.InkySink(panels.get_profile(config.panel))
+
+def refresh_panel(frame, out, sink):
+    """ Send a frame to the panel, one refresh at a time: a refresh whose stage was abandoned
+    keeps the SPI bus until it finishes, and the next one waits for it """
+    with PANEL_LOCK:
+        return img.show_frame(frame, out, sink)
+
+def start_metrics(config, out, server=None):
+    """ (Re)start the metrics endpoint on the configured port and address, stopping the
+    running one first
+
+    Returns:
+        ThreadingHTTPServer: The server, or None if metricsPort is 0 or the port cannot be
+                             bound (logged); the display carries on without the endpoint.
+    """
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+    if not config.metrics_port:
+        return None
+    try:
+        server = metrics.serve(config.metrics_port, config.metrics_address)
+    except OSError as error:
+        out.logger.error("Cannot serve metrics on %s:%s: %s", config.metrics_address,
+                         config.metrics_port, error)
+        return None
+    out.logger.info("Serving metrics on http://%s:%s/metrics",
+                    config.metrics_address, config.metrics_port)
+    return server
+
+def fetch_alerts(city, config, out):
+    """ Poll one city's alerts with the cheap alerts-only call, returning the response """
+    with metrics.timer('alert_fetch'):
+        return weather.get_data(config.api_key, city.lat, city.lon, out,
+                                exclude=weather.ALERTS_ONLY)
+
+async def fetch_cities(config, out, cache, start_time):
+    """ Fetch every city that is due, all at once, and serve the others from the cache
+
+    Each fetch (the API call and the parsing) is a stage on a thread of its own, so the
+    calls for all cities are in flight together, alongside any panel refresh in progress.
+    A city whose fetch fails or misses its deadline falls back to its last good data.
+
+    A city in nowcast mode is due every nowcastMinutes rather than every refreshMinutes,
+    and is fetched with the minutely nowcast; it drops back to the cheap hourly payload
+    once its outlook no longer crosses nowcastThreshold.
+
+    Returns:
+        list: (city name, WeatherData or None) for each configured city, in order.
+    """
+    due = {}
+    nowcast = {}
+    for city in config.cities:
+        key = (city.lat, city.lon)
+        if key in due:
+            continue
+        nowcast[key] = in_nowcast(city, config, cache)
+        minutes = config.nowcast_minutes if nowcast[key] else config.refresh_minutes
+        # Allow a little slack, so a city fetched on the previous scheduled cycle is due again
+        max_age = minutes * 60 - config.config_poll_seconds
+        if key not in cache or start_time - cache[key][0] >= max_age:
+            metrics.increment('cache_misses', cache='weather')
+            due[key] = city
+        else:
+            metrics.increment('cache_hits', cache='weather')
+            out.logger.info("Using weather data for %s fetched at %s", city.name,
+                            datetime.fromtimestamp(cache[key][0]).strftime('%H:%M:%S'))
+
+    results = await asyncio.gather(*(
+        watchdog.run_stage('fetch', config.cycle_deadline_seconds, fetch_city, city, config, out,
+                           nowcast[key], start_time)
+        for key, city in due.items()), return_exceptions=True)
+
+    for (key, city), weather_data in zip(due.items(), results):
+        if isinstance(weather_data, watchdog.StageTimeout):
+            out.logger.error("%s for %s", weather_data, city.name)
+            weather_data = None
+        elif isinstance(weather_data, BaseException):
+            out.logger.error("Error fetching weather data for %s", city.name)
+            out.logger.error("".join(traceback.format_exception(weather_data)))
+            weather_data = None
+
+        if weather_data is not None:
+            cache[key] = (start_time, weather_data)
+        else:
+            fallback = fallback_city(city, cache, out)
+            if fallback is not None:
+                cache[key] = fallback
+
+        active = in_nowcast(city, config, cache)
+        if active != nowcast[key]:
+            out.logger.info("Nowcast mode %s for %s", "on" if active else "off", city.name)
+        metrics.set_gauge('nowcast_active', int(active), city=city.name)
+
+    weather_list = []
+    for city in config.cities:
+        key = (city.lat, city.lon)
+        weather_list.append((city.name, cache[key][1] if key in cache else None))
+        if key in cache:
+            record_city(city.name, cache[key][1])
+    return weather_list
+
+async def run_cycle(config, out, cache, sink):
+    """ Fetch the weather for every city that is due, then render and display one frame
+
+    Every stage (each city's fetch and parse, the render and the panel refresh) runs on a
+    worker thread under cycleDeadlineSeconds, so the event loop stays free: a new cycle can
+    fetch and render while the previous frame is still refreshing, and only its own refresh
+    waits for the panel.
+
+    Args:
+        config (Config): The current configuration.
+        out: The output object.
+        cache (dict): Maps (lat, lon) to (fetch time, WeatherData). Cities fetched less
+                      than refreshMinutes ago are served from it.
+        sink: Where the frame is sent.
+
+    Raises:
+        StageTimeout: If the render or the refresh is stuck past cycleDeadlineSeconds.
+    """
+    start_time = time.time()
+    start_datetime = datetime.fromtimestamp(start_time)
+    formatted_start_time = start_datetime.strftime('%Y-%m-%d %H:%M:%S')
+
+    out.logger.info("Starting weatherDisplay.py at %s", formatted_start_time)
+    out.logger.debug(config)
+
+    ## Get weather data
+    weather_list = await fetch_cities(config, out, cache, start_time)
+
+    city_one_name, weather_one = weather_list[0]
+    city_two_name, weather_two = weather_list[1] if config.mode == "dual" else (None, None)
+
+    frame = await watchdog.run_stage('render', config.cycle_deadline_seconds, img.render_frame,
+                                     city_one_name, weather_one, out, city_two_name,
+                                     weather_two, config.color_theme, config.units, sink, None,
+                                     config.render_workers, config.low_memory)
+    if frame is None or not await watchdog.run_stage(
+            'refresh', config.cycle_deadline_seconds, refresh_panel, frame, out, sink):
+        out.logger.error("The display was not updated; it still shows the previous frame")
+
+    metrics.record_memory()
+    log_memory(out)
+
+    end_time = time.time()
+    duration = end_time - start_time
+    formatted_duration = f"{duration:.2f}"
+
+    out.logger.info("Ending weatherDisplay.py at %s", end_time)
+    out.logger.info("Duration: %s seconds", formatted_duration)
+    out.logger.info("=======================")
+
+async def check_alerts(config, out, cache):
+    """ Poll the alerts of every city with cached data, all at once
+
+    Changed alerts are stored on the cached WeatherData, so the next full render keeps them.
+
+    Returns:
+        bool: True if any city's alerts changed.
+    """
+    cities = [city for city in config.cities if (city.lat, city.lon) in cache]
+    responses = await asyncio.gather(*(
+        watchdog.run_stage('alert_fetch', config.cycle_deadline_seconds, fetch_alerts, city,
+                           config, out)
+        for city in cities), return_exceptions=True)
+
+    changed = False
+    for city, city_data in zip(cities, responses):
+        if isinstance(city_data, BaseException):
+            out.logger.error("Error polling the alerts for %s: %s", city.name, city_data)
+            continue
+        if city_data is None:
+            continue
+        weather_data = cache[(city.lat, city.lon)][1]
+        alerts = weather.parse_alerts(city_data.get('alerts'), weather_data.clock)
+        if weather.alert_keys(alerts) != weather.alert_keys(weather_data.alerts):
+            out.logger.warning("Alerts changed for %s: %s", city.name,
+                               ", ".join(alert.event for alert in alerts) or "none")
+            metrics.increment('alert_changes', city=city.name)
+            weather_data.alerts = alerts
+            changed = True
+    return changed
+
+async def alert_cycle(config, out, cache, sink):
+    """ Poll for alerts and show new ones straight away through the alert band fast path
+
+    Returns:
+        bool: True if a full cycle is needed instead: alerts have cleared (the header has to
+              be drawn again), or there is no frame yet to draw the band over.
+
+    Raises:
+        StageTimeout: If the refresh is stuck past cycleDeadlineSeconds.
+    """
+    if not await check_alerts(config, out, cache):
+        return False
+    cities = [(city.name, cache.get((city.lat, city.lon), (0, None))[1])
+              for city in config.cities]
+    alerts = img.city_alerts(*cities)
+    if not alerts:
+        return True
+    frame = await watchdog.run_stage('alert_render', config.cycle_deadline_seconds,
+                                     img.alert_frame, alerts, out)
+    return frame is None or not await watchdog.run_stage(
+        'refresh', config.cycle_deadline_seconds, refresh_panel, frame, out, sink)
+
+def restart(error, out):
+    """ Log a stuck stage and restart the process, the only way to recover the SPI device """
+    out.logger.critical("%s", error)
+    img.shutdown_pool()
+    watchdog.restart_process(out)
+
+def cycle_done(task, out):
+    """ Done callback of a daemon cycle: log a failed cycle, and restart on a stuck stage """
+    if task.cancelled():
+        return
+    error = task.exception()
+    if isinstance(error, watchdog.StageTimeout):
+        restart(error, out)
+    elif error is not None:
+        out.logger.critical("Cycle failed")
+        out.logger.critical("".join(traceback.format_exception(error)))
+        metrics.increment('cycle_failures')
+    metrics.save()
+
+async def run_once(config, out):
+    """ Run a single cycle, as from cron
+
+    Returns:
+        bool: False if the cycle raised; the exception is logged and counted.
+
+    Raises:
+        StageTimeout: If the render or the refresh is stuck past cycleDeadlineSeconds.
+    """
+    try:
+        await run_cycle(config, out, disk_cache(config, out), panel_sink(config))
+        return True
+    except watchdog.StageTimeout as error:
+        out.logger.critical("%s", error)
+        raise
+    except Exception:
+        out.logger.critical("Cycle failed")
+        out.logger.critical(traceback.format_exc())
+        metrics.increment('cycle_failures')
+        return False
+    finally:
+        metrics.save()
+
+async def run_daemon(config, out):
+    """ Render every refreshMinutes (every nowcastMinutes while a city is in nowcast mode),
+    reloading config.ini whenever it changes
+
+    Only the subsystems affected by a config edit are invalidated: new cities are fetched
+    (cities that are unchanged keep their cached data), a layout change drops the render
+    caches, a log level or rotation change is applied to the running loggers, and a
+    metricsPort or metricsAddress change restarts the metrics endpoint. City and layout
+    changes redraw the panel straight away instead of waiting for the next cycle; a cycle
+    still fetching or rendering the old settings is cancelled.
+
+    Between cycles, the alerts are polled every alertPollMinutes, and a new alert is shown
+    straight away by redrawing only the alert band.
+
+    Each cycle is a task, so the event loop keeps polling config.ini while it runs, and the
+    next cycle can start while the panel is still refreshing. A stuck stage restarts the
+    process; SIGTERM cancels the cycle in flight and stops the daemon.
+    """
+    watcher = init.ConfigWatcher(config, out)
+    cache = {}
+    sink = panel_sink(config)
+
+    server = start_metrics(config, out)
+
+    def forget_removed_cities(new_config):
+        configured = {(city.lat, city.lon) for city in new_config.cities}
+        for key in list(cache):
+            if key not in configured:
+                del cache[key]
+        if new_config.api_key != config.api_key:
+            cache.clear()
+
+    def change_layout(new_config):
+        nonlocal sink
+        img.invalidate_layout()
+        if (new_config.panel != config.panel
+                or new_config.driver_process != config.driver_process):
+            sink = panel_sink(new_config)
+
+    def restart_metrics(new_config):
+        nonlocal server
+        server = start_metrics(new_config, out, server)
+
+    watcher.on_change('fetch', forget_removed_cities)
+    watcher.on_change('metrics', restart_metrics)
+    watcher.on_change('layout', change_layout)
+    def change_logging(new_config):
+        out.set_level(new_config.log_level)
+        out.set_rotation(new_config.log_max_bytes, new_config.log_backup_count,
+                         new_config.log_rotate_when)
+        metrics.trace_memory(new_config.trace_memory)
+
+    watcher.on_change('logging', change_logging)
+
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+
+    cycle = None
+    try:
+        while True:
+            config = watcher.config
+            if cycle is not None and not cycle.done():
+                out.logger.warning("Cancelling the previous cycle, which is still running")
+                cycle.cancel()
+            cycle = asyncio.create_task(run_cycle(config, out, cache, sink))
+            cycle.add_done_callback(lambda task: cycle_done(task, out))
+
+            cycle_start = time.time()
+            next_alert_check = time.time() + config.alert_poll_minutes * 60
+            # Recomputed on every poll, since the cycle in flight may switch a city in or out
+            # of nowcast mode
+            while time.time() < cycle_start + cycle_seconds(config, cache):
+                next_cycle = cycle_start + cycle_seconds(config, cache)
+                await asyncio.sleep(max(0, min(config.config_poll_seconds,
+                                               next_cycle - time.time())))
+                if watcher.check() & {'fetch', 'layout'}:
+                    break
+                config = watcher.config
+                # The band is drawn over the last frame, so not while a cycle is replacing it
+                if (config.alert_poll_minutes and time.time() >= next_alert_check
+                        and cycle.done()):
+                    next_alert_check = time.time() + config.alert_poll_minutes * 60
+                    try:
+                        if await alert_cycle(config, out, cache, sink):
+                            break
+                    except watchdog.StageTimeout as error:
+                        restart(error, out)
+                    except Exception:
+                        out.logger.error("Alert check failed")
+                        out.logger.error(traceback.format_exc())
+                        metrics.increment('alert_check_failures')
+    finally:
+        if cycle is not None:
+            cycle.cancel()
 
 ### Main Program
 
 ## Initialize
 os.chdir("/home/pi/Open_Weather_Inky_Impression/") # Project root
 
+parser = argparse.ArgumentParser(description="OpenWeather display for the Inky Impression")
+parser.add_argument('--daemon', action='store_true',
+                    help="keep running, refreshing every refreshMinutes, instead of drawing once")
+args = parser.parse_args()
+
 init.check_dependencies()
-config = init.get_config()
-out = init.start_logging(config.log_level)
-
-start_time = time.time()
-start_datetime = datetime.fromtimestamp(start_time)
-formatted_start_time = start_datetime.strftime('%Y-%m-%d %H:%M:%S')
-
-city_one_name = config.city_one_name
-
-out.logger.info("Starting weatherDisplay.py at %s", formatted_start_time)
-out.logger.debug(config)
-
-## Get weather data
-out.logger.info("Getting weather data for %s", city_one_name)
-city_one_data = weather.get_data(config.api_key, config.city_one_lat, config.city_one_lon, out)
-weather_one = weather.WeatherData(city_one_data)
-weather.log_data(weather_one, out)
-
-weather_two = None
-if config.mode == "dual":
-    out.logger.info("Getting weather data for %s", config.city_two_name)
-    city_two_name = config.city_two_name
-    city_two_data = weather.get_data(
-        config.api_key,
-        config.city_two_lat,
-        config.city_two_lon,
-        out)
-    weather_two = weather.WeatherData(city_two_data)
-    weather.log_data(weather_two, out)
-
-img.render_pil(city_one_name, weather_one, out, city_two_name, weather_two)
-
-end_time = time.time()
-duration = end_time - start_time
-formatted_duration = f"{duration:.2f}"
-
-out.logger.info("Ending weatherDisplay.py at %s", end_time)
-out.logger.info("Duration: %s seconds", formatted_duration)
-out.logger.info("=======================")
+try:
+    config = init.get_config()
+except init.ConfigError as error:
+    print(f"Error in config file: {error}")
+    sys.exit(1)
+
+if config.render_workers > 1:
+    # Forked before the log listener, the metrics server or any stage thread starts
+    img.get_pool(config.render_workers)
+
+out = init.start_logging(config.log_level,
+                         config.log_max_bytes,
+                         config.log_backup_count,
+                         config.log_rotate_when)
+
+metrics.load()
+metrics.trace_memory(config.trace_memory)
+exit_code = 0
+try:
+    if args.daemon:
+        asyncio.run(run_daemon(config, out))
+    elif not asyncio.run(run_once(config, out)):
+        exit_code = 1
+except watchdog.StageTimeout:
+    exit_code = 1
+except asyncio.CancelledError:
+    out.logger.info("Stopped by SIGTERM")
+finally:
+    out.stop()
+sys.exit(exit_code)